@@ -1,6 +1,8 @@
 from chalice import Chalice, Cron
 import boto3
+import json
 import logging
+import os
 from datetime import datetime
 from botocore.exceptions import ClientError
 
@@ -8,26 +10,49 @@ app = Chalice(app_name='region-enabler')
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# One item holding the opt-in status of every region as of the previous run
+REGION_STATE_TABLE = os.environ.get('REGION_STATE_TABLE', 'cloudping_region_enabler_state')
+STATE_KEY = 'account_regions'
+# Deploys the ping function to the given regions, see ping-function-deployer
+DEPLOYER_FUNCTION = os.environ.get('DEPLOYER_FUNCTION', 'ping-function-deployer-prod-deploy_regions')
+ENABLED_STATUSES = ['ENABLED', 'ENABLED_BY_DEFAULT']
+
 def get_account_id():
     """Get the current AWS account ID."""
     sts = boto3.client('sts')
     return sts.get_caller_identity()['Account']
 
-def get_all_regions():
-    """Get a list of all AWS regions."""
-    ec2 = boto3.client('ec2')
-    regions = [region['RegionName'] for region in ec2.describe_regions(AllRegions=True)['Regions']]
-    return regions
+def load_region_state():
+    """
+    Get the region opt-in statuses seen by the previous run.
+
+    Returns:
+        dict: {region_name: status}, None if the state was never stored
+    """
+    table = boto3.resource('dynamodb', region_name="us-east-2").Table(REGION_STATE_TABLE)
+    item = table.get_item(Key={'name': STATE_KEY}).get('Item')
+    return dict(item['regions']) if item else None
+
+def save_region_state(statuses):
+    """Store the region opt-in statuses for the next run to diff against."""
+    table = boto3.resource('dynamodb', region_name="us-east-2").Table(REGION_STATE_TABLE)
+    table.put_item(Item={
+        'name': STATE_KEY,
+        'regions': statuses,
+        'updated_at': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+    })
 
 def get_region_status():
     """
     Get the status of all regions, separating them into opt-in and default regions.
     Returns a dict with region statuses and whether they're opt-in regions.
+
+    list_regions covers every region of the partition, so this is the only
+    API call needed to detect new regions and status changes.
     """
     client = boto3.client('account')
     
     try:
-        response = client.list_regions()
         paginator = client.get_paginator('list_regions')
         page_iterator = paginator.paginate(
             RegionOptStatusContains=[
@@ -88,47 +113,112 @@ def enable_region(region_name, region_info):
             print(f"Error enabling region {region_name}: {str(e)}")
             return False
 
-@app.schedule(Cron("*", "0", "*", "*", "?", "*"))
+def start_deployment(regions):
+    """Hand newly enabled regions to the deployer without waiting for its schedule."""
+    lambda_client = boto3.client('lambda', region_name="us-east-2")
+    try:
+        lambda_client.invoke(
+            FunctionName=DEPLOYER_FUNCTION,
+            InvocationType='Event',
+            Payload=json.dumps({'regions': regions})
+        )
+        print(f"Started the ping function deployment to {', '.join(regions)}")
+        return True
+    except ClientError as e:
+        print(f"Error starting the deployment to {', '.join(regions)}: {str(e)}")
+        return False
+
+def diff_region_state(previous, current):
+    """
+    Compare the stored region statuses with the current ones.
+
+    Args:
+        previous: {region_name: status} of the previous run, None on the first run
+        current: {region_name: status} from list_regions
+
+    Returns:
+        tuple: (changed regions, regions that finished enabling since the previous run)
+    """
+    previous = previous or {}
+    changed = sorted(region for region, status in current.items() if previous.get(region) != status)
+    # Only regions seen disabled or enabling before count as newly enabled, the
+    # deployer's own schedule covers everything enabled before the first run
+    newly_enabled = [
+        region for region in changed
+        if current[region] in ENABLED_STATUSES and region in previous
+        and previous[region] not in ENABLED_STATUSES
+    ]
+    return changed, newly_enabled
+
+@app.schedule(Cron("0/15", "*", "*", "*", "?", "*"))
 def check_and_enable_regions(event):
     """
-    Scheduled task that runs daily to check for and enable new AWS regions.
+    Scheduled task that checks for new AWS regions and status changes.
+
+    Each run lists the regions once and diffs their statuses against the
+    stored state. Opt-in regions that are not enabled yet are enabled, and
+    regions that finished enabling since the previous run are handed to the
+    deployer right away. Nothing else is done while no region changes.
     """
     print(f"Starting region check at {datetime.now()}")
 
     try:
-        # Get all available regions
-        all_regions = get_all_regions()
-        print(f"Found {len(all_regions)} total regions")
-        
-        # Get status of all regions
         region_status = get_region_status()
-        print(f"Retrieved status for {len(region_status)} regions")
-        
-        # Process each region
+        if not region_status:
+            raise RuntimeError("No region status available")
+        current = {region: info['status'] for region, info in region_status.items()}
+
+        previous = load_region_state()
+        changed, newly_enabled = diff_region_state(previous, current)
+        pending = sorted(
+            region for region, info in region_status.items()
+            if info['is_opt_in'] and info['status'] not in ENABLED_STATUSES
+        )
+        if not changed and not pending:
+            print(f"No region changes ({len(current)} regions)")
+            return {
+                'statusCode': 200,
+                'body': {'message': "No region changes", 'results': []}
+            }
+        print(f"Retrieved status for {len(current)} regions, {len(changed)} changed since the previous run")
+
         results = []
-        for region in all_regions:
-            if region not in region_status:
-                print(f"No status information available for region {region}")
-                continue
-                
+        for region in pending:
             region_info = region_status[region]
-            
-            # Check if region needs to be enabled
-            if region_info['is_opt_in'] and region_info['status'] not in ['ENABLED', 'ENABLED_BY_DEFAULT', 'ENABLING']:
-                success = enable_region(region, region_info)
-                results.append({
-                    'region': region,
-                    'status': 'success' if success else 'failed',
-                    'is_opt_in': region_info['is_opt_in'],
-                    'current_status': region_info['status']
-                })
-            else:
-                print(f"Region {region} does not need action (Status: {region_info['status']}, Opt-in: {region_info['is_opt_in']})")
-        
+            if region_info['status'] == 'ENABLING':
+                # Tracked until list_regions reports it enabled
+                print(f"Region {region} is still being enabled")
+                continue
+
+            success = enable_region(region, region_info)
+            results.append({
+                'region': region,
+                'status': 'success' if success else 'failed',
+                'is_opt_in': region_info['is_opt_in'],
+                'current_status': region_info['status']
+            })
+
+        if newly_enabled:
+            deployed = start_deployment(newly_enabled)
+            results.extend({
+                'region': region,
+                'status': 'deploying' if deployed else 'failed',
+                'is_opt_in': region_status[region]['is_opt_in'],
+                'current_status': current[region]
+            } for region in newly_enabled)
+            if not deployed:
+                # Keep the previous status so the next run retries the hand-off
+                for region in newly_enabled:
+                    current[region] = previous[region]
+
+        if changed:
+            save_region_state(current)
+
         return {
             'statusCode': 200,
             'body': {
                 'message': f"Processed {len(results)} regions that needed action",
+                'changed': changed,
                 'results': results
             }
         }
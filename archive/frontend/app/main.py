@@ -56,10 +56,9 @@ def grid(show_data, timeframe):
     data = get_dynamodb_data(timeframe)
 
     for item in data:
-        item_split = item['index'].split("_")
-        region_from = item_split[0]
-        region_to = item_split[1]
-        timeframe = item_split[2]
+        region_from = item['region_from']
+        region_to = item['region_to']
+        timeframe = item['timeframe']
 
         if region_from not in return_data:
             return_data[region_from] = {}
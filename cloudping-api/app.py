@@ -1,20 +1,61 @@
 from chalice import Chalice, Response
-from chalice.app import BadRequestError
+from chalice.app import BadRequestError, NotFoundError
 from typing import Optional, Dict, List
-from botocore.exceptions import ClientError
-import boto3
+from functools import lru_cache
 from datetime import datetime, timedelta
-from boto3.dynamodb.conditions import Key, Attr
+from chalicelib.shared.result_encoding import item_samples, attempt_values, frontend_samples, LATENCY_SOURCES
+from chalicelib.shared.tiered_storage import (
+    read_pair_history, query_raw, query_runs, HOT_RETENTION_DAYS, ROLLUP_TABLE
+)
+from chalicelib.shared.run_records import RUNS_TABLE, RUNS_TABLE_ENABLED
+from chalicelib.shared.instrumentation import instrumented, span, count, capture_capacity, capacity_kwargs
+from chalicelib.shared.region_registry import get_region_registry
+from chalicelib.shared.averages_version import read_averages_version
+from chalicelib.shared.metadata import METADATA_TABLE
+from chalicelib.shared.lazy_clients import Lazy, get_client, get_resource, lazy_table
 import os
 
 app = Chalice(app_name='cloudping-api')
-dynamodb = boto3.resource('dynamodb')
-latencies_table = dynamodb.Table(os.environ.get('LATENCIES_TABLE', 'cloudping_stored_avgs'))
-ping_table = dynamodb.Table(os.environ.get('PING_TEST_TABLE', 'PingTest'))
-regions_table = dynamodb.Table('cloudping_regions')
+# boto3, NumPy and the modules built on NumPy (latency matrices, sketches,
+# placement, anomalies, profiles) are imported by the routes that use them,
+# keeping them out of the cold start (see tools/import_budget.py)
+
+def create_anomalies_table():
+    from chalicelib.shared.anomaly import ANOMALIES_TABLE
+    return get_resource('dynamodb').Table(ANOMALIES_TABLE)
+
+def create_profiles_table():
+    from chalicelib.shared.profiles import PROFILES_TABLE
+    return get_resource('dynamodb').Table(PROFILES_TABLE)
+
+@lru_cache(maxsize=None)
+def get_matrix_cache():
+    """Values derived from the stored averages, kept until they are recalculated."""
+    from chalicelib.latency_matrix import VersionedCache
+    return VersionedCache(lambda: read_averages_version(metadata_table))
+
+# Created on first use rather than at import, see shared/lazy_clients.py
+latencies_table = lazy_table(os.environ.get('LATENCIES_TABLE', 'cloudping_stored_avgs'))
+ping_table = lazy_table(os.environ.get('PING_TEST_TABLE', 'PingTest'))
+regions_table = lazy_table('cloudping_regions')
+rollups_table = lazy_table(ROLLUP_TABLE)
+# Only read with a run-level results layout, see shared/run_records.py
+runs_table = lazy_table(RUNS_TABLE) if RUNS_TABLE_ENABLED else None
+anomalies_table = Lazy(create_anomalies_table)
+profiles_table = Lazy(create_profiles_table)
+metadata_table = lazy_table(METADATA_TABLE)
 
 VALID_PERCENTILES = ['p_10', 'p_25', 'p_50', 'p_75', 'p_90', 'p_98', 'p_99', 'latency']
+# Percentiles over individual attempts rather than per-run averages, stored
+# when the averages are calculated with AGGREGATION_MODE=attempts
+ATTEMPT_PERCENTILES = ['attempt_p_10', 'attempt_p_25', 'attempt_p_50', 'attempt_p_75',
+                       'attempt_p_90', 'attempt_p_98', 'attempt_p_99']
+VALID_PERCENTILES += ATTEMPT_PERCENTILES
 VALID_TIMEFRAMES = ['1D', '1W', '1M', '1Y']
+# Connection loss metrics of the stored averages and their units
+LOSS_METRICS = {'loss_rate': 'ratio', 'availability': 'ratio', 'timeouts': 'count', 'refused': 'count'}
+# Percentiles of the per front-end attempt distributions
+FRONTEND_PERCENTILES = [50, 90, 99]
 
 def validate_params(percentile: Optional[str], timeframe: Optional[str]) -> None:
     """Validate input parameters."""
@@ -25,11 +66,15 @@ def validate_params(percentile: Optional[str], timeframe: Optional[str]) -> None
 
 def get_account_id():
     """Get the current AWS account ID."""
+    import boto3
+
     sts = boto3.client('sts')
     return sts.get_caller_identity()['Account']
 
 def get_all_regions():
     """Get a list of all AWS regions."""
+    import boto3
+
     ec2 = boto3.client('ec2')
     regions = [region['RegionName'] for region in ec2.describe_regions()['Regions']]
     return regions
@@ -39,6 +84,9 @@ def get_region_status():
     Get the status of all regions, separating them into opt-in and default regions.
     Returns a dict with region statuses and whether they're opt-in regions.
     """
+    import boto3
+    from botocore.exceptions import ClientError
+
     client = boto3.client('account')
     
     try:
@@ -62,19 +110,121 @@ def get_region_status():
         return {}
 
 def get_region_status_table():
-    dynamodb = boto3.resource('dynamodb', region_name="us-east-2")
-    regions_table_enhanced = dynamodb.Table('cloudping_regions_enhanced')
-    regions_enhanced_response = regions_table_enhanced.scan()
-    return regions_enhanced_response
+    """Get all rows of cloudping_regions_enhanced from the cached region registry."""
+    registry = get_region_registry(lambda: get_client('dynamodb', region_name="us-east-2"))
+    return {'Items': [region.to_item() for region in registry.all()]}
+
+def scan_stored_averages(timeframe: str) -> List[Dict]:
+    """Get the stored averages of all region pairs for a timeframe."""
+    from boto3.dynamodb.conditions import Attr
+
+    items = []
+    last_key = None
+
+    while True:
+        kwargs = {'FilterExpression': Attr('timeframe').eq(timeframe)}
+        if last_key:
+            kwargs['ExclusiveStartKey'] = last_key
+
+        with span('scan'):
+            response = latencies_table.scan(**kwargs, **capacity_kwargs())
+        capture_capacity(response)
+        items.extend(response.get('Items', []))
+
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+    return items
+
+def get_active_region_names() -> List[str]:
+    """Get the names of the regions currently producing data."""
+    registry = get_region_registry(lambda: get_client('dynamodb', region_name="us-east-2"))
+    return [region.name for region in registry.active()]
+
+def get_latencies_from_sketches(percentile: str, timeframe: str, from_region: Optional[str],
+                                to_region: Optional[str], start: Optional[str], end: Optional[str]) -> Response:
+    """
+    Serve /latencies for percentiles or windows that are not precomputed.
+
+    The matrix is computed by merging the daily sketches of PingTestDaily
+    over whole days. Without start/end the window is the last 1, 7, 30 or
+    365 days according to the timeframe.
+    """
+    from chalicelib import sketch_queries
+
+    if timeframe not in VALID_TIMEFRAMES:
+        raise BadRequestError(f"Invalid timeframe. Must be one of: {', '.join(VALID_TIMEFRAMES)}")
+    try:
+        percentile_value = sketch_queries.parse_percentile(percentile)
+        first_day, last_day = sketch_queries.parse_window(
+            start, end, default_days=sketch_queries.TIMEFRAME_DAYS[timeframe]
+        )
+    except ValueError as e:
+        raise BadRequestError(str(e))
+
+    regions_from = [from_region] if from_region else get_active_region_names()
+
+    with span('sketches'):
+        catalog, matrix, samples = sketch_queries.sketch_matrix(
+            rollups_table, regions_from, first_day, last_day, percentile_value,
+            regions_to=[to_region] if to_region else None
+        )
+    count('samples', samples)
+
+    result = {
+        "metadata": {
+            "percentile": sketch_queries.percentile_key(percentile_value),
+            "start": first_day,
+            "end": last_day,
+            "unit": "milliseconds"
+        },
+        "data": catalog.matrix_to_dict(matrix)
+    }
+    return Response(body=result,
+                  headers={'Content-Type': 'application/json',
+                          'Access-Control-Allow-Origin': '*'})
 
 @app.route('/latencies')
+@instrumented('api_latencies')
 def get_latencies():
-    """Get latency matrix for all or specific regions."""
+    """
+    Get latency matrix for all or specific regions.
+
+    Precomputed percentiles and timeframes are read from the stored averages.
+    Any other percentile (e.g. 'p_95') or an explicit start/end date range
+    is computed from the daily sketches instead. Pass metric (loss_rate,
+    availability, timeouts or refused) for connection loss instead of latency.
+    """
+    from boto3.dynamodb.conditions import Key, Attr
+    from chalicelib.latency_matrix import build_matrix
+
     params = app.current_request.query_params or {}
     percentile = params.get('percentile', 'p_50')
     timeframe = params.get('timeframe', '1D')
     from_region = params.get('from')
     to_region = params.get('to')
+    start = params.get('start')
+    end = params.get('end')
+    metric = params.get('metric')
+
+    if metric is not None:
+        if metric not in LOSS_METRICS:
+            raise BadRequestError(f"Invalid metric. Must be one of: {', '.join(LOSS_METRICS)}")
+        if start or end:
+            raise BadRequestError("Loss metrics are only available per timeframe")
+        percentile = None
+    elif start or end or percentile not in VALID_PERCENTILES:
+        try:
+            return get_latencies_from_sketches(percentile, timeframe, from_region, to_region, start, end)
+        except BadRequestError:
+            raise
+        except Exception as e:
+            return Response(
+                body={'error': str(e)},
+                status_code=500,
+                headers={'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'}
+            )
 
     validate_params(percentile, timeframe)
 
@@ -82,27 +232,16 @@ def get_latencies():
         # Query DynamoDB for latencies
         if from_region and to_region:
             # Query for specific region pair
-            response = latencies_table.query(
-                KeyConditionExpression=Key('region_from').eq(from_region) & 
-                                     Key('region_to').eq(to_region),
-                FilterExpression=Attr('timeframe').eq(timeframe)
-            )
+            with span('query'):
+                response = latencies_table.query(
+                    KeyConditionExpression=Key('region_from').eq(from_region) & 
+                                         Key('region_to').eq(to_region),
+                    FilterExpression=Attr('timeframe').eq(timeframe),
+                    **capacity_kwargs()
+                )
+            capture_capacity(response)
         else:
-            # Query for all regions with pagination
-            items = []
-            last_key = None
-
-            while True:
-                kwargs = {'FilterExpression': Attr('timeframe').eq(timeframe)}
-                if last_key:
-                    kwargs['ExclusiveStartKey'] = last_key
-
-                response = latencies_table.scan(**kwargs)
-                items.extend(response.get('Items', []))
-
-                last_key = response.get('LastEvaluatedKey')
-                if not last_key:
-                    break
+            items = scan_stored_averages(timeframe)
 
         # Process and format the data
         result = {
@@ -113,22 +252,308 @@ def get_latencies():
             },
             "data": {}
         }
+        if metric is not None:
+            result['metadata'] = {"metric": metric, "timeframe": timeframe, "unit": LOSS_METRICS[metric]}
 
         # Transform the data into the matrix format
         # Use paginated items for scan, response items for query
         data_items = items if not (from_region and to_region) else response.get('Items', [])
-        for item in data_items:
-            from_reg = item['region_from']
-            to_reg = item['region_to']
-            if from_reg not in result['data']:
-                result['data'][from_reg] = {}
-            # Convert DynamoDB Decimal to float
-            result['data'][from_reg][to_reg] = float(item[percentile])
+        count('items', len(data_items))
+        catalog, matrix = build_matrix(data_items, metric or percentile)
+        result['data'] = catalog.matrix_to_dict(matrix)
+
+        return Response(body=result,
+                      headers={'Content-Type': 'application/json',
+                              'Access-Control-Allow-Origin': '*'})
+
+    except Exception as e:
+        return Response(
+            body={'error': str(e)},
+            status_code=500,
+            headers={'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'}
+        )
+
+def get_matrix(percentile: str, timeframe: str):
+    """Get the latency matrix of the stored averages, cached until they change."""
+    from chalicelib.latency_matrix import build_matrix
+
+    return get_matrix_cache().get(
+        ('matrix', percentile, timeframe),
+        lambda: build_matrix(scan_stored_averages(timeframe), percentile)
+    )
+
+def compute_routes(percentile: str, timeframe: str):
+    """Load the latency matrix and run all pairs shortest paths over it."""
+    from chalicelib.latency_matrix import shortest_paths
+
+    catalog, matrix = get_matrix(percentile, timeframe)
+    with span('shortest_paths'):
+        dist, next_hop = shortest_paths(matrix, catalog.size)
+    return catalog, matrix.reshape(catalog.size, catalog.size), dist, next_hop
+
+@app.route('/routes')
+@instrumented('api_routes')
+def get_routes():
+    """
+    Get the region pairs for which relaying through other regions beats
+    the direct path, with the best path and its improvement over direct.
+
+    'min_improvement' is the minimum relative gain, e.g. 0.1 for 10%.
+    """
+    import numpy as np
+    from chalicelib.latency_matrix import route_path
+
+    params = app.current_request.query_params or {}
+    percentile = params.get('percentile', 'p_50')
+    timeframe = params.get('timeframe', '1D')
+    from_region = params.get('from')
+    to_region = params.get('to')
+
+    validate_params(percentile, timeframe)
+    try:
+        min_improvement = float(params.get('min_improvement', 0))
+    except ValueError:
+        raise BadRequestError("'min_improvement' must be a number")
+
+    try:
+        catalog, direct, dist, next_hop = get_matrix_cache().get(
+            ('routes', percentile, timeframe), lambda: compute_routes(percentile, timeframe)
+        )
+        if (from_region and from_region not in catalog) or (to_region and to_region not in catalog):
+            raise BadRequestError("Unknown region")
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            improvement = (direct - dist) / direct
+        candidates = np.isfinite(dist) & (next_hop != np.arange(catalog.size)[None, :])
+        # Unmeasured direct pairs have no improvement ratio but can still be relayed
+        candidates &= np.isnan(direct) | (improvement >= min_improvement)
+        if from_region:
+            candidates &= np.arange(catalog.size)[:, None] == catalog.id(from_region)
+        if to_region:
+            candidates &= np.arange(catalog.size)[None, :] == catalog.id(to_region)
+
+        routes = []
+        for from_id, to_id in zip(*np.nonzero(candidates)):
+            direct_latency = direct[from_id, to_id]
+            routes.append({
+                'from': catalog.name(from_id),
+                'to': catalog.name(to_id),
+                'path': [catalog.name(i) for i in route_path(next_hop, from_id, to_id)],
+                'latency': round(float(dist[from_id, to_id]), 3),
+                'direct_latency': None if np.isnan(direct_latency) else round(float(direct_latency), 3),
+                'improvement': None if np.isnan(direct_latency) else round(float(improvement[from_id, to_id]), 4)
+            })
+        routes.sort(key=lambda r: -(r['improvement'] or 0))
+        count('routes', len(routes))
+
+        result = {
+            "metadata": {
+                "percentile": percentile,
+                "timeframe": timeframe,
+                "min_improvement": min_improvement,
+                "version": get_matrix_cache().version,
+                "unit": "milliseconds"
+            },
+            "data": routes
+        }
+
+        return Response(body=result,
+                      headers={'Content-Type': 'application/json',
+                              'Access-Control-Allow-Origin': '*'})
+
+    except BadRequestError:
+        raise
+    except Exception as e:
+        return Response(
+            body={'error': str(e)},
+            status_code=500,
+            headers={'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'}
+        )
+
+@app.route('/placement')
+@instrumented('api_placement')
+def get_placement():
+    """
+    Choose the k regions to deploy in that minimize latency to a set of
+    user regions.
+
+    'objective' is 'center' (worst case user latency) or 'median' (average
+    user latency). 'users' and 'candidates' are comma separated region
+    lists and default to every region with data.
+    """
+    import numpy as np
+    from chalicelib.placement import solve_placement, UNREACHABLE_MS
+
+    params = app.current_request.query_params or {}
+    percentile = params.get('percentile', 'p_50')
+    timeframe = params.get('timeframe', '1D')
+    objective = params.get('objective', 'center')
+    method = params.get('method', 'auto')
+
+    validate_params(percentile, timeframe)
+    try:
+        k = int(params.get('k', 1))
+    except ValueError:
+        raise BadRequestError("'k' must be an integer")
+
+    try:
+        catalog, matrix = get_matrix(percentile, timeframe)
+        measured = sorted({catalog.pair(i)[0] for i in np.flatnonzero(~np.isnan(matrix)).tolist()})
+        try:
+            users = sorted(set(catalog.ids(params['users'].split(',')))) if params.get('users') else measured
+            candidates = sorted(set(catalog.ids(params['candidates'].split(',')))) if params.get('candidates') else measured
+        except KeyError as e:
+            raise BadRequestError(f"Unknown region: {e.args[0]}")
+
+        try:
+            placement = get_matrix_cache().get(
+                ('placement', percentile, timeframe, tuple(users), tuple(candidates), k, objective, method),
+                lambda: solve_placement(matrix, catalog.size, users, candidates, k, objective, method)
+            )
+        except ValueError as e:
+            raise BadRequestError(str(e))
+
+        def latency(value):
+            return None if value >= UNREACHABLE_MS else round(value, 3)
+
+        result = {
+            "metadata": {
+                "percentile": percentile,
+                "timeframe": timeframe,
+                "objective": objective,
+                "method": placement.method,
+                "k": k,
+                "unit": "milliseconds"
+            },
+            "data": {
+                "regions": [catalog.name(i) for i in placement.regions],
+                "worst_latency": latency(placement.worst_latency),
+                "mean_latency": latency(placement.mean_latency),
+                "assignment": {
+                    catalog.name(user): catalog.name(region)
+                    for user, region in zip(users, placement.assignment)
+                }
+            }
+        }
 
         return Response(body=result,
                       headers={'Content-Type': 'application/json',
                               'Access-Control-Allow-Origin': '*'})
 
+    except BadRequestError:
+        raise
+    except Exception as e:
+        return Response(
+            body={'error': str(e)},
+            status_code=500,
+            headers={'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'}
+        )
+
+def get_snapshot_matrix(percentile: str, snapshot: str):
+    """
+    Get the latency matrix of a timeframe ('1W') or a day window
+    ('2025-01-01..2025-01-31').
+
+    Precomputed percentiles of timeframes come from the stored averages,
+    anything else is merged from the daily sketches. Both are cached until
+    the stored averages change.
+    """
+    from chalicelib import sketch_queries
+
+    if snapshot in VALID_TIMEFRAMES and percentile in VALID_PERCENTILES:
+        return get_matrix(percentile, snapshot)
+
+    try:
+        percentile_value = sketch_queries.parse_percentile(percentile)
+        if snapshot in VALID_TIMEFRAMES:
+            first_day, last_day = sketch_queries.parse_window(
+                None, None, default_days=sketch_queries.TIMEFRAME_DAYS[snapshot]
+            )
+        elif '..' in snapshot:
+            first_day, last_day = sketch_queries.parse_window(*snapshot.split('..', 1))
+        else:
+            raise ValueError(f"Invalid snapshot '{snapshot}'. Use a timeframe "
+                             f"({', '.join(VALID_TIMEFRAMES)}) or a YYYY-MM-DD..YYYY-MM-DD window")
+    except ValueError as e:
+        raise BadRequestError(str(e))
+
+    def compute():
+        with span('sketches'):
+            catalog, matrix, _ = sketch_queries.sketch_matrix(
+                rollups_table, get_active_region_names(), first_day, last_day, percentile_value
+            )
+        return catalog, matrix
+
+    return get_matrix_cache().get(('sketch', percentile_value, first_day, last_day), compute)
+
+@app.route('/latencies/diff')
+@instrumented('api_latencies_diff')
+def get_latencies_diff():
+    """
+    Get the per cell change of the latency matrix between two snapshots.
+
+    'base' and 'compare' are timeframes or day windows, see
+    get_snapshot_matrix. Only cells whose absolute change is at least
+    'min_delta' ms and whose relative change is at least 'min_ratio' are
+    returned.
+    """
+    import numpy as np
+    from chalicelib.latency_matrix import align_matrices, diff_matrices
+
+    params = app.current_request.query_params or {}
+    percentile = params.get('percentile', 'p_50')
+    base = params.get('base', '1Y')
+    compare = params.get('compare', '1W')
+
+    try:
+        min_delta = float(params.get('min_delta', 0))
+        min_ratio = float(params.get('min_ratio', 0))
+    except ValueError:
+        raise BadRequestError("'min_delta' and 'min_ratio' must be numbers")
+
+    try:
+        base_matrix = get_snapshot_matrix(percentile, base)
+        compare_matrix = get_snapshot_matrix(percentile, compare)
+        catalog, base_values, compare_values = align_matrices(base_matrix, compare_matrix)
+
+        with span('diff'):
+            changed, delta, ratio = diff_matrices(base_values, compare_values, min_delta, min_ratio)
+        count('cells_changed', len(changed))
+
+        data = {}
+        for index in changed.tolist():
+            from_id, to_id = catalog.pair(index)
+            data.setdefault(catalog.name(from_id), {})[catalog.name(to_id)] = {
+                'base': round(float(base_values[index]), 3),
+                'compare': round(float(compare_values[index]), 3),
+                'delta': round(float(delta[index]), 3),
+                # No ratio to a base of 0 (e.g. loss metrics), JSON has no Infinity
+                'ratio': None if np.isnan(ratio[index]) else round(float(ratio[index]), 4)
+            }
+
+        result = {
+            "metadata": {
+                "percentile": percentile,
+                "base": base,
+                "compare": compare,
+                "min_delta": min_delta,
+                "min_ratio": min_ratio,
+                "cells_compared": int(np.count_nonzero(~np.isnan(delta))),
+                "cells_changed": len(changed),
+                "unit": "milliseconds"
+            },
+            "data": data
+        }
+
+        return Response(body=result,
+                      headers={'Content-Type': 'application/json',
+                              'Access-Control-Allow-Origin': '*'})
+
+    except BadRequestError:
+        raise
     except Exception as e:
         return Response(
             body={'error': str(e)},
@@ -138,8 +563,11 @@ def get_latencies():
         )
 
 @app.route('/history', api_key_required=True)
+@instrumented('api_history')
 def get_history():
     """Get historical average latency data for specific region pairs."""
+    from boto3.dynamodb.conditions import Key, Attr
+
     params = app.current_request.query_params or {}
     
     # Required parameters
@@ -153,30 +581,72 @@ def get_history():
     # Default to 7 days if no start provided
     default_start = (datetime.fromisoformat(end.replace('Z', '')) - timedelta(days=7)).isoformat()
     start = params.get('start', default_start)
+    # Optionally include the individual attempt times of each run
+    include_samples = params.get('samples', 'false').lower() == 'true'
+
+    projection = '#ts, #avg'
+    attribute_names = {
+        '#ts': 'timestamp',
+        '#avg': 'avg'
+    }
+    if include_samples:
+        projection += ', #results, #samples'
+        attribute_names['#results'] = 'results'
+        attribute_names['#samples'] = 'samples'
+
+    # Raw items older than the hot retention window have expired, those
+    # days are served from the daily rollups instead
+    hot_cutoff = (datetime.utcnow() - timedelta(days=HOT_RETENTION_DAYS)).isoformat()
+    # Rollups keep one average per run, not the attempt times
+    if include_samples and start < hot_cutoff:
+        raise BadRequestError(f"'samples' is only available for the last {HOT_RETENTION_DAYS} days")
 
     try:
-        # Query DynamoDB for historical data
-        response = ping_table.query(
-            IndexName='region-timestamp-index',
-            KeyConditionExpression=
-                Key('region').eq(from_region) & 
-                Key('timestamp').between(start, end),
-            FilterExpression=Attr('regionTo').eq(to_region),
-            ProjectionExpression='#ts, #avg',
-            ExpressionAttributeNames={
-                '#ts': 'timestamp',
-                '#avg': 'avg'
-            }
-        )
+        if start < hot_cutoff:
+            processed_data = read_pair_history(
+                ping_table, rollups_table, from_region, to_region, start, end,
+                rollup_before=hot_cutoff, runs_table=runs_table
+            )
+        else:
+            # Query DynamoDB for historical data
+            with span('query'):
+                response = ping_table.query(
+                    IndexName='region-timestamp-index',
+                    KeyConditionExpression=
+                        Key('region').eq(from_region) & 
+                        Key('timestamp').between(start, end),
+                    FilterExpression=Attr('regionTo').eq(to_region),
+                    ProjectionExpression=projection,
+                    ExpressionAttributeNames=attribute_names,
+                    **capacity_kwargs()
+                )
+            capture_capacity(response)
 
-        # Process the data - note that items are already deserialized
-        processed_data = [
-            {
-                'timestamp': item['timestamp'],  # Already a string
-                'value': float(item['avg'])      # Convert to float
-            }
-            for item in response.get('Items', [])
-        ]
+            # Process the data - note that items are already deserialized
+            processed_data = []
+            for item in response.get('Items', []):
+                # Runs where every attempt failed have no latency
+                if 'avg' not in item:
+                    continue
+                point = {
+                    'timestamp': item['timestamp'],  # Already a string
+                    'value': float(item['avg'])      # Convert to float
+                }
+                if include_samples:
+                    # Decodes both the legacy results list and packed samples
+                    point['samples'] = item_samples(item).tolist()
+                processed_data.append(point)
+
+            # Runs stored as one run-level item hold every destination
+            with span('query_runs'):
+                for item in query_runs(runs_table, from_region, start, end):
+                    if item['regionTo'] != to_region or 'avg' not in item:
+                        continue
+                    point = {'timestamp': item['timestamp'], 'value': float(item['avg'])}
+                    if include_samples:
+                        point['samples'] = item_samples(item).tolist()
+                    processed_data.append(point)
+            processed_data.sort(key=lambda p: p['timestamp'])
 
         result = {
             "metadata": {
@@ -206,9 +676,350 @@ def get_history():
                     'Access-Control-Allow-Origin': '*'}
         )
 
+def attempt_distribution(values):
+    """Attempt counts, loss rate and percentiles of attempt latencies (NaN for failed attempts)."""
+    import numpy as np
+
+    successful = values[~np.isnan(values)]
+    distribution = {
+        'attempts': int(values.size),
+        'attempts_success': int(successful.size),
+        'loss_rate': 1 - successful.size / values.size if values.size else None,
+    }
+    for p in FRONTEND_PERCENTILES:
+        distribution[f'p_{p}'] = float(np.percentile(successful, p)) if successful.size else None
+    return distribution
+
+@app.route('/frontends', api_key_required=True)
+@instrumented('api_frontends')
+def get_frontends():
+    """
+    Get the attempt latency distribution of a region pair, overall and per
+    front-end address of the destination endpoint.
+
+    Front ends are recorded by runs that spread their attempts across the
+    endpoint's addresses (ADDRESS_SAMPLE_SIZE), over the raw retention window.
+    """
+    import numpy as np
+
+    params = app.current_request.query_params or {}
+
+    from_region = params.get('from')
+    to_region = params.get('to')
+    if not from_region or not to_region:
+        raise BadRequestError("Both 'from' and 'to' regions are required")
+    source = params.get('source', 'connect')
+    if source not in LATENCY_SOURCES:
+        raise BadRequestError(f"Invalid source. Must be one of: {', '.join(LATENCY_SOURCES)}")
+
+    end = params.get('end', datetime.utcnow().isoformat())
+    try:
+        default_start = (datetime.fromisoformat(end.replace('Z', '')) - timedelta(days=7)).isoformat()
+        start = params.get('start', default_start)
+        datetime.fromisoformat(start.replace('Z', ''))
+    except ValueError:
+        raise BadRequestError("'start' and 'end' must be ISO 8601 timestamps")
+    # Front ends are only in the raw items, not in the daily rollups
+    hot_cutoff = (datetime.utcnow() - timedelta(days=HOT_RETENTION_DAYS)).isoformat()
+    start = max(start, hot_cutoff)
+
+    try:
+        with span('query'):
+            items = [
+                item for item in query_raw(ping_table, from_region, start, end, runs_table)
+                if item['regionTo'] == to_region
+            ]
+        count('runs', len(items))
+
+        with span('distributions'):
+            pair = attempt_distribution(
+                np.concatenate([attempt_values(item, source) for item in items]) if items else np.empty(0)
+            )
+            frontends = [
+                {'address': address, **attempt_distribution(values)}
+                for address, values in frontend_samples(items, source).items()
+            ]
+        frontends.sort(key=lambda f: (f['p_50'] is None, f['p_50'] or 0.0))
+
+        result = {
+            "metadata": {
+                "from": from_region,
+                "to": to_region,
+                "start": start,
+                "end": end,
+                "source": source,
+                "runs": len(items),
+                "unit": "milliseconds"
+            },
+            "data": {
+                "pair": pair,
+                "frontends": frontends
+            }
+        }
+
+        return Response(
+            body=result,
+            headers={
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*',
+                'Cache-Control': 'public, max-age=300'  # Cache for 5 minutes
+            }
+        )
+
+    except Exception as e:
+        return Response(
+            body={'error': str(e)},
+            status_code=500,
+            headers={'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'}
+        )
+
+@app.route('/percentiles')
+@instrumented('api_percentiles')
+def get_percentiles():
+    """
+    Get arbitrary percentiles over a window by merging daily latency sketches.
+
+    'from' and 'to' accept comma separated region lists, e.g. all EU sources
+    to us-east-1. Omitting 'to' merges every destination. The window is
+    resolved to whole days.
+    """
+    from chalicelib import sketch_queries
+
+    params = app.current_request.query_params or {}
+
+    regions_from = [r for r in params.get('from', '').split(',') if r]
+    if not regions_from:
+        raise BadRequestError("'from' region is required")
+    regions_to = [r for r in params.get('to', '').split(',') if r] or None
+
+    try:
+        first_day, last_day = sketch_queries.parse_window(params.get('start'), params.get('end'))
+        percentiles = sketch_queries.parse_percentiles(params.get('percentiles', '50,90,99'))
+    except ValueError as e:
+        raise BadRequestError(str(e))
+
+    try:
+        with span('merge'):
+            sketch = sketch_queries.merged_sketch(rollups_table, regions_from, regions_to, first_day, last_day)
+        count('samples', sketch.count)
+
+        values = sketch.quantiles([p / 100 for p in percentiles])
+        result = {
+            "metadata": {
+                "from": regions_from,
+                "to": regions_to,
+                "start": first_day,
+                "end": last_day,
+                "samples": sketch.count,
+                "relative_accuracy": sketch.relative_accuracy,
+                "unit": "milliseconds"
+            },
+            "data": {
+                sketch_queries.percentile_key(p): (None if sketch.count == 0 else float(v))
+                for p, v in zip(percentiles, values)
+            }
+        }
+
+        return Response(
+            body=result,
+            headers={
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*',
+                'Cache-Control': 'public, max-age=300'  # Cache for 5 minutes
+            }
+        )
+
+    except ValueError as e:
+        raise BadRequestError(str(e))
+    except Exception as e:
+        return Response(
+            body={'error': str(e)},
+            status_code=500,
+            headers={'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'}
+        )
+
+@app.route('/anomalies')
+@instrumented('api_anomalies')
+def get_anomalies():
+    """
+    Get the latency spikes and step changes detected over the last days.
+
+    Optional filters: 'from', 'to' and 'kind' (spike, step_up, step_down).
+    """
+    from boto3.dynamodb.conditions import Key
+    from chalicelib.shared.anomaly import ANOMALY_RETENTION_DAYS
+
+    params = app.current_request.query_params or {}
+    from_region = params.get('from')
+    to_region = params.get('to')
+    kind = params.get('kind')
+
+    try:
+        days = int(params.get('days', 7))
+    except ValueError:
+        raise BadRequestError("'days' must be an integer")
+    if not 1 <= days <= ANOMALY_RETENTION_DAYS:
+        raise BadRequestError(f"'days' must be between 1 and {ANOMALY_RETENTION_DAYS}")
+    if kind and kind not in ('spike', 'step_up', 'step_down'):
+        raise BadRequestError("Invalid kind. Must be one of: spike, step_up, step_down")
+
+    try:
+        today = datetime.utcnow().date()
+        anomalies = []
+        # Anomalies are partitioned by day, newest first
+        for offset in range(days):
+            day = (today - timedelta(days=offset)).strftime('%Y-%m-%d')
+            kwargs = {'KeyConditionExpression': Key('day').eq(day), 'ScanIndexForward': False}
+            while True:
+                with span('query'):
+                    response = anomalies_table.query(**kwargs, **capacity_kwargs())
+                capture_capacity(response)
+                for item in response.get('Items', []):
+                    if from_region and item['region_from'] != from_region:
+                        continue
+                    if to_region and item['region_to'] != to_region:
+                        continue
+                    if kind and item['kind'] != kind:
+                        continue
+                    anomalies.append({
+                        'timestamp': item['timestamp'],
+                        'from': item['region_from'],
+                        'to': item['region_to'],
+                        'kind': item['kind'],
+                        'value': float(item['value']),
+                        'baseline': float(item['baseline']),
+                        'score': float(item['score'])
+                    })
+                if 'LastEvaluatedKey' not in response:
+                    break
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        count('anomalies', len(anomalies))
+
+        result = {
+            "metadata": {
+                "days": days,
+                "from": from_region,
+                "to": to_region,
+                "kind": kind,
+                "unit": "milliseconds"
+            },
+            "data": anomalies
+        }
+
+        return Response(
+            body=result,
+            headers={
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*',
+                'Cache-Control': 'public, max-age=300'  # Cache for 5 minutes
+            }
+        )
+
+    except Exception as e:
+        return Response(
+            body={'error': str(e)},
+            status_code=500,
+            headers={'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'}
+        )
+
+@app.route('/profiles')
+@instrumented('api_profiles')
+def get_profiles():
+    """
+    Get the hour-of-day / day-of-week latency profile of a region pair.
+
+    Every grid is 7 rows (Monday first) of 24 UTC hours, null for cells
+    without data. 'percentiles' (default '50,90') selects the cell
+    percentiles, 'hours' ranks the hours of the day by mean latency.
+    """
+    import numpy as np
+    from chalicelib import sketch_queries
+    from chalicelib.shared.profiles import PairProfiles, DAY_NAMES, DAYS_PER_WEEK, HOURS_PER_DAY
+
+    params = app.current_request.query_params or {}
+    from_region = params.get('from')
+    to_region = params.get('to')
+    if not from_region or not to_region:
+        raise BadRequestError("Both 'from' and 'to' regions are required")
+    try:
+        percentiles = sketch_queries.parse_percentiles(params.get('percentiles', '50,90'))
+    except ValueError as e:
+        raise BadRequestError(str(e))
+
+    def grid(values):
+        rows = np.asarray(values, dtype=np.float64).reshape(DAYS_PER_WEEK, HOURS_PER_DAY)
+        return [[None if np.isnan(v) else round(float(v), 3) for v in row] for row in rows]
+
+    try:
+        with span('query'):
+            response = profiles_table.get_item(
+                Key={'region_from': from_region, 'region_to': to_region},
+                **capacity_kwargs()
+            )
+        capture_capacity(response)
+        item = response.get('Item')
+        if not item:
+            raise NotFoundError(f"No profile for {from_region} -> {to_region}")
+
+        profiles = PairProfiles.from_items([item])
+        data = {
+            'count': profiles.count[0].reshape(DAYS_PER_WEEK, HOURS_PER_DAY).tolist(),
+            'mean': grid(profiles.mean()[0])
+        }
+        quantiles = profiles.quantiles(0, [p / 100 for p in percentiles])
+        for percentile, values in zip(percentiles, quantiles):
+            data[sketch_queries.percentile_key(percentile)] = grid(values)
+
+        # Hours of the day over the whole week, fastest first
+        hour_counts = profiles.count[0].reshape(DAYS_PER_WEEK, HOURS_PER_DAY).sum(axis=0)
+        hour_totals = profiles.total[0].reshape(DAYS_PER_WEEK, HOURS_PER_DAY).sum(axis=0)
+        hours = [
+            {'hour': hour, 'count': int(hour_counts[hour]), 'mean': round(float(hour_totals[hour] / hour_counts[hour]), 3)}
+            for hour in np.flatnonzero(hour_counts).tolist()
+        ]
+
+        result = {
+            "metadata": {
+                "from": from_region,
+                "to": to_region,
+                "days": list(DAY_NAMES),
+                "timezone": "UTC",
+                "percentiles": [sketch_queries.percentile_key(p) for p in percentiles],
+                "updated_at": item.get('updated_at'),
+                "unit": "milliseconds"
+            },
+            "data": data,
+            "hours": sorted(hours, key=lambda h: h['mean'])
+        }
+
+        return Response(
+            body=result,
+            headers={
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*',
+                'Cache-Control': 'public, max-age=300'  # Cache for 5 minutes
+            }
+        )
+
+    except NotFoundError:
+        raise
+    except Exception as e:
+        return Response(
+            body={'error': str(e)},
+            status_code=500,
+            headers={'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'}
+        )
+
 @app.route('/status')
+@instrumented('api_status')
 def get_status():
     """Get API status and latest data timestamp."""
+    from boto3.dynamodb.conditions import Key
+
     try:
         # Query DynamoDB using region-timestamp-index with a high limit
         # and scan index forward false to get the latest timestamp
@@ -220,11 +1031,29 @@ def get_status():
             ProjectionExpression='#ts',
             ExpressionAttributeNames={
                 '#ts': 'timestamp'
-            }
+            },
+            **capacity_kwargs()
         )
+        capture_capacity(response)
 
         latest_timestamp = response['Items'][0]['timestamp'] if response['Items'] else None
 
+        # Runs written as run-level items are only in the runs table
+        if runs_table is not None:
+            response = runs_table.query(
+                KeyConditionExpression=Key('region').eq('us-east-1'),
+                Limit=1,
+                ScanIndexForward=False,
+                ProjectionExpression='#ts',
+                ExpressionAttributeNames={
+                    '#ts': 'timestamp'
+                },
+                **capacity_kwargs()
+            )
+            capture_capacity(response)
+            if response['Items']:
+                latest_timestamp = max(filter(None, [latest_timestamp, response['Items'][0]['timestamp']]))
+
         result = {
             "status": "healthy",
             "latest_update": latest_timestamp,
@@ -251,6 +1080,7 @@ def get_status():
         )
 
 @app.route('/regions')
+@instrumented('api_regions')
 def regions():
     """
     Endpoint to return the status of all of the regions available in CloudPing.
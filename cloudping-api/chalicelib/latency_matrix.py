@@ -0,0 +1,161 @@
+"""
+Latency matrices as flat NumPy arrays indexed by region pair.
+
+Stored averages are loaded into an N*N float array using the shared region
+catalog's pair index (NaN where a pair has no data). Region names are only
+produced again when the response is serialized.
+
+Results derived from the matrices are cached per version of the stored
+averages (see shared/averages_version.py), which only changes when the
+averages are recalculated.
+"""
+
+import time
+
+import numpy as np
+
+from chalicelib.shared.region_catalog import get_region_catalog
+
+
+def build_matrix(items, metric):
+    """
+    Build a flat latency matrix from cloudping_stored_avgs items.
+
+    Args:
+        items: Deserialized stored average items
+        metric: Attribute to read, e.g. 'p_50' or 'latency'
+
+    Returns:
+        tuple: (RegionCatalog, numpy.ndarray of size N*N)
+    """
+    catalog = get_region_catalog(
+        name for item in items for name in (item['region_from'], item['region_to'])
+    )
+    matrix = np.full(catalog.size * catalog.size, np.nan)
+    for item in items:
+        # Items stored before a metric existed (e.g. attempt_p_99) stay NaN
+        if metric not in item:
+            continue
+        # Convert DynamoDB Decimal to float
+        matrix[catalog.pair_index_by_name(item['region_from'], item['region_to'])] = float(item[metric])
+    return catalog, matrix
+
+
+def align_matrices(first, second):
+    """
+    Re-index two (catalog, matrix) pairs onto one catalog with the regions of both.
+
+    Returns:
+        tuple: (RegionCatalog, first matrix, second matrix)
+    """
+    catalog = get_region_catalog(first[0].names + second[0].names)
+    aligned = []
+    for source_catalog, matrix in (first, second):
+        if source_catalog.names == catalog.names:
+            aligned.append(matrix)
+            continue
+        ids = catalog.ids(source_catalog.names)
+        square = np.full((catalog.size, catalog.size), np.nan)
+        square[np.ix_(ids, ids)] = np.asarray(matrix).reshape(source_catalog.size, source_catalog.size)
+        aligned.append(square.reshape(-1))
+    return catalog, aligned[0], aligned[1]
+
+
+def diff_matrices(base, compare, min_delta=0.0, min_ratio=0.0):
+    """
+    Per cell change between two aligned flat latency matrices.
+
+    Args:
+        base: Flat N*N matrix to compare against
+        compare: Flat N*N matrix
+        min_delta: Minimum absolute change in milliseconds to report a cell
+        min_ratio: Minimum relative change (e.g. 0.1 for 10%) to report a cell
+
+    Returns:
+        tuple: (indices of the changed cells, delta array, ratio array), both N*N.
+               The ratio is NaN where the base is 0, any change from 0 passes min_ratio.
+    """
+    base = np.asarray(base, dtype=np.float64)
+    compare = np.asarray(compare, dtype=np.float64)
+    delta = compare - base
+    zero_base = base == 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = np.where(zero_base, np.nan, compare / base)
+    relative = np.where(zero_base, np.where(delta == 0, 0.0, np.inf), np.abs(ratio - 1))
+    changed = ~np.isnan(delta) & (np.abs(delta) >= min_delta) & (relative >= min_ratio)
+    return np.flatnonzero(changed), delta, ratio
+
+
+def shortest_paths(matrix, size):
+    """
+    All pairs shortest paths over a latency matrix (Floyd-Warshall).
+
+    Each step relaxes all N*N pairs through one intermediate region at once.
+    Missing pairs cannot be used as a leg.
+
+    Args:
+        matrix: Flat N*N latency array, NaN where a pair has no data
+        size: N
+
+    Returns:
+        tuple: (N x N best latencies, N x N next hop region IDs, -1 if unreachable)
+    """
+    dist = np.asarray(matrix, dtype=np.float64).reshape(size, size).copy()
+    dist[np.isnan(dist)] = np.inf
+    np.fill_diagonal(dist, 0.0)
+    next_hop = np.where(np.isfinite(dist), np.arange(size)[None, :], -1)
+
+    for k in range(size):
+        via = dist[:, k:k + 1] + dist[k:k + 1, :]
+        better = via < dist
+        dist = np.where(better, via, dist)
+        next_hop = np.where(better, next_hop[:, k:k + 1], next_hop)
+    return dist, next_hop
+
+
+def route_path(next_hop, from_id, to_id):
+    """Region IDs along the best path from one region to another (empty if unreachable)."""
+    if next_hop[from_id, to_id] < 0:
+        return []
+    path = [from_id]
+    while path[-1] != to_id:
+        path.append(int(next_hop[path[-1], to_id]))
+    return path
+
+
+class VersionedCache:
+    """
+    Cache of values computed from the stored averages.
+
+    The version is checked at most every `check_interval` seconds and all
+    entries are dropped when it changed. Beyond `max_entries` the oldest
+    entry is evicted.
+    """
+
+    def __init__(self, version_func, check_interval=60.0, clock=time.monotonic, max_entries=256):
+        self.version_func = version_func
+        self.check_interval = check_interval
+        self.max_entries = max_entries
+        self.clock = clock
+        self.version = None
+        self._checked_at = None
+        self._entries = {}
+
+    def _check(self):
+        now = self.clock()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        version = self.version_func()
+        self._checked_at = now
+        if version != self.version:
+            self.version = version
+            self._entries = {}
+
+    def get(self, key, compute):
+        """Return the cached value of `key`, computing it when missing."""
+        self._check()
+        if key not in self._entries:
+            if len(self._entries) >= self.max_entries:
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = compute()
+        return self._entries[key]
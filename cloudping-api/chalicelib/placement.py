@@ -0,0 +1,198 @@
+"""
+Region placement over a latency matrix.
+
+Chooses k deployment regions among candidate regions so that a set of user
+regions gets the lowest latency to its closest deployment:
+
+- 'center' (k-center) minimizes the worst latency of any user region
+- 'median' (k-median) minimizes the average latency over user regions
+
+Small problems are solved exactly by enumerating every combination in
+vectorized chunks. Larger ones use greedy addition from several starting
+regions, each followed by swap based local search. Both evaluate all candidates at once with NumPy, the cost of
+a step is O(users * candidates).
+
+The module only depends on NumPy so it can be used outside of the API.
+"""
+
+from itertools import combinations
+from math import comb
+from typing import List, NamedTuple, Sequence
+
+import numpy as np
+
+OBJECTIVES = ('center', 'median')
+METHODS = ('auto', 'exact', 'greedy')
+# Largest number of combinations solved exactly, 'auto' switches to greedy above it
+EXACT_MAX_COMBINATIONS = 200_000
+# Largest number of regions to choose
+MAX_K = 16
+EXACT_CHUNK_SIZE = 20_000
+# Number of different first picks tried by the greedy solver
+GREEDY_STARTS = 16
+# Break ties of the worst case objective by the average latency
+_TIE_BREAK = 1e-6
+# Latency assumed for pairs without data, keeps scores finite and comparable
+UNREACHABLE_MS = 1e6
+
+
+class Placement(NamedTuple):
+    regions: List[int]
+    objective: str
+    worst_latency: float
+    mean_latency: float
+    assignment: List[int]
+    method: str
+
+
+def placement_distances(matrix, size, users, candidates):
+    """
+    Latency from every user region to every candidate region.
+
+    A region reaches itself at no cost when its own latency was not measured.
+
+    Returns:
+        numpy.ndarray: users x candidates, UNREACHABLE_MS where a pair has no data
+    """
+    square = np.asarray(matrix, dtype=np.float64).reshape(size, size).copy()
+    diagonal = np.diagonal(square).copy()
+    diagonal[np.isnan(diagonal)] = 0.0
+    np.fill_diagonal(square, diagonal)
+    square[np.isnan(square)] = UNREACHABLE_MS
+    return square[np.ix_(users, candidates)]
+
+
+def _scores(served, objective):
+    """Objective of each column of a users x options latency array (lower is better)."""
+    mean = served.mean(axis=0)
+    if objective == 'median':
+        return mean
+    return served.max(axis=0) + _TIE_BREAK * mean
+
+
+def solve_exact(distances, k, objective):
+    """Best choice of k candidate columns by enumerating all combinations."""
+    n_candidates = distances.shape[1]
+    best_score = np.inf
+    best = None
+    all_combinations = combinations(range(n_candidates), k)
+    while True:
+        chunk = np.array(list(_take(all_combinations, EXACT_CHUNK_SIZE)), dtype=np.int64)
+        if not len(chunk):
+            break
+        # users x chunk x k -> latency to the closest chosen region
+        served = distances[:, chunk].min(axis=2)
+        scores = _scores(served, objective)
+        index = int(np.argmin(scores))
+        if scores[index] < best_score:
+            best_score = scores[index]
+            best = chunk[index].tolist()
+    return best
+
+
+def _local_search(distances, chosen, objective, max_rounds):
+    """Apply the best improving swap of one chosen candidate until none is left."""
+    n_users = distances.shape[0]
+    k = len(chosen)
+    current = _scores(distances[:, chosen].min(axis=1)[:, None], objective)[0]
+    for _ in range(max_rounds):
+        best_swap = None
+        for position in range(k):
+            others = [c for i, c in enumerate(chosen) if i != position]
+            rest = distances[:, others].min(axis=1) if others else np.full(n_users, np.inf)
+            scores = _scores(np.minimum(rest[:, None], distances), objective)
+            scores[chosen] = np.inf
+            candidate = int(np.argmin(scores))
+            if scores[candidate] < current - 1e-9 and (best_swap is None or scores[candidate] < best_swap[0]):
+                best_swap = (scores[candidate], position, candidate)
+        if best_swap is None:
+            break
+        current, position, candidate = best_swap
+        chosen[position] = candidate
+    return chosen, current
+
+
+def solve_greedy(distances, k, objective, max_rounds=50, starts=GREEDY_STARTS):
+    """
+    Greedy addition of the best candidate followed by local search.
+
+    Greedy addition is repeated from several first picks (the best single
+    candidates) since a poor first pick is hard to undo by swaps, which
+    matters most for the worst case objective.
+    """
+    single_scores = _scores(distances, objective)
+    first_picks = np.argsort(single_scores)[:starts].tolist()
+
+    best, best_score = None, np.inf
+    for first in first_picks:
+        chosen = [first]
+        served = distances[:, first].copy()
+        while len(chosen) < k:
+            scores = _scores(np.minimum(served[:, None], distances), objective)
+            scores[chosen] = np.inf
+            pick = int(np.argmin(scores))
+            chosen.append(pick)
+            served = np.minimum(served, distances[:, pick])
+
+        chosen, score = _local_search(distances, chosen, objective, max_rounds)
+        if score < best_score:
+            best, best_score = chosen, score
+    return best
+
+
+def solve_placement(matrix, size, users: Sequence[int], candidates: Sequence[int], k: int,
+                    objective: str = 'center', method: str = 'auto',
+                    max_combinations: int = EXACT_MAX_COMBINATIONS) -> Placement:
+    """
+    Choose k deployment regions for a set of user regions.
+
+    Args:
+        matrix: Flat N*N latency array indexed by the region catalog, NaN where missing
+        size: N
+        users: Region IDs of the user regions
+        candidates: Region IDs that can be chosen
+        k: Number of regions to choose
+        objective: 'center' (worst case) or 'median' (average)
+        method: 'exact', 'greedy' or 'auto' (exact when small enough)
+        max_combinations: Largest number of combinations solved exactly
+
+    Returns:
+        Placement: The chosen region IDs and the resulting latencies
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Invalid objective. Must be one of: {', '.join(OBJECTIVES)}")
+    if method not in METHODS:
+        raise ValueError(f"Invalid method. Must be one of: {', '.join(METHODS)}")
+    if not users or not candidates:
+        raise ValueError("At least one user and one candidate region are required")
+    if not 1 <= k <= min(len(candidates), MAX_K):
+        raise ValueError(f"k must be between 1 and {min(len(candidates), MAX_K)}")
+    combinations_count = comb(len(candidates), k)
+    if method == 'exact' and combinations_count > max_combinations:
+        raise ValueError(f"Too many combinations ({combinations_count}) to solve exactly, "
+                         f"use method 'greedy' or 'auto'")
+
+    distances = placement_distances(matrix, size, users, candidates)
+    if method == 'auto':
+        method = 'exact' if combinations_count <= max_combinations else 'greedy'
+    if method == 'exact':
+        chosen = solve_exact(distances, k, objective)
+    else:
+        chosen = solve_greedy(distances, k, objective)
+
+    chosen_distances = distances[:, chosen]
+    served = chosen_distances.min(axis=1)
+    closest = chosen_distances.argmin(axis=1)
+    return Placement(
+        regions=[int(candidates[c]) for c in chosen],
+        objective=objective,
+        worst_latency=float(served.max()),
+        mean_latency=float(served.mean()),
+        assignment=[int(candidates[chosen[c]]) for c in closest],
+        method=method
+    )
+
+
+def _take(iterator, n):
+    for _, value in zip(range(n), iterator):
+        yield value
@@ -0,0 +1,158 @@
+"""
+Percentile queries answered by merging daily latency sketches.
+
+Every PingTestDaily rollup carries a LatencySketch of one region pair for
+one day. Merging the sketches of the requested days and region pairs gives
+any percentile over any window at day granularity, within the sketch's 1%
+relative error, without touching the raw PingTest table.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from chalicelib.shared.region_catalog import get_region_catalog
+from chalicelib.shared.sketch import merge_sketches
+from chalicelib.shared.tiered_storage import query_sketches
+
+MAX_WINDOW_DAYS = 366
+MAX_SOURCE_REGIONS = 50
+QUERY_WORKERS = 16
+
+# Window lengths used when a custom percentile is combined with a timeframe
+TIMEFRAME_DAYS = {'1D': 1, '1W': 7, '1M': 30, '1Y': 365}
+
+
+def parse_day(value):
+    """Parse a YYYY-MM-DD date or ISO timestamp into a YYYY-MM-DD day."""
+    return datetime.fromisoformat(value.replace('Z', '')[:10]).strftime('%Y-%m-%d')
+
+
+def parse_window(start, end, default_days=7):
+    """
+    Resolve the first and last day of a query window.
+
+    Raises:
+        ValueError: If the dates are invalid or the window is too long
+    """
+    last_day = parse_day(end) if end else datetime.utcnow().strftime('%Y-%m-%d')
+    if start:
+        first_day = parse_day(start)
+    else:
+        first_day = (datetime.fromisoformat(last_day) - timedelta(days=default_days - 1)).strftime('%Y-%m-%d')
+
+    days = (datetime.fromisoformat(last_day) - datetime.fromisoformat(first_day)).days + 1
+    if days < 1:
+        raise ValueError("'start' must not be after 'end'")
+    if days > MAX_WINDOW_DAYS:
+        raise ValueError(f"Window must not exceed {MAX_WINDOW_DAYS} days")
+    return first_day, last_day
+
+
+def parse_percentiles(value):
+    """Parse a comma separated list of percentiles between 0 and 100."""
+    percentiles = [float(p) for p in value.split(',') if p.strip()]
+    if not percentiles or any(p < 0 or p > 100 for p in percentiles):
+        raise ValueError("Percentiles must be numbers between 0 and 100")
+    return percentiles
+
+
+def parse_percentile(value):
+    """Parse a single percentile given as 'p_95', 'p95' or '95'."""
+    try:
+        percentile = float(value.lower().replace('p_', '').replace('p', ''))
+    except ValueError:
+        raise ValueError(f"Invalid percentile '{value}'. Use a number between 0 and 100, e.g. 'p_95'")
+    if not 0 <= percentile <= 100:
+        raise ValueError("Percentile must be between 0 and 100")
+    return percentile
+
+
+def percentile_key(percentile):
+    """Name a percentile like the stored averages do, e.g. 95 -> 'p_95'."""
+    return f"p_{percentile:g}"
+
+
+def merged_sketch(rollups_table, regions_from, regions_to, first_day, last_day):
+    """Merge the daily sketches of every (from, to) pair over the window."""
+    if len(regions_from) > MAX_SOURCE_REGIONS:
+        raise ValueError(f"At most {MAX_SOURCE_REGIONS} source regions can be merged")
+
+    blobs = []
+    for region_from in regions_from:
+        sketches = query_sketches(rollups_table, region_from, first_day, last_day, regions_to)
+        for region_sketches in sketches.values():
+            blobs.extend(region_sketches)
+    return merge_sketches(blobs)
+
+
+def query_sketches_with_client(client, table_name, region_name, first_day, last_day, regions_to=None):
+    """
+    tiered_storage.query_sketches over a low-level DynamoDB client.
+
+    Returns:
+        dict: {region_to: [serialized sketch, ...]}
+    """
+    sketches = {}
+    pages = client.get_paginator('query').paginate(
+        TableName=table_name,
+        KeyConditionExpression='#region = :region AND #day_to BETWEEN :first AND :last',
+        ProjectionExpression='#to, #sketch',
+        ExpressionAttributeNames={
+            '#region': 'region', '#day_to': 'day_region_to', '#to': 'regionTo', '#sketch': 'sketch'
+        },
+        ExpressionAttributeValues={
+            ':region': {'S': region_name}, ':first': {'S': f"{first_day}#"}, ':last': {'S': f"{last_day}#~"}
+        }
+    )
+    for page in pages:
+        for item in page['Items']:
+            if 'sketch' not in item:
+                continue
+            region_to = item['regionTo']['S']
+            if regions_to is not None and region_to not in regions_to:
+                continue
+            sketches.setdefault(region_to, []).append(item['sketch']['B'])
+    return sketches
+
+
+def sketch_matrix(rollups_table, regions_from, first_day, last_day, percentile, regions_to=None):
+    """
+    Build a flat latency matrix of one percentile from the daily sketches.
+
+    Source regions are queried in parallel, one rollup query each, so the
+    response time depends on the window length rather than on the amount
+    of raw data behind it.
+
+    Returns:
+        tuple: (RegionCatalog, numpy.ndarray of size N*N, total sample count)
+    """
+    if len(regions_from) > MAX_SOURCE_REGIONS:
+        raise ValueError(f"At most {MAX_SOURCE_REGIONS} source regions can be queried")
+
+    # boto3 resources are not thread-safe, their low-level client is
+    client = rollups_table.meta.client
+    table_name = rollups_table.name
+
+    def query(region_from):
+        return region_from, query_sketches_with_client(
+            client, table_name, region_from, first_day, last_day, regions_to
+        )
+
+    with ThreadPoolExecutor(max_workers=min(QUERY_WORKERS, max(len(regions_from), 1))) as executor:
+        results = list(executor.map(query, regions_from))
+
+    catalog = get_region_catalog(
+        name for region_from, sketches in results for name in (region_from, *sketches)
+    )
+    matrix = np.full(catalog.size * catalog.size, np.nan)
+    samples = 0
+    for region_from, sketches in results:
+        for region_to, blobs in sketches.items():
+            sketch = merge_sketches(blobs)
+            if not sketch.count:
+                continue
+            samples += sketch.count
+            matrix[catalog.pair_index_by_name(region_from, region_to)] = sketch.quantile(percentile / 100)
+    return catalog, matrix, samples
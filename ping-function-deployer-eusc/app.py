@@ -9,6 +9,7 @@ hardcoded in the EUSC_REGIONS list. Update this list as new regions become avail
 """
 
 from chalice import Chalice, Cron
+from chalicelib.shared.instrumentation import instrumented, span, count
 import boto3
 import json
 import hashlib
@@ -223,6 +224,7 @@ def deploy_lambda(source_function_name, target_function_name, region):
 
 
 @app.schedule(Cron("0", "5,11,17,23", "*", "*", "?", "*"))
+@instrumented('deploy')
 def deploy(event):
     """
     Main handler for deploying Lambda functions across EUSC regions.
@@ -237,7 +239,8 @@ def deploy(event):
         skip_regions = [EUSC_HUB_REGION]
 
         # Get enabled EUSC regions
-        regions = get_enabled_regions()
+        with span('get_regions'):
+            regions = get_enabled_regions()
         print(f"Found {len(regions)} enabled EUSC regions")
 
         results = {}
@@ -247,7 +250,9 @@ def deploy(event):
                 continue
 
             print(f"Processing EUSC region {region}")
-            success = deploy_lambda(source_function, target_function, region)
+            with span('deploy_region'):
+                success = deploy_lambda(source_function, target_function, region)
+            count('regions_deployed' if success else 'regions_failed')
             results[region] = 'SUCCESS' if success else 'FAILED'
 
         return {
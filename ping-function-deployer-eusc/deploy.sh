@@ -0,0 +1,7 @@
+#!/bin/bash
+
+# Chalice does not package symlinks, so chalicelib/shared is a copy of shared/
+python "$(dirname "$0")/../tools/sync_shared.py" ping-function-deployer-eusc
+
+cd "$(dirname "$0")"
+chalice deploy --stage prod
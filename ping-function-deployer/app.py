@@ -1,4 +1,5 @@
 from chalice import Chalice, Cron
+from chalicelib.shared.instrumentation import instrumented, span, count
 import boto3
 import json
 import hashlib
@@ -189,7 +190,27 @@ def deploy_lambda(source_function_name, target_function_name, region):
         print(f"Error deploying to {region}: {str(e)}")
         return False
 
+SOURCE_FUNCTION = "ping_from_region-prod-ping"
+TARGET_FUNCTION = "ping_from_region-prod-ping"
+SKIP_REGIONS = ["us-east-2"]
+
+def deploy_to_regions(regions):
+    """Deploy the ping function to each region, returns {region: 'SUCCESS' | 'FAILED'}."""
+    results = {}
+    for region in regions:
+        if region in SKIP_REGIONS:
+            print(f"Skipping {region} as requested")
+            continue
+
+        print(f"Processing region {region}")
+        with span('deploy_region'):
+            success = deploy_lambda(SOURCE_FUNCTION, TARGET_FUNCTION, region)
+        count('regions_deployed' if success else 'regions_failed')
+        results[region] = 'SUCCESS' if success else 'FAILED'
+    return results
+
 @app.schedule(Cron("0", "5,11,17,23", "*", "*", "?", "*"))
+@instrumented('deploy')
 def deploy(event):
     """
     Main handler for deploying Lambda functions across regions.
@@ -202,23 +223,12 @@ def deploy(event):
     }
     """
     try:
-        source_function = "ping_from_region-prod-ping"
-        target_function = "ping_from_region-prod-ping"
-        skip_regions = ["us-east-2"]
-        
         # Get enabled regions
-        regions = get_enabled_regions()
+        with span('get_regions'):
+            regions = get_enabled_regions()
         print(f"Found {len(regions)} enabled regions")
         
-        results = {}
-        for region in regions:
-            if region in skip_regions:
-                print(f"Skipping {region} as requested")
-                continue
-
-            print(f"Processing region {region}")
-            success = deploy_lambda(source_function, target_function, region)
-            results[region] = 'SUCCESS' if success else 'FAILED'
+        results = deploy_to_regions(regions)
 
         return {
             'statusCode': 200,
@@ -235,6 +245,39 @@ def deploy(event):
             'statusCode': 500,
             'body': {'error': error_msg}
         }
+
+@app.lambda_function()
+@instrumented('deploy_regions')
+def deploy_regions(event, context):
+    """
+    Deploy to the given regions only, invoked by the account region manager
+    as soon as regions finish enabling.
+
+    Expected event format:
+    {
+        "regions": ["region1", "region2"]
+    }
+    """
+    try:
+        regions = event.get('regions', [])
+        print(f"Deploying to {len(regions)} newly enabled regions")
+        results = deploy_to_regions(regions)
+
+        return {
+            'statusCode': 200,
+            'body': {
+                'message': f"Processed {len(regions)} regions",
+                'results': results
+            }
+        }
+
+    except Exception as e:
+        error_msg = f"Unexpected error: {str(e)}"
+        print(error_msg)
+        return {
+            'statusCode': 500,
+            'body': {'error': error_msg}
+        }
     
 if __name__ == "__main__":
     deploy(None)
\ No newline at end of file
@@ -0,0 +1,90 @@
+"""
+Self-hosted probe agent: the measurements of the ping Lambda, run
+continuously from an on-prem or colo site (see chalicelib/agent.py).
+
+Items use the PingTest schema with the site name as source region and are
+written to the PingTest table (AWS credentials with dynamodb:BatchWriteItem,
+plus dynamodb:Scan/GetItem on the regions table when --targets is not given)
+or to local files.
+
+Usage:
+    python agent.py --site onprem-fra1 --interval 60
+    python agent.py --site colo-ams1 --targets us-east-1,eu-west-1 --sink file:/var/lib/cloudping
+"""
+
+import argparse
+import os
+import signal
+
+from chalicelib.agent import ProbeAgent, DynamoDBSink, FileSink
+
+
+def registry_targets():
+    """Enabled regions of the region registry, in catalog order like the Lambda."""
+    import boto3
+    from chalicelib.shared.region_catalog import get_region_catalog
+    from chalicelib.shared.region_registry import get_region_registry
+
+    registry = get_region_registry(lambda: boto3.client('dynamodb', region_name="us-east-2"))
+    records = registry.enabled()
+    catalog = get_region_catalog(record.name for record in records)
+    records.sort(key=lambda record: catalog.id(record.name))
+    return [{'RegionName': record.name, 'partition': record.partition} for record in records]
+
+
+def parse_targets(value):
+    """'us-east-1,eusc-de-east-1:aws-eusc' -> target dicts (partition defaults to aws)."""
+    targets = []
+    for entry in filter(None, (part.strip() for part in value.split(','))):
+        name, _, partition = entry.partition(':')
+        targets.append({'RegionName': name, 'partition': partition or 'aws'})
+    return targets
+
+
+def get_sink(spec, table_name):
+    if spec.startswith('file:'):
+        return FileSink(spec[len('file:'):], table_name)
+    if spec == 'dynamodb':
+        import boto3
+        return DynamoDBSink(lambda: boto3.client('dynamodb', region_name="us-east-2"), table_name)
+    raise ValueError(f"Unknown sink: {spec} (expected dynamodb or file:DIRECTORY)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--site', default=os.environ.get('AGENT_SITE'), required='AGENT_SITE' not in os.environ,
+                        help='Source region name written to the items, e.g. onprem-fra1')
+    parser.add_argument('--partition', default=os.environ.get('AGENT_PARTITION', 'aws'))
+    parser.add_argument('--targets', default=os.environ.get('AGENT_TARGETS'),
+                        help='Comma separated regions (region[:partition]), default: the region registry')
+    parser.add_argument('--sink', default=os.environ.get('AGENT_SINK', 'dynamodb'),
+                        help='dynamodb or file:DIRECTORY')
+    parser.add_argument('--table', default=os.environ.get('PING_TEST_TABLE', 'PingTest'))
+    parser.add_argument('--port', type=int, default=443)
+    parser.add_argument('--interval', type=float, default=float(os.environ.get('AGENT_INTERVAL', '60')),
+                        help='Seconds between two probe runs of the same target')
+    parser.add_argument('--concurrency', type=int, default=int(os.environ.get('AGENT_CONCURRENCY', '4')))
+    parser.add_argument('--buffer-size', type=int, default=10000)
+    parser.add_argument('--flush-interval', type=float, default=30.0)
+    parser.add_argument('--verbose', action='store_true', help='Print every connection attempt')
+    args = parser.parse_args()
+
+    if args.targets:
+        targets = parse_targets(args.targets)
+        targets_factory = lambda: targets  # noqa: E731
+    else:
+        targets_factory = registry_targets
+
+    agent = ProbeAgent(
+        targets_factory, args.site, get_sink(args.sink, args.table),
+        partition=args.partition, port=args.port, interval=args.interval,
+        concurrency=args.concurrency, buffer_size=args.buffer_size,
+        flush_interval=args.flush_interval, log=print if args.verbose else None
+    )
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: agent.stop())
+    agent.run()
+
+
+if __name__ == "__main__":
+    main()
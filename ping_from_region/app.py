@@ -1,33 +1,62 @@
 from chalice import Chalice, Cron
-from timeit import default_timer as timer
+from chalicelib.shared.tiered_storage import expiry_epoch, HOT_RETENTION_DAYS, TTL_ATTRIBUTE
+from chalicelib.shared.region_registry import get_region_registry
+from chalicelib.shared.region_catalog import get_region_catalog
+from chalicelib.shared.batch_writer import PipelinedBatchWriter
+from chalicelib.shared.run_records import build_run_item, RUNS_TABLE
+from chalicelib.probe_budget import ProbePlanner
+from chalicelib.probe import (
+    probe_target, run_destination, max_attempts, get_current_time,
+    SAMPLING_MODE, SAMPLING_INTERVAL, CONNECT_TIMEOUT, RESULTS_PACKED_FORMAT
+)
+from concurrent.futures import ThreadPoolExecutor
+from chalicelib.shared.instrumentation import (
+    instrumented, span, count as count_metric, set_property
+)
 
-import datetime
-import socket
-import signal
-import boto3
 import json
+import os
 import time
-import sys
 
 app = Chalice(app_name='ping_from_region')
 
-# Cross-partition utilities (inlined to avoid packaging issues with Chalice)
+# Sampling and results encoding are configured in chalicelib/probe.py
+
+# Results layout: "items" writes one PingTest item per destination, "run"
+# writes a single PingTestRuns item per probe run holding every destination
+# (see shared.run_records), "both" writes both while migrating readers,
+# who keep reading PingTest until the layout is "run"
+RESULTS_LAYOUT = os.environ.get('RESULTS_LAYOUT', 'items')
+
+# Results are written in the background while probing continues, with up to
+# WRITER_MAX_IN_FLIGHT concurrent batch writes. The final flush gives up
+# after WRITER_FLUSH_TIMEOUT seconds, shared by every writer.
+WRITER_MAX_IN_FLIGHT = int(os.environ.get('WRITER_MAX_IN_FLIGHT', '4'))
+WRITER_FLUSH_TIMEOUT = float(os.environ.get('WRITER_FLUSH_TIMEOUT', '30'))
+
+# Probe budgeting (see chalicelib/probe_budget.py). Runs are planned against
+# the remaining Lambda time minus the final flush and a safety margin. When
+# the attempts do not fit sequentially, up to PROBE_MAX_CONCURRENCY targets
+# are probed at once before attempts per target are reduced. An attempt is
+# planned at its worst case, a timeout, since failing targets are the ones
+# that would run past the budget.
+PROBE_ATTEMPT_ESTIMATE = float(os.environ.get('PROBE_ATTEMPT_ESTIMATE', CONNECT_TIMEOUT))
+PROBE_MAX_CONCURRENCY = int(os.environ.get('PROBE_MAX_CONCURRENCY', '4'))
+PROBE_SAFETY_MARGIN = 5
+
+# Cross-partition utilities (inlined to avoid packaging issues with Chalice).
+# boto3 is imported on first use, like shared/lazy_clients.py does, so it is
+# not part of the app's import at cold start.
 
 def get_current_partition():
     """Detect the AWS partition from the current region."""
+    import boto3
     region = boto3.session.Session().region_name
     if region and region.startswith('eusc-'):
         return 'aws-eusc'
     return 'aws'
 
 
-def get_dns_suffix(partition=None):
-    """Get the DNS suffix for the given partition."""
-    if partition is None:
-        partition = get_current_partition()
-    return 'amazonaws.eu' if partition == 'aws-eusc' else 'amazonaws.com'
-
-
 def get_cross_partition_dynamodb_client(region='us-east-2'):
     """
     Get a DynamoDB client for writing to main AWS from any partition.
@@ -35,6 +64,7 @@ def get_cross_partition_dynamodb_client(region='us-east-2'):
     When running in EUSC, this retrieves stored credentials from Secrets Manager
     to authenticate to main AWS. When running in main AWS, it uses the IAM role.
     """
+    import boto3
     partition = get_current_partition()
 
     if partition == 'aws':
@@ -55,12 +85,8 @@ def get_cross_partition_dynamodb_client(region='us-east-2'):
     )
 
 
-def get_current_time():
-    time = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + "Z"
-    return time
-
-
 def get_curr_region():
+    import boto3
     my_session = boto3.session.Session()
     my_region = my_session.region_name
     return my_region
@@ -71,223 +97,106 @@ def get_regions():
     Get all regions from both partitions via DynamoDB.
 
     This reads from the cloudping_regions_enhanced table which contains
-    regions from both main AWS and EUSC partitions.
+    regions from both main AWS and EUSC partitions. The table is cached in
+    the region registry across warm invocations.
     """
-    dynamodb_client = get_cross_partition_dynamodb_client()
-
-    response = dynamodb_client.scan(TableName='cloudping_regions_enhanced')
-
-    regions = []
-    for item in response.get('Items', []):
-        status = item.get('status', {}).get('S', '')
-        if status in ['ENABLED', 'ENABLED_BY_DEFAULT']:
-            regions.append({
-                'RegionName': item['region_name']['S'],
-                'partition': item.get('partition', {'S': 'aws'})['S']
-            })
-
-    # Handle pagination
-    while 'LastEvaluatedKey' in response:
-        response = dynamodb_client.scan(
-            TableName='cloudping_regions_enhanced',
-            ExclusiveStartKey=response['LastEvaluatedKey']
-        )
-        for item in response.get('Items', []):
-            status = item.get('status', {}).get('S', '')
-            if status in ['ENABLED', 'ENABLED_BY_DEFAULT']:
-                regions.append({
-                    'RegionName': item['region_name']['S'],
-                    'partition': item.get('partition', {'S': 'aws'})['S']
-                })
-
-    return regions
-
-
-def getResults(failed, count, passed):
-    """ Summarize Results """
-
-    lRate = 0
-    if failed != 0:
-        lRate = failed / (count) * 100
-        lRate = "%.2f" % lRate
-
-    print("\nTCP Ping Results: Connections (Total/Pass/Fail): [{:}/{:}/{:}] (Failed: {:}%)".format((count), passed, failed, str(lRate)))
-    # avg min max port region regionTo attempts address
-    # results list: [{ "seq" "time"}]
-
-
-def chunk_list(lst, chunk_size):
-    """Split a list into smaller chunks of specified size"""
-    return [lst[i:i + chunk_size] for i in range(0, len(lst), chunk_size)]
-
-
-def handle_unprocessed_items(client, unprocessed_items, max_retries=3):
-    """Handle any unprocessed items with exponential backoff"""
-    items = unprocessed_items
-    retries = 0
-    base_delay = 0.1  # 100ms
-
-    while items and retries < max_retries:
-        # Exponential backoff
-        delay = base_delay * (2 ** retries)
-        time.sleep(delay)
+    registry = get_region_registry(get_cross_partition_dynamodb_client)
+    records = registry.enabled()
 
-        try:
-            response = client.batch_write_item(RequestItems=items)
-            items = response.get('UnprocessedItems', {})
-            retries += 1
+    # Probe targets in catalog ID order so every run visits them in the same order
+    catalog = get_region_catalog(record.name for record in records)
+    records.sort(key=lambda record: catalog.id(record.name))
 
-            if items:
-                print(f"Retry {retries}: {len(items)} items remaining")
-        except Exception as e:
-            print(f"Error during retry: {str(e)}")
-            raise
+    return [
+        {'RegionName': record.name, 'partition': record.partition}
+        for record in records
+    ]
 
-    if items:
-        print(f"Warning: {len(items)} items remained unprocessed after all retries")
 
-    return items
-
-
-def write_results(results):
-    """Write results to DynamoDB with chunking and retry logic"""
+def get_result_writer(table_name='PingTest'):
+    """Background writer for result items in main AWS (see shared.batch_writer)."""
     # Use cross-partition client to write to main AWS DynamoDB
     client = get_cross_partition_dynamodb_client(region='us-east-2')
+    return PipelinedBatchWriter(client, table_name, max_in_flight=WRITER_MAX_IN_FLIGHT)
 
-    # Split into chunks of 25 (DynamoDB's limit)
-    chunk_size = 25
-    chunks = chunk_list(results, chunk_size)
-
-    print(f"Split {len(results)} items into {len(chunks)} chunks")
-
-    # Process each chunk
-    for i, chunk in enumerate(chunks, 1):
-        try:
-            print(f"Processing chunk {i} of {len(chunks)}")
-            response = client.batch_write_item(
-                RequestItems={
-                    'PingTest': chunk
-                }
-            )
-
-            # Handle any unprocessed items
-            if response.get('UnprocessedItems'):
-                print("Handling unprocessed items...")
-                unprocessed = handle_unprocessed_items(
-                    client,
-                    response['UnprocessedItems']
-                )
-                if unprocessed:
-                    print(f"Warning: Some items in chunk {i} were not processed")
-
-        except Exception as e:
-            print(f"Error processing chunk {i}: {str(e)}")
-            raise
+
+def get_probe_planner():
+    return ProbePlanner(
+        attempt_seconds=SAMPLING_INTERVAL + PROBE_ATTEMPT_ESTIMATE,
+        reserve_seconds=WRITER_FLUSH_TIMEOUT + PROBE_SAFETY_MARGIN,
+        max_concurrency=PROBE_MAX_CONCURRENCY,
+        min_attempts=1
+    )
 
 
 @app.schedule(Cron("0", "0,6,12,18", "*", "*", "?", "*"))
+@instrumented('ping')
 def ping(event):
     port = 443
-    regions = get_regions()
+    with span('get_regions'):
+        regions = get_regions()
     current_region = get_curr_region()
     current_partition = get_current_partition()
-    results = []
-
-    for region in regions:
-        # CloudPing Counters and Lists
-        times_list = []
-        details_list = []
-
-        # Pass/Fail counters
-        failed = 0
-
-        # Default to 4 connections max
-        maxCount = 5
-        count = 0
-        passed = 0
-
-        region_name = region['RegionName']
-        target_partition = region.get('partition', 'aws')
-
-        # Build partition-aware endpoint
-        dns_suffix = get_dns_suffix(target_partition)
-        endpoint = f'dynamodb.{region_name}.{dns_suffix}'
-
-        # Loop while less than max count or until Ctrl-C caught
-        while count < maxCount:
-
-            # Increment Counter
-            count += 1
-
-            success = False
-
-            # New Socket
-            s = socket.socket(
-            socket.AF_INET, socket.SOCK_STREAM)
-
-            # 1sec Timeout
-            s.settimeout(1)
-
-            # Start a timer
-            s_start = timer()
-
-            # Try to Connect
+    set_property('region', current_region)
+    count_metric('targets', len(regions))
+
+    # Chalice passes the Lambda context along with scheduled events
+    planner = get_probe_planner()
+    plan = planner.plan(len(regions), max_attempts(), getattr(event, 'context', None))
+    print(f"Probe plan: {plan.attempts} attempts per target, {plan.concurrency} targets at once"
+          f"{' (attempts reduced to fit the remaining time)' if plan.reduced else ''}")
+    set_property('planned_attempts', plan.attempts)
+    set_property('probe_concurrency', plan.concurrency)
+
+    run_timestamp = get_current_time()
+    writer = get_result_writer() if RESULTS_LAYOUT != 'run' else None
+    destinations = []
+    # Stamp the TTL so raw items age out of the hot tier,
+    # HOT_RETENTION_DAYS=0 keeps raw items forever
+    expires_at = {"N": str(expiry_epoch())} if HOT_RETENTION_DAYS > 0 else None
+
+    def probe_and_queue(region):
+        result = probe_target(region, port, current_region, current_partition, planner, plan)
+        if result is None:
+            return
+        item, attempt_times, kernel_rtts = result
+        if RESULTS_LAYOUT != 'items':
+            destinations.append(run_destination(item, attempt_times, kernel_rtts))
+        if writer is None:
+            return
+        if expires_at:
+            item[TTL_ATTRIBUTE] = expires_at
+        writer.put(item)
+
+    if plan.concurrency > 1:
+        with ThreadPoolExecutor(max_workers=plan.concurrency) as executor:
+            list(executor.map(probe_and_queue, regions))
+    else:
+        for region in regions:
+            probe_and_queue(region)
+
+    writers = [writer] if writer is not None else []
+    if destinations:
+        run_item = build_run_item(current_region, current_partition, run_timestamp, port,
+                                  SAMPLING_MODE, destinations, RESULTS_PACKED_FORMAT)
+        if expires_at:
+            run_item[TTL_ATTRIBUTE] = expires_at
+        runs_writer = get_result_writer(RUNS_TABLE)
+        runs_writer.put(run_item)
+        writers.append(runs_writer)
+
+    # Non-retryable write errors fail the invocation, after every writer is closed
+    # One flush is reserved by the planner, so the writers share its deadline
+    errors = []
+    deadline = time.monotonic() + WRITER_FLUSH_TIMEOUT
+    with span('write'):
+        for result_writer in writers:
             try:
-                s.connect((endpoint, int(port)))
-                s.shutdown(socket.SHUT_RD)
-                success = True
-
-            # Connection Timed Out
-            except socket.timeout:
-                print("Connection timed out!")
-                failed += 1
-            except OSError as e:
-                print("OS Error:", e)
-                failed += 1
-
-            # Stop Timer
-            s_stop = timer()
-            s_runtime = "%.2f" % (1000 * (s_stop - s_start))
-
-            if success:
-                times_list.append(float(s_runtime))
-                details_list.append({"M": {"seq": {"N": str((count-1))}, "time": {"N": str(float(s_runtime))}}})
-                print("Connected to %s[%s]: tcp_seq=%s time=%s ms" % (endpoint, port, (count-1), s_runtime))
-                passed += 1
-
-            # Sleep for 1sec
-            if count < maxCount:
-                time.sleep(1)
-
-        # Output Results when maxCount reached
-        getResults(failed, count, passed)
-
-        # Build the output data to be stored in DynamoDB
-        if times_list:  # Only store results if we had successful connections
-            minimum = min(times_list)
-            maximum = max(times_list)
-            add = sum(times_list)
-            length = len(times_list)
-            average = add / length
-            results.append({
-                "PutRequest": {
-                    "Item": {
-                        "avg": {"N": str(average)},
-                        "min": {"N": str(minimum)},
-                        "max": {"N": str(maximum)},
-                        "port": {"N": str(port)},
-                        "address": {"S": endpoint},
-                        "region": {"S": current_region},
-                        "regionTo": {"S": region_name},
-                        "partition": {"S": current_partition},
-                        "partitionTo": {"S": target_partition},
-                        "attempts": {"N": str(maxCount)},
-                        "attemptsSuccess": {"N": str(passed)},
-                        "results": {"L": details_list},
-                        "timestamp": {"S": get_current_time()}
-                    }
-                }
-            })
-
-    if results:
-        write_results(results)
+                summary = result_writer.close(timeout=max(0, deadline - time.monotonic()))
+            except Exception as e:
+                errors.append(e)
+                continue
+            print(f"Wrote {summary['written']} items to {result_writer.table_name} "
+                  f"({summary['retries']} retries, {summary['failed'] + summary['unwritten']} not written)")
+    if errors:
+        raise errors[0]
@@ -0,0 +1,319 @@
+"""
+Long-running probe agent for self-hosted sites.
+
+ProbeAgent runs the probe logic of chalicelib/probe.py continuously: every
+target gets a probe run every `interval` seconds, the runs of different
+targets are spread evenly over the interval, and at most `concurrency`
+runs are in progress at once. Each run produces the same PingTest item the
+Lambda writes, with the agent's site name as its source region.
+
+Items go into a bounded in-memory buffer that a background thread flushes
+in batches to a sink: DynamoDBSink (the PingTest table, through
+shared.batch_writer) or FileSink (DynamoDB JSON lines, one file per hour).
+When the sink cannot keep up the oldest buffered items are dropped and
+counted, so memory stays constant however long the agent runs.
+
+Every `metrics_interval` the agent emits one record of shared.instrumentation
+(attempts, runs, buffered, dropped and written items, ...).
+
+Usage:
+    agent = ProbeAgent(lambda: targets, 'onprem-fra1', FileSink('/var/lib/cloudping'))
+    agent.run()     # until agent.stop() or SIGTERM (see agent.py)
+"""
+
+import base64
+import heapq
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from chalicelib.probe import probe_target, max_attempts, SAMPLING_INTERVAL
+from chalicelib.probe_budget import ProbePlan
+from chalicelib.shared.instrumentation import invocation, count, set_property
+
+AGENT_FUNCTION_NAME = 'probe_agent'
+
+
+class ResultBuffer:
+    """Bounded FIFO of items waiting to be flushed, dropping the oldest when full."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.dropped = 0
+        self._items = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def put(self, item):
+        with self._lock:
+            if len(self._items) == self.capacity:
+                self.dropped += 1
+                count('items_dropped')
+            self._items.append(item)
+
+    def drain(self, max_items):
+        """Take up to max_items items, oldest first."""
+        with self._lock:
+            return [self._items.popleft() for _ in range(min(max_items, len(self._items)))]
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DynamoDBSink:
+    """Writes batches of items to a DynamoDB table, one PipelinedBatchWriter per flush."""
+
+    def __init__(self, client_factory, table_name='PingTest', max_in_flight=4, flush_timeout=30.0):
+        # The AWS dependencies are only needed when writing to DynamoDB
+        from chalicelib.shared.batch_writer import PipelinedBatchWriter
+        from chalicelib.shared.tiered_storage import expiry_epoch, HOT_RETENTION_DAYS, TTL_ATTRIBUTE
+
+        self._writer_class = PipelinedBatchWriter
+        self._expiry = (lambda: {TTL_ATTRIBUTE: {"N": str(expiry_epoch())}}) \
+            if HOT_RETENTION_DAYS > 0 else (lambda: {})
+        self.client_factory = client_factory
+        self.table_name = table_name
+        self.max_in_flight = max_in_flight
+        self.flush_timeout = flush_timeout
+        self._client = None
+
+    def write(self, items):
+        """Write items, returns the PipelinedBatchWriter summary."""
+        if self._client is None:
+            self._client = self.client_factory()
+        # A writer per flush keeps the writer's bookkeeping from growing
+        writer = self._writer_class(self._client, self.table_name, max_in_flight=self.max_in_flight)
+        expiry = self._expiry()
+        for item in items:
+            writer.put({**item, **expiry})
+        return writer.close(timeout=self.flush_timeout)
+
+    def close(self):
+        pass
+
+
+class FileSink:
+    """
+    Appends items to local files in the DynamoDB JSON export format (one
+    {"Item": ...} object per line, binary attributes base64 encoded), so
+    the files can be imported into the PingTest table later.
+    """
+
+    def __init__(self, directory, table_name='PingTest'):
+        self.directory = directory
+        self.table_name = table_name
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, now=None):
+        """One file per UTC hour."""
+        hour = (now or datetime.utcnow()).strftime('%Y-%m-%dT%H')
+        return os.path.join(self.directory, f"{self.table_name}-{hour}.json")
+
+    def write(self, items):
+        lines = [json.dumps({'Item': item}, default=_encode_binary) + '\n' for item in items]
+        with open(self.path(), 'a') as f:
+            f.writelines(lines)
+        count('items_written', len(lines))
+        return {'written': len(lines), 'failed': 0, 'unwritten': 0, 'retries': 0}
+
+    def close(self):
+        pass
+
+
+def _encode_binary(value):
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode('ascii')
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+class RunPlanner:
+    """
+    Planner of the agent's probe runs: the full attempts of the sampling
+    policy, cut short when a run would overlap the target's next run or the
+    agent stops.
+    """
+
+    def __init__(self, interval, stopping, clock=time.monotonic):
+        self.interval = interval
+        self.stopping = stopping
+        self.clock = clock
+
+    def plan(self):
+        return ProbePlan(max_attempts(), 1, self.clock() + self.interval, False)
+
+    def expired(self, plan):
+        return self.stopping.is_set() or self.clock() >= plan.deadline
+
+
+class ProbeAgent:
+    """Continuous, rate limited probing of a set of targets."""
+
+    def __init__(self, targets_factory, site, sink, partition='aws', port=443, interval=60.0,
+                 concurrency=4, buffer_size=10000, flush_interval=30.0, flush_batch=500,
+                 targets_refresh=3600.0, metrics_interval=60.0, log=None, clock=time.monotonic):
+        """
+        Args:
+            targets_factory: Returns the targets as [{'RegionName': ..., 'partition': ...}],
+                             called at start and every targets_refresh seconds
+            site: Source region name written to the items (e.g. 'onprem-fra1')
+            sink: DynamoDBSink or FileSink
+            partition: Source partition written to the items
+            interval: Seconds between two probe runs of the same target
+            concurrency: Most probe runs in progress at once
+            buffer_size: Most items held in memory before the oldest are dropped
+            flush_interval: Seconds between flushes of the buffer
+            flush_batch: Items per sink write; a full batch is flushed right away
+            log: Receives the per-attempt output of the probes (default: discarded)
+            clock: Returns the current time in seconds
+        """
+        self.targets_factory = targets_factory
+        self.site = site
+        self.sink = sink
+        self.partition = partition
+        self.port = port
+        self.interval = interval
+        self.concurrency = max(1, concurrency)
+        self.buffer = ResultBuffer(buffer_size)
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.targets_refresh = targets_refresh
+        self.metrics_interval = metrics_interval
+        self.log = log or (lambda *args: None)
+        self.clock = clock
+
+        self._stopping = threading.Event()
+        self._flush_now = threading.Event()
+        # Set once no run is in progress, the flusher then flushes one last time
+        self._drained = threading.Event()
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self.planner = RunPlanner(interval, self._stopping, clock)
+
+    def required_concurrency(self, targets):
+        """Concurrent runs needed to give every target its full attempts each interval."""
+        run_seconds = max_attempts() * (SAMPLING_INTERVAL + 0.5)
+        return max(1, math.ceil(targets * run_seconds / self.interval))
+
+    def stop(self):
+        """Stop sampling; run() flushes what is buffered and returns."""
+        self._stopping.set()
+        self._flush_now.set()
+
+    def run(self):
+        """Sample and flush until stop() is called."""
+        scheduler = threading.Thread(target=self._schedule, name='probe-scheduler', daemon=True)
+        flusher = threading.Thread(target=self._flush_loop, name='probe-flusher', daemon=True)
+        scheduler.start()
+        flusher.start()
+        try:
+            while not self._stopping.is_set():
+                with invocation(AGENT_FUNCTION_NAME):
+                    set_property('site', self.site)
+                    self._stopping.wait(self.metrics_interval)
+                    set_property('buffered', len(self.buffer))
+        finally:
+            self.stop()
+            with invocation(AGENT_FUNCTION_NAME):
+                set_property('site', self.site)
+                scheduler.join()
+                self._drained.set()
+                self._flush_now.set()
+                flusher.join()
+                self.sink.close()
+                if len(self.buffer):
+                    print(f"Warning: {len(self.buffer)} items were not written before stopping")
+                    count('items_unwritten', len(self.buffer))
+
+    def _load_targets(self):
+        try:
+            targets = {target['RegionName']: target for target in self.targets_factory()}
+        except Exception as e:
+            print(f"Error loading targets: {str(e)}")
+            return None
+        required = self.required_concurrency(len(targets))
+        if required > self.concurrency:
+            print(f"Warning: {len(targets)} targets every {self.interval:g}s need about "
+                  f"{required} concurrent runs, runs will be cut short at concurrency {self.concurrency}")
+        return targets
+
+    def _schedule(self):
+        """Start every target's runs on time, at most `concurrency` at once."""
+        targets = self._load_targets() or {}
+        refresh_at = self.clock() + self.targets_refresh
+        # (due, target name), spread evenly over the first interval
+        start = self.clock()
+        queue = [(start + i * self.interval / len(targets), name) for i, name in enumerate(targets)]
+        heapq.heapify(queue)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='probe') as executor:
+            while not self._stopping.is_set():
+                now = self.clock()
+                if now >= refresh_at:
+                    refreshed = self._load_targets()
+                    if refreshed is not None:
+                        added = [name for name in refreshed if name not in targets]
+                        targets = refreshed
+                        for i, name in enumerate(added):
+                            heapq.heappush(queue, (now + i * self.interval / len(added), name))
+                    refresh_at = now + self.targets_refresh
+                if not queue:
+                    self._stopping.wait(min(self.targets_refresh, self.interval))
+                    continue
+
+                due, name = queue[0]
+                if due > now:
+                    self._stopping.wait(min(due - now, max(refresh_at - now, 0)))
+                    continue
+                heapq.heappop(queue)
+                if name not in targets:
+                    continue  # Removed by a refresh
+
+                # Wait for a free slot instead of queueing runs without bound
+                while not self._slots.acquire(timeout=1.0):
+                    if self._stopping.is_set():
+                        return
+                if self.clock() - due > self.interval:
+                    count('late_runs')
+                executor.submit(self._probe, targets[name])
+                heapq.heappush(queue, (max(due + self.interval, self.clock()), name))
+
+    def _probe(self, target):
+        try:
+            result = probe_target(target, self.port, self.site, self.partition,
+                                  self.planner, self.planner.plan(),
+                                  log=self.log, sleep=self._stopping.wait)
+            count('runs')
+            if result is not None:
+                self.buffer.put(result[0])
+                if len(self.buffer) >= self.flush_batch:
+                    self._flush_now.set()
+        except Exception as e:
+            print(f"Error probing {target['RegionName']}: {str(e)}")
+            count('run_errors')
+        finally:
+            self._slots.release()
+
+    def _flush_loop(self):
+        while True:
+            self._flush_now.wait(self.flush_interval)
+            self._flush_now.clear()
+            drained = self._drained.is_set()
+            self._flush()
+            if drained:
+                return
+
+    def _flush(self):
+        """Write everything buffered, in batches of flush_batch items."""
+        while len(self.buffer):
+            items = self.buffer.drain(self.flush_batch)
+            try:
+                summary = self.sink.write(items)
+            except Exception as e:
+                print(f"Error writing {len(items)} items: {str(e)}")
+                count('items_unwritten', len(items))
+                return
+            if summary['failed'] or summary['unwritten']:
+                return  # The sink is struggling, keep the rest for the next flush
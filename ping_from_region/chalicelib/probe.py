@@ -0,0 +1,426 @@
+"""
+TCP connect probes and the sampling policy of ping_from_region.
+
+The probe logic has no AWS or Chalice dependencies: the Lambda (app.py)
+and the self-hosted agent (agent.py) both sample targets with
+probe_target and store the PingTest items it builds.
+
+A probe run against one target makes TCP connection attempts to the
+target region's DynamoDB endpoint until the sampling policy is satisfied
+("fixed": FIXED_ATTEMPTS attempts, "adaptive": until the median is
+stable) or the run's plan stops it, see probe_budget.py.
+
+The endpoint resolves to many front-end addresses. By default every
+attempt connects to the hostname, i.e. whichever address the resolver
+returns first. With ADDRESS_SAMPLE_SIZE set, the run resolves every A/AAAA
+address once, samples up to that many and spreads its attempts across
+them, one concurrent attempt per address at a time, so a single front end
+cannot dominate the run. The item then records the sampled addresses and
+the address of every attempt.
+"""
+
+import datetime
+import math
+import os
+import random
+import socket
+import statistics
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+
+from chalicelib.shared.instrumentation import span, count as count_metric
+from chalicelib.shared.result_encoding import (
+    encode_samples, SAMPLES_ATTRIBUTE, RTT_SAMPLES_ATTRIBUTE, RTTVAR_SAMPLES_ATTRIBUTE,
+    FRONTENDS_ATTRIBUTE, FRONTEND_INDEX_ATTRIBUTE
+)
+
+# Sampling configuration. "fixed" keeps the historical 5 attempts per target,
+# "adaptive" stops early once the median is stable and keeps sampling noisy
+# or failing targets up to SAMPLING_MAX_ATTEMPTS.
+SAMPLING_MODE = os.environ.get('SAMPLING_MODE', 'fixed')
+FIXED_ATTEMPTS = 5
+SAMPLING_MIN_ATTEMPTS = int(os.environ.get('SAMPLING_MIN_ATTEMPTS', '3'))
+SAMPLING_MAX_ATTEMPTS = int(os.environ.get('SAMPLING_MAX_ATTEMPTS', '10'))
+SAMPLING_INTERVAL = float(os.environ.get('SAMPLING_INTERVAL', '1'))
+# Adaptive sampling stops once the 95% CI half-width of the median is within
+# this fraction of the median (or below the absolute floor, in ms)
+SAMPLING_CI_TOLERANCE = float(os.environ.get('SAMPLING_CI_TOLERANCE', '0.05'))
+SAMPLING_CI_FLOOR_MS = 0.5
+
+# Per-attempt results encoding: "list" keeps the legacy list of maps,
+# "packed" writes a single binary samples attribute (see shared.result_encoding)
+RESULTS_ENCODING = os.environ.get('RESULTS_ENCODING', 'list')
+RESULTS_PACKED_FORMAT = int(os.environ.get('RESULTS_PACKED_FORMAT', '1'))
+
+CONNECT_TIMEOUT = 1
+# Front-end addresses sampled per run, 0 connects to the hostname
+ADDRESS_SAMPLE_SIZE = min(int(os.environ.get('ADDRESS_SAMPLE_SIZE', '0')), 255)
+
+# Kernel RTT of each connection from TCP_INFO (Linux only): "auto" reads it
+# where the platform supports it, "off" never does
+KERNEL_RTT = os.environ.get('KERNEL_RTT', 'auto')
+# struct tcp_info: 8 single-byte fields, then u32 fields from tcpi_rto on;
+# tcpi_rtt and tcpi_rttvar (microseconds) are the 16th and 17th of those
+_TCP_INFO_RTT = struct.Struct('=II')
+_TCP_INFO_RTT_OFFSET = 8 + 15 * 4
+_TCP_INFO_LENGTH = 104
+
+
+def get_dns_suffix(partition='aws'):
+    """Get the DNS suffix for the given partition."""
+    return 'amazonaws.eu' if partition == 'aws-eusc' else 'amazonaws.com'
+
+
+def get_current_time():
+    time = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + "Z"
+    return time
+
+
+def getResults(failed, count, passed, log=print):
+    """ Summarize Results """
+
+    lRate = 0
+    if failed != 0:
+        lRate = failed / (count) * 100
+        lRate = "%.2f" % lRate
+
+    log("\nTCP Ping Results: Connections (Total/Pass/Fail): [{:}/{:}/{:}] (Failed: {:}%)".format((count), passed, failed, str(lRate)))
+    # avg min max port region regionTo attempts address
+    # results list: [{ "seq" "time"}]
+
+
+def median_ci_half_width(times_list):
+    """
+    Approximate 95% confidence interval half-width of the median, in ms.
+
+    The spread is estimated from the median absolute deviation so a single
+    slow connection does not keep an otherwise stable target sampling.
+    """
+    n = len(times_list)
+    if n < 2:
+        return float('inf')
+    median = statistics.median(times_list)
+    mad = statistics.median([abs(t - median) for t in times_list])
+    sigma = 1.4826 * mad
+    return 1.96 * 1.2533 * sigma / math.sqrt(n)
+
+
+def max_attempts(mode=None):
+    """Most attempts the sampling policy makes against one target."""
+    if mode is None:
+        mode = SAMPLING_MODE
+    return SAMPLING_MAX_ATTEMPTS if mode == 'adaptive' else FIXED_ATTEMPTS
+
+
+def should_continue_sampling(count, times_list, mode=None, attempt_limit=None):
+    """
+    Decide whether another attempt should be made against the current target.
+
+    attempt_limit lowers the policy's maximum, e.g. when the run is short on time.
+    """
+    if mode is None:
+        mode = SAMPLING_MODE
+    if attempt_limit is None:
+        attempt_limit = max_attempts(mode)
+
+    if mode != 'adaptive':
+        return count < min(FIXED_ATTEMPTS, attempt_limit)
+
+    if count >= min(SAMPLING_MAX_ATTEMPTS, attempt_limit):
+        return False
+    # Failures do not count towards the minimum, so failing targets get extra attempts
+    if count < SAMPLING_MIN_ATTEMPTS or len(times_list) < SAMPLING_MIN_ATTEMPTS:
+        return True
+
+    tolerance = max(SAMPLING_CI_TOLERANCE * statistics.median(times_list), SAMPLING_CI_FLOOR_MS)
+    return median_ci_half_width(times_list) > tolerance
+
+
+def kernel_rtt_supported():
+    return KERNEL_RTT != 'off' and hasattr(socket, 'TCP_INFO')
+
+
+def read_kernel_rtt(s):
+    """
+    Smoothed RTT and RTT variance the kernel keeps for a connected socket.
+
+    Right after connect both come from the handshake, without the
+    interpreter and scheduling overhead of the wall-clock connect time.
+
+    Returns:
+        tuple: (rtt_us, rttvar_us), or None where TCP_INFO is not available
+    """
+    if not kernel_rtt_supported():
+        return None
+    try:
+        info = s.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, _TCP_INFO_LENGTH)
+    except OSError:
+        return None
+    if len(info) < _TCP_INFO_RTT_OFFSET + _TCP_INFO_RTT.size:
+        return None
+    rtt_us, rttvar_us = _TCP_INFO_RTT.unpack_from(info, _TCP_INFO_RTT_OFFSET)
+    return (rtt_us, rttvar_us) if rtt_us else None
+
+
+def resolve_addresses(endpoint, port, resolver=socket.getaddrinfo):
+    """
+    Resolve every A and AAAA address of an endpoint.
+
+    Returns:
+        list: (family, address) tuples in resolver order without duplicates,
+              empty when the endpoint does not resolve
+    """
+    try:
+        infos = resolver(endpoint, port, 0, socket.SOCK_STREAM)
+    except OSError:
+        return []
+    addresses = []
+    for family, _, _, _, sockaddr in infos:
+        if family in (socket.AF_INET, socket.AF_INET6) and (family, sockaddr[0]) not in addresses:
+            addresses.append((family, sockaddr[0]))
+    return addresses
+
+
+def sample_addresses(addresses, size=None, rng=random):
+    """Pick up to `size` (default ADDRESS_SAMPLE_SIZE) of the resolved addresses at random."""
+    if size is None:
+        size = ADDRESS_SAMPLE_SIZE
+    return rng.sample(addresses, size) if len(addresses) > size else list(addresses)
+
+
+def connect_attempt(endpoint, port, timeout=CONNECT_TIMEOUT, log=print, family=socket.AF_INET):
+    """
+    Time one TCP connection to endpoint:port.
+
+    endpoint is a hostname or, with the matching family, an IPv4 or IPv6 address.
+
+    Returns:
+        tuple: (connect time in ms rounded to 0.01, (rtt_us, rttvar_us) or
+               None, None) on success, or (None, None, 'timeout' | 'refused'
+               | 'error') on failure
+    """
+    # New Socket
+    s = socket.socket(
+    family, socket.SOCK_STREAM)
+
+    # 1sec Timeout
+    s.settimeout(timeout)
+
+    # Start a timer
+    s_start = timer()
+
+    # Try to Connect
+    failure = None
+    kernel_rtt = None
+    try:
+        s.connect((endpoint, int(port)))
+        kernel_rtt = read_kernel_rtt(s)
+        s.shutdown(socket.SHUT_RD)
+
+    # Connection Timed Out
+    except socket.timeout:
+        log("Connection timed out!")
+        failure = 'timeout'
+    except ConnectionRefusedError as e:
+        log("Connection refused:", e)
+        failure = 'refused'
+    except OSError as e:
+        log("OS Error:", e)
+        failure = 'error'
+    finally:
+        s.close()
+
+    # Stop Timer
+    s_stop = timer()
+    if failure:
+        return None, None, failure
+    return float("%.2f" % (1000 * (s_stop - s_start))), kernel_rtt, None
+
+
+def probe_target(region, port, current_region, current_partition, planner, plan,
+                 log=print, sleep=time.sleep, resolver=socket.getaddrinfo):
+    """
+    Sample one target until the sampling policy or the run's deadline stops.
+
+    Failed attempts are classified as timeouts, refused connections or
+    other errors (e.g. DNS or unreachable network). Runs without a single
+    successful connection are stored without latency attributes. Where the
+    kernel RTT is available (see read_kernel_rtt) every attempt also
+    records its rtt_us and rttvar_us next to the connect time.
+
+    Args:
+        region: {'RegionName': ..., 'partition': ...} of the target
+        planner, plan: ProbePlanner and the ProbePlan of the run
+        log: Receives the per-attempt and summary output
+        sleep: Waits between attempts, e.g. an Event's wait to stop early
+        resolver: getaddrinfo compatible resolver of the front-end addresses,
+                  used with ADDRESS_SAMPLE_SIZE
+
+    Returns:
+        tuple: The low-level PingTest item, the attempt times and the
+               attempts' (rtt_us, rttvar_us) (None for failed attempts or
+               without kernel RTT), or None when no attempt was made
+    """
+    # CloudPing Counters and Lists
+    times_list = []
+    details_list = []
+    attempt_times = []
+    kernel_rtts = []
+
+    # Pass/Fail counters
+    failed = 0
+    timeouts = 0
+    refused = 0
+    count = 0
+    passed = 0
+    truncated = False
+
+    region_name = region['RegionName']
+    target_partition = region.get('partition', 'aws')
+
+    # Build partition-aware endpoint
+    dns_suffix = get_dns_suffix(target_partition)
+    endpoint = f'dynamodb.{region_name}.{dns_suffix}'
+
+    # Front ends to spread the attempts across, none to connect to the hostname
+    addresses = sample_addresses(resolve_addresses(endpoint, port, resolver)) if ADDRESS_SAMPLE_SIZE else []
+    attempt_addresses = []
+    attempt_limit = min(plan.attempts, max_attempts())
+    executor = ThreadPoolExecutor(max_workers=len(addresses)) if len(addresses) > 1 else None
+
+    def connect(address_index):
+        if address_index is None:
+            return connect_attempt(endpoint, port, log=log)
+        family, address = addresses[address_index]
+        return connect_attempt(address, port, log=log, family=family)
+
+    # Loop until the sampling policy is satisfied
+    try:
+        with span('probe'):
+            while should_continue_sampling(count, times_list, attempt_limit=plan.attempts):
+                if planner.expired(plan):
+                    truncated = True
+                    break
+
+                # One attempt per sampled address at once, rotating through them
+                if addresses:
+                    batch = [(count + i) % len(addresses)
+                             for i in range(max(1, min(len(addresses), attempt_limit - count)))]
+                else:
+                    batch = [None]
+                results = executor.map(connect, batch) if executor else map(connect, batch)
+
+                for address_index, (s_runtime, kernel_rtt, failure) in zip(batch, list(results)):
+                    # Increment Counter
+                    count += 1
+
+                    if failure:
+                        failed += 1
+                        timeouts += failure == 'timeout'
+                        refused += failure == 'refused'
+
+                    attempt_times.append(s_runtime)
+                    kernel_rtts.append(kernel_rtt)
+                    attempt_addresses.append(address_index)
+                    if s_runtime is not None:
+                        times_list.append(s_runtime)
+                        details = {"seq": {"N": str((count-1))}, "time": {"N": str(s_runtime)}}
+                        if kernel_rtt is not None:
+                            details.update({"rtt_us": {"N": str(kernel_rtt[0])},
+                                            "rttvar_us": {"N": str(kernel_rtt[1])}})
+                        details_list.append({"M": details})
+                        target = endpoint if address_index is None else \
+                            f"{endpoint}/{addresses[address_index][1]}"
+                        log("Connected to %s[%s]: tcp_seq=%s time=%.2f ms%s" % (
+                            target, port, (count-1), s_runtime,
+                            " rtt=%.3f ms" % (kernel_rtt[0] / 1000) if kernel_rtt else ""))
+                        passed += 1
+
+                # Sleep between attempts
+                if should_continue_sampling(count, times_list, attempt_limit=plan.attempts):
+                    sleep(SAMPLING_INTERVAL)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    # Reduced attempts only truncate targets that would have sampled further
+    if plan.reduced and count >= plan.attempts and \
+            should_continue_sampling(count, times_list, attempt_limit=max_attempts()):
+        truncated = True
+
+    count_metric('attempts', count)
+    count_metric('failed_attempts', failed)
+    if truncated:
+        count_metric('truncated_targets')
+
+    # Output Results once sampling has finished
+    getResults(failed, count, passed, log=log)
+
+    # Build the output data to be stored in DynamoDB
+    if not count:  # Nothing was measured before the deadline
+        return None
+
+    item = {
+        "port": {"N": str(port)},
+        "address": {"S": endpoint},
+        "region": {"S": current_region},
+        "regionTo": {"S": region_name},
+        "partition": {"S": current_partition},
+        "partitionTo": {"S": target_partition},
+        "attempts": {"N": str(count)},
+        "attemptsSuccess": {"N": str(passed)},
+        "failuresTimeout": {"N": str(timeouts)},
+        "failuresRefused": {"N": str(refused)},
+        "samplingMode": {"S": SAMPLING_MODE},
+        "truncated": {"BOOL": truncated},
+        "timestamp": {"S": get_current_time()}
+    }
+    # Runs where every attempt failed only record the failures
+    if times_list:
+        length = len(times_list)
+        item.update({
+            "avg": {"N": str(sum(times_list) / length)},
+            "min": {"N": str(min(times_list))},
+            "max": {"N": str(max(times_list))},
+            "variance": {"N": str(statistics.variance(times_list) if length > 1 else 0.0)},
+        })
+    if RESULTS_ENCODING == 'packed':
+        item[SAMPLES_ATTRIBUTE] = {"B": encode_samples(attempt_times, RESULTS_PACKED_FORMAT)}
+        # Kernel RTTs in ms, aligned with the samples; float32 keeps microseconds
+        if any(kernel_rtts):
+            for attribute, index in ((RTT_SAMPLES_ATTRIBUTE, 0), (RTTVAR_SAMPLES_ATTRIBUTE, 1)):
+                item[attribute] = {"B": encode_samples(
+                    [None if rtt is None else rtt[index] / 1000 for rtt in kernel_rtts]
+                )}
+    else:
+        item["results"] = {"L": details_list}
+    # Front end of every attempt, as an index into the sampled addresses
+    if addresses:
+        item[FRONTENDS_ATTRIBUTE] = {"L": [{"S": address} for _, address in addresses]}
+        item[FRONTEND_INDEX_ATTRIBUTE] = {"B": bytes(attempt_addresses)}
+    return item, attempt_times, kernel_rtts
+
+
+def run_destination(item, attempt_times, kernel_rtts=None):
+    """The per-destination columns of a run-level item, from a PingTest item."""
+    # Failed runs have no latency, stored as NaN in the run-level columns
+    destination = {
+        column: float(item[column]["N"]) if column in item else math.nan
+        for column in ('avg', 'min', 'max', 'variance')
+    }
+    destination.update({
+        "regionTo": item["regionTo"]["S"],
+        "partitionTo": item["partitionTo"]["S"],
+        "attempts": int(item["attempts"]["N"]),
+        "attemptsSuccess": int(item["attemptsSuccess"]["N"]),
+        "failuresTimeout": int(item["failuresTimeout"]["N"]),
+        "failuresRefused": int(item["failuresRefused"]["N"]),
+        "truncated": item["truncated"]["BOOL"],
+        "attempt_times": attempt_times,
+        "kernel_rtts": kernel_rtts or [None] * len(attempt_times),
+        "frontends": [address["S"] for address in item.get(FRONTENDS_ATTRIBUTE, {}).get("L", [])],
+        "frontend_index": list(item[FRONTEND_INDEX_ATTRIBUTE]["B"]) if FRONTEND_INDEX_ATTRIBUTE in item else None,
+    })
+    return destination
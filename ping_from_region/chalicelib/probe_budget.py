@@ -0,0 +1,72 @@
+"""
+Plan a probe run against the remaining Lambda time.
+
+Before probing, ProbePlanner turns the remaining invocation time into a
+plan: how many attempts each target gets and how many targets are probed
+concurrently so that all targets fit, while keeping time in reserve for
+the final write. During the run the plan's deadline stops sampling early;
+results cut short by the budget are marked as truncated.
+
+The clock and the Lambda context are injectable so plans can be checked
+without running in Lambda.
+"""
+
+import math
+import time
+from typing import NamedTuple, Optional
+
+
+class ProbePlan(NamedTuple):
+    attempts: int
+    concurrency: int
+    # Clock time after which no new attempt should start, None for no limit
+    deadline: Optional[float]
+    # True when attempts had to be reduced below the requested number
+    reduced: bool
+
+
+class ProbePlanner:
+    """Size attempts and concurrency of a probe run to the remaining time."""
+
+    def __init__(self, attempt_seconds, reserve_seconds, max_concurrency=1,
+                 min_attempts=1, clock=time.monotonic):
+        """
+        Args:
+            attempt_seconds: Expected time of one attempt, including the pause after it
+            reserve_seconds: Time kept for writing results and shutting down
+            max_concurrency: Most targets probed at the same time
+            min_attempts: Attempts per target below which attempts are not reduced
+            clock: Returns the current time in seconds
+        """
+        self.attempt_seconds = attempt_seconds
+        self.reserve_seconds = reserve_seconds
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_attempts = max(1, min_attempts)
+        self.clock = clock
+
+    def plan(self, targets, attempts, context=None):
+        """
+        Plan a run of `attempts` attempts against each of `targets` targets.
+
+        Without a context (e.g. when run locally) there is no time limit.
+        """
+        if context is None:
+            return ProbePlan(attempts, 1, None, False)
+
+        budget = context.get_remaining_time_in_millis() / 1000 - self.reserve_seconds
+        deadline = self.clock() + max(budget, 0.0)
+        if targets == 0:
+            return ProbePlan(attempts, 1, deadline, False)
+
+        # Concurrency needed to fit the full number of attempts
+        needed = targets * attempts * self.attempt_seconds / max(budget, 1e-9)
+        concurrency = min(self.max_concurrency, max(1, math.ceil(needed)))
+
+        # Otherwise fewer attempts per target at the highest concurrency
+        fitting = math.floor(budget * concurrency / (targets * self.attempt_seconds))
+        planned = max(self.min_attempts, min(attempts, fitting))
+        return ProbePlan(planned, concurrency, deadline, planned < attempts)
+
+    def expired(self, plan):
+        """True once no new attempt should start."""
+        return plan.deadline is not None and self.clock() >= plan.deadline
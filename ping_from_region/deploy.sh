@@ -1,5 +1,8 @@
 #!/bin/bash
 
+# Chalice does not package symlinks, so chalicelib/shared is a copy of shared/
+python "$(dirname "$0")/../tools/sync_shared.py" ping_from_region
+
 REGIONS = aws ec2 describe-regions \
     --all-regions \
     --query "Regions[].{Name:RegionName}" \
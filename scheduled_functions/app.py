@@ -1,18 +1,67 @@
 from chalice import Chalice, Cron
-from chalicelib.calculate_avgs import calculate
-from chalicelib.calculation_scheduler import schedule
-from chalicelib.store_region_status import store
+from chalicelib.shared.instrumentation import instrumented
+
+import os
 
 app = Chalice(app_name='scheduled_functions')
 
+# Every function of this app loads app.py, so each handler imports only the
+# module it runs: calculate_avgs does not pay for the anomaly detection's
+# NumPy state or the clients of the other functions at cold start.
+
+# Stream ARN of the PingTest table, exported by deploy.sh. Without it only the
+# fixed calc_scheduler cycle runs. The ARN only matters when deploying: in
+# Lambda the handler must exist without it, or every stream batch fails.
+PING_TEST_STREAM_ARN = os.environ.get('PING_TEST_STREAM_ARN')
+IN_LAMBDA = 'AWS_LAMBDA_FUNCTION_NAME' in os.environ
+
 @app.schedule(Cron("10", "0,6,12,18", "*", "*", "?", "*"))
+@instrumented('calc_scheduler')
 def calc_scheduler(event):
-    schedule(calc_func_name="scheduled_functions-prod-calculate_avgs")
+    from chalicelib.calculation_scheduler import schedule
+    return schedule(calc_func_name="scheduled_functions-prod-calculate_avgs")
 
 @app.lambda_function()
+@instrumented('calculate_avgs')
 def calculate_avgs(event, context):
+    from chalicelib.calculate_avgs import calculate
     return calculate(event)
 
 @app.schedule(Cron("20", "0,6,12,18", "*", "*", "?", "*"))
+@instrumented('store_region_status')
 def store_region_status(event):
+    from chalicelib.store_region_status import store
     store()
+
+@app.schedule(Cron("15", "0,6,12,18", "*", "*", "?", "*"))
+@instrumented('detect_anomalies')
+def detect_anomalies(event):
+    from chalicelib.detect_anomalies import detect
+    return detect()
+
+@app.schedule(Cron("25", "0,6,12,18", "*", "*", "?", "*"))
+@instrumented('update_profiles')
+def update_profiles(event):
+    from chalicelib.update_profiles import update
+    return update()
+
+@app.schedule(Cron("30", "1", "*", "*", "?", "*"))
+@instrumented('compact_ping_data')
+def compact_ping_data(event):
+    from chalicelib.compact_ping_data import compact
+    compact()
+
+# Partial rollups of the current day, after each round of ping runs
+@app.schedule(Cron("12", "0,6,12,18", "*", "*", "?", "*"))
+@instrumented('compact_today')
+def compact_today(event):
+    from chalicelib.compact_ping_data import compact_today
+    return compact_today()
+
+if PING_TEST_STREAM_ARN or IN_LAMBDA:
+    @app.on_dynamodb_record(stream_arn=PING_TEST_STREAM_ARN, batch_size=1000,
+                            maximum_batching_window_in_seconds=60)
+    @instrumented('aggregate_stream')
+    def aggregate_stream(event):
+        from chalicelib.stream_aggregation import process_records
+        process_records([record.to_dict() for record in event])
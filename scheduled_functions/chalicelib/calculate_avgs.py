@@ -1,21 +1,113 @@
-from boto3.dynamodb.conditions import Key, Attr
+from chalicelib.shared.tiered_storage import read_run_samples, ROLLUP_TABLE
+from chalicelib.shared.run_records import RUNS_TABLE, RUNS_TABLE_ENABLED
+from chalicelib.shared.instrumentation import span, count, set_property
+from chalicelib.shared.lazy_clients import get_resource
 from datetime import datetime, timedelta
 
-import boto3
-import decimal
 import json
-import numpy as np
+import os
 import sys
 
-def get_curr_region():
-    my_session = boto3.session.Session()
-    my_region = my_session.region_name
-    return my_region
+# "runs" computes percentiles over the per-run averages only, "attempts" also
+# publishes attempt_p_* percentiles over every individual attempt
+AGGREGATION_MODE = os.environ.get('AGGREGATION_MODE', 'runs')
+ATTEMPT_PERCENTILES = [10, 25, 50, 75, 90, 98, 99]
+# Latency values aggregated: "connect" the wall-clock connect times, "kernel"
+# the kernel RTTs of the connections (TCP_INFO, only runs that recorded it)
+LATENCY_SOURCE = os.environ.get('LATENCY_SOURCE', 'connect')
+# Rolling windows of the stored timeframes
+TIMEFRAME_DAYS = {'1D': 1, '1W': 7, '1M': 30, '1Y': 365}
+
+def loss_metrics(counts):
+    """
+    Connection loss aggregates of one pair from its connection counts.
+
+    loss_rate is the share of failed attempts, availability the share of
+    runs with at least one successful connection.
+    """
+    attempts = counts['attempts']
+    return {
+        "loss_rate": str(1 - counts['attempts_success'] / attempts if attempts else 0.0),
+        "availability": str(1 - counts['failed_runs'] / counts['runs']),
+        "timeouts": str(counts['timeouts']),
+        "refused": str(counts['refused']),
+        "runs": str(counts['runs']),
+        "failed_runs": str(counts['failed_runs'])
+    }
+
+def summarize_pairs(regions_to_avg, regions_to_attempts, regions_to_counts):
+    """
+    Averages, percentiles and loss metrics of every destination of one source region.
+
+    Args:
+        regions_to_avg: {region_to: [per-run average, ...]}
+        regions_to_attempts: {region_to: attempt times}, empty unless AGGREGATION_MODE=attempts
+        regions_to_counts: {region_to: connection counts}
+
+    Returns:
+        list: One dict per destination, as stored by calculation_scheduler.store_averages
+    """
+    # NumPy is only imported by the function that needs it, not by every
+    # handler of the app
+    import numpy as np
+
+    # Loop through the regions_to_avg JSON object
+    # Take all of the different latencies for each region and average them
+    # Store the results in the summaries list
+    summaries = []
+    for region in regions_to_avg:
+        if not regions_to_avg[region]:
+            continue
+        a = np.array([float(l) for l in regions_to_avg[region]])
+        p_10 = np.percentile(a, 10)
+        p_25 = np.percentile(a, 25)
+        p_50 = np.percentile(a, 50)
+        p_75 = np.percentile(a, 75)
+        p_90 = np.percentile(a, 90)
+        p_98 = np.percentile(a, 98)
+        p_99 = np.percentile(a, 99)
+        avg = sum(regions_to_avg[region]) / len(regions_to_avg[region])
+        summaries.append(
+            {
+                "region_to": region,
+                "avg_latency": str(avg),
+                "p_10": str(p_10),
+                "p_25": str(p_25),
+                "p_50": str(p_50),
+                "p_75": str(p_75),
+                "p_90": str(p_90),
+                "p_98": str(p_98),
+                "p_99": str(p_99)
+            }
+        )
+
+        # Attempt-level percentiles show the tail that per-run averages smooth out
+        attempt_times = regions_to_attempts.get(region)
+        if attempt_times is not None and len(attempt_times):
+            attempt_values = np.percentile(attempt_times, ATTEMPT_PERCENTILES)
+            summaries[-1].update({
+                f"attempt_p_{p}": str(value) for p, value in zip(ATTEMPT_PERCENTILES, attempt_values)
+            })
+            summaries[-1]["attempt_samples"] = str(len(attempt_times))
+
+    # Connection loss and availability, including pairs where every run failed
+    by_region = {avg["region_to"]: avg for avg in summaries}
+    for region, counts in regions_to_counts.items():
+        if not counts['runs']:
+            continue
+        if region not in by_region:
+            by_region[region] = {"region_to": region}
+            summaries.append(by_region[region])
+        by_region[region].update(loss_metrics(counts))
+
+    return summaries
 
 def calculate(event):
-    session = boto3.Session()
-    dynamodb = session.resource('dynamodb', region_name=get_curr_region())
+    # The resource is created once per container and reused while warm
+    dynamodb = get_resource('dynamodb')
     table = dynamodb.Table('PingTest')
+    rollups_table = dynamodb.Table(ROLLUP_TABLE)
+    runs_table = dynamodb.Table(RUNS_TABLE) if RUNS_TABLE_ENABLED else None
 
     try:
         region_name = event['region']
@@ -41,68 +133,35 @@ def calculate(event):
         range_start = event['custom_range']['range_start_timestamp']
         range_end = event['custom_range']['range_end_timestamp']
 
-    timestamp_query_map = {
-        '1D': Key('timestamp').gte((datetime.now() - timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")),
-        '1W': Key('timestamp').gte((datetime.now() - timedelta(days=7)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")),
-        '1M': Key('timestamp').gte((datetime.now() - timedelta(days=30)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")),
-        '1Y': Key('timestamp').gte((datetime.now() - timedelta(days=365)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")),
-        'MTD': Key('timestamp').gte(datetime(datetime.today().year, datetime.today().month, 1).strftime('%Y-%m-%dT%H:%M:%S.%fZ')),
-        'YTD': Key('timestamp').gte(datetime(datetime.today().year, 1, 1).strftime('%Y-%m-%dT%H:%M:%S.%fZ')),
-        'RANGE': Key('timestamp').between(range_start, range_end)
+    timestamp_start_map = {
+        **{
+            timeframe: (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            for timeframe, days in TIMEFRAME_DAYS.items()
+        },
+        'MTD': datetime(datetime.today().year, datetime.today().month, 1).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+        'YTD': datetime(datetime.today().year, 1, 1).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+        'RANGE': range_start
     }
+    window_start = timestamp_start_map[latency_range]
+    window_end = range_end if latency_range == 'RANGE' else datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
 
-    regions_to_avg = {}
-    response = table.query(
-        IndexName='region-timestamp-index',
-        KeyConditionExpression=Key('region').eq(region_name) & timestamp_query_map[latency_range]
-    )
-
-    for i in response['Items']:
-        if i['regionTo'] not in regions_to_avg:
-            regions_to_avg[i['regionTo']] = []
-        regions_to_avg[i['regionTo']].append(i['avg'])
-    while 'LastEvaluatedKey' in response:
-        response = table.query(
-            IndexName='region-timestamp-index',
-            KeyConditionExpression=Key('region').eq(region_name) & timestamp_query_map[latency_range],
-            ExclusiveStartKey=response['LastEvaluatedKey']
-        )
-        # Loop through all of the different latencies returned for the time period requested
-        # Group the latencies all together in a JSON object
-        # Object ends up looking like regions_to_avg = {'region_name': ['latency1', 'latency2', 'latency3'], 'region_name': ['latency1', 'latency2']}
-        for i in response['Items']:
-            if i['regionTo'] not in regions_to_avg:
-                regions_to_avg[i['regionTo']] = []
-            regions_to_avg[i['regionTo']].append(i['avg'])
+    set_property('region', region_name)
+    set_property('latency_range', latency_range)
+    set_property('latency_source', LATENCY_SOURCE)
 
-    # Loop through the regions_to_avg JSON object
-    # Take all of the different latencies for each region and average them
-    # Store the results in the avgs_to_return JSON object
-    avgs_to_return = {region_name: []}
-    for region in regions_to_avg:
-        a = np.array([float(l) for l in regions_to_avg[region]])
-        p_10 = np.percentile(a, 10)
-        p_25 = np.percentile(a, 25)
-        p_50 = np.percentile(a, 50)
-        p_75 = np.percentile(a, 75)
-        p_90 = np.percentile(a, 90)
-        p_98 = np.percentile(a, 98)
-        p_99 = np.percentile(a, 99)
-        avg = sum(regions_to_avg[region]) / len(regions_to_avg[region])
-        print(p_25, p_50, p_90, p_98, p_99)
-        avgs_to_return[region_name].append(
-            {
-                "region_to": region,
-                "avg_latency": str(avg),
-                "p_10": str(p_10),
-                "p_25": str(p_25),
-                "p_50": str(p_50),
-                "p_75": str(p_75),
-                "p_90": str(p_90),
-                "p_98": str(p_98),
-                "p_99": str(p_99)
-            }
+    # Full days come from the daily rollups where they exist, the rest of the
+    # window from the raw PingTest items
+    # Object ends up looking like regions_to_avg = {'region_name': [latency1, latency2, latency3], 'region_name': [latency1, latency2]}
+    with span('read'):
+        regions_to_avg, regions_to_attempts, regions_to_counts = read_run_samples(
+            table, rollups_table, region_name, window_start, window_end,
+            runs_table=runs_table, attempts=AGGREGATION_MODE == 'attempts', source=LATENCY_SOURCE
         )
+    count('pairs', len(regions_to_avg))
+    count('values', sum(len(v) for v in regions_to_avg.values()))
+    count('attempt_values', sum(len(v) for v in regions_to_attempts.values()))
+
+    avgs_to_return = {region_name: summarize_pairs(regions_to_avg, regions_to_attempts, regions_to_counts)}
 
     print(json.dumps(avgs_to_return))
     return avgs_to_return
@@ -1,84 +1,190 @@
-import boto3
+from boto3.dynamodb.conditions import Key
+from chalicelib.shared.instrumentation import span, count, capture_capacity, capacity_kwargs
+from chalicelib.shared.region_registry import get_region_registry
+from chalicelib.shared.averages_version import bump_averages_version
+from chalicelib.shared.metadata import METADATA_TABLE
+from chalicelib.shared.run_records import RUNS_TABLE, RUNS_TABLE_ENABLED
+from chalicelib.shared.lazy_clients import get_client, lazy_client, lazy_table
+
 import json
+import os
 import sys
 
-session = boto3.Session()
-dynamodb = session.resource('dynamodb', region_name="us-east-2")
-regions_table_enhanced = dynamodb.Table('cloudping_regions_enhanced')
-stored_avgs_table = dynamodb.Table('cloudping_stored_avgs')
-lambda_client = session.client('lambda', region_name="us-east-2")
+# Clients and tables are created on first use, see shared/lazy_clients.py
+region_registry = get_region_registry(lambda: get_client('dynamodb', region_name="us-east-2"))
+stored_avgs_table = lazy_table('cloudping_stored_avgs', region_name="us-east-2")
+ping_table = lazy_table('PingTest', region_name="us-east-2")
+# Run-level items, one per probe run, only with a run-level results layout
+# (see shared/run_records.py)
+runs_table = lazy_table(RUNS_TABLE, region_name="us-east-2") if RUNS_TABLE_ENABLED else None
+# Latest PingTest timestamp covered by each region's stored aggregates
+WATERMARKS_TABLE = os.environ.get('WATERMARKS_TABLE', 'cloudping_aggregation_watermarks')
+watermarks_table = lazy_table(WATERMARKS_TABLE, region_name="us-east-2")
+# Version counter of the stored averages, see shared/averages_version.py
+metadata_table = lazy_table(METADATA_TABLE, region_name="us-east-2")
+lambda_client = lazy_client('lambda', region_name="us-east-2")
+
+TIMEFRAMES_TO_STORE = ['1D', '1W', '1M', '1Y']
+LOSS_METRICS = ['loss_rate', 'availability', 'timeouts', 'refused', 'runs', 'failed_runs']
+
+def is_region_active(region_record):
+    print("Checking region active", region_record.name, region_record.status,
+          region_record.ping_function_exists, region_record.earliest_data_timestamp)
+    return region_record.active
+
+def query_latest_timestamp(table, region_id, **kwargs):
+    response = table.query(
+        KeyConditionExpression=Key('region').eq(region_id),
+        Limit=1,
+        ScanIndexForward=False,
+        ProjectionExpression='#ts',
+        ExpressionAttributeNames={'#ts': 'timestamp'},
+        **kwargs,
+        **capacity_kwargs()
+    )
+    capture_capacity(response)
+    if response['Items']:
+        return response['Items'][0]['timestamp']
+    return None
+
+def get_latest_ingested_timestamp(region_id):
+    """Get the timestamp of the most recent PingTest item or run written by a region."""
+    timestamps = [query_latest_timestamp(ping_table, region_id, IndexName='region-timestamp-index')]
+    if runs_table is not None:
+        timestamps.append(query_latest_timestamp(runs_table, region_id))
+    timestamps = [t for t in timestamps if t is not None]
+    return max(timestamps) if timestamps else None
+
+def get_aggregate_watermarks():
+    """Get the data watermark of the last stored aggregates of every region."""
+    watermarks = {}
+    kwargs = capacity_kwargs()
+    while True:
+        response = watermarks_table.scan(**kwargs)
+        capture_capacity(response)
+        for item in response['Items']:
+            watermarks[item['region_name']] = item['data_watermark']
+        if 'LastEvaluatedKey' not in response:
+            return watermarks
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def set_aggregate_watermark(region_id, watermark):
+    """Record the latest PingTest timestamp included in a region's aggregates."""
+    response = watermarks_table.put_item(
+        Item={
+            'region_name': region_id,
+            'data_watermark': watermark
+        },
+        **capacity_kwargs()
+    )
+    capture_capacity(response)
 
-def is_region_active(region_object):
-    status = region_object["status"]
-    function_exists = region_object["ping_function_exists"]
-    earliest_data_timestamp = region_object["earliest_data_timestamp"]
-    print("Checking region active", region_object["region_name"], status, function_exists, earliest_data_timestamp)
+def averages_item(region_id, timeframe, avg):
+    """The cloudping_stored_avgs item of one calculated pair (see calculate_avgs.summarize_pairs)."""
+    region_to = avg['region_to']
+    item = {
+        "index": "{}_{}_{}".format(region_id, region_to, timeframe),
+        "region_from": region_id,
+        "timeframe": timeframe,
+        "region_to": region_to
+    }
+    # Pairs where every run failed only have the loss metrics
+    if 'avg_latency' in avg:
+        item.update({
+            "latency": avg['avg_latency'],
+            "p_10": avg['p_10'],
+            "p_25": avg['p_25'],
+            "p_50": avg['p_50'],
+            "p_75": avg['p_75'],
+            "p_90": avg['p_90'],
+            "p_98": avg['p_98'],
+            "p_99": avg['p_99']
+        })
+    # Attempt-level percentiles, when calculated (AGGREGATION_MODE=attempts)
+    item.update({key: value for key, value in avg.items() if key.startswith('attempt_')})
+    item.update({key: avg[key] for key in LOSS_METRICS if key in avg})
+    return item
 
-    if status in ["ENABLED", "ENABLED_BY_DEFAULT"] and \
-        function_exists and earliest_data_timestamp != "None":
-        return True
-    return False
+def store_averages(region_id, timeframe, calculated_averages):
+    """Store the averages calculated for one source region and timeframe."""
+    for avg in calculated_averages[region_id]:
+        item = averages_item(region_id, timeframe, avg)
+        
+        try:
+            with span('store_averages'):
+                response = stored_avgs_table.put_item(
+                    Item=item,
+                    **capacity_kwargs()
+                )
+            capture_capacity(response)
+            count('averages_stored')
+        except:
+            print("An error occurred with the following item:")
+            print(item)
+            print(response)
 
-def schedule(calc_func_name):
-    timeframes_to_store = ['1D', '1W', '1M', '1Y']
+def schedule(calc_func_name, force=False):
+    """
+    Recalculate the stored averages of every active region with new data.
 
-    regions_enhanced_response = regions_table_enhanced.scan()
+    A region is skipped when its latest PingTest timestamp matches the
+    watermark stored with its last aggregates, e.g. because its ping function
+    is broken. Pass force=True to recalculate every active region.
+    """
+    watermarks = get_aggregate_watermarks()
+    recalculated = []
+    skipped = []
 
-    for region in regions_enhanced_response['Items']:
-        region_id = region['region_name']
+    for region in region_registry.all():
+        region_id = region.name
         region_active = is_region_active(region)
 
         if region_active:
-            for timeframe in timeframes_to_store:
+            latest_timestamp = get_latest_ingested_timestamp(region_id)
+            if not force and latest_timestamp is not None and \
+                    watermarks.get(region_id) == latest_timestamp:
+                print(f"Skipping {region_id}, no new data since {latest_timestamp}")
+                skipped.append(region_id)
+                count('regions_skipped')
+                continue
+
+            recalculated.append(region_id)
+            count('regions_calculated')
+            for timeframe in TIMEFRAMES_TO_STORE:
                 print(region_id, region_active, timeframe)
                 # Invoke Lambda function
-                lambda_response = lambda_client.invoke(
-                    FunctionName=calc_func_name,
-                    InvocationType='RequestResponse',
-                    LogType='None',
-                    Payload=json.dumps({
-                        'region': region_id,
-                        'execution_source': 'scheduled',
-                        'latency_range': timeframe
-                    })
-                )
+                with span('invoke_calculate'):
+                    lambda_response = lambda_client.invoke(
+                        FunctionName=calc_func_name,
+                        InvocationType='RequestResponse',
+                        LogType='None',
+                        Payload=json.dumps({
+                            'region': region_id,
+                            'execution_source': 'scheduled',
+                            'latency_range': timeframe
+                        })
+                    )
                 if lambda_response['StatusCode'] != 200:
                     print(lambda_response['FunctionError'], lambda_response['StatusCode'])
                     sys.exit(1)
                 calculated_averages = res_json = json.loads(lambda_response['Payload'].read().decode("utf-8"))
 
                 # Store data received back in DynamoDB
-                for avg in calculated_averages[region_id]:
-                    region_to = avg['region_to']
-                    avg_latency = avg['avg_latency']
-                    
-                    item = {
-                        "index": "{}_{}_{}".format(region_id, region_to, timeframe),
-                        "region_from": region_id,
-                        "timeframe": timeframe,
-                        "region_to": region_to,
-                        "latency": avg_latency,
-                        "p_10": avg['p_10'],
-                        "p_25": avg['p_25'],
-                        "p_50": avg['p_50'],
-                        "p_75": avg['p_75'],
-                        "p_90": avg['p_90'],
-                        "p_98": avg['p_98'],
-                        "p_99": avg['p_99']
-                    }
-                    
-                    try:
-                        response = stored_avgs_table.put_item(
-                            Item=item
-                        )
-                    except:
-                        print("An error occurred with the following item:")
-                        print(item)
-                        print(response)
+                store_averages(region_id, timeframe, calculated_averages)
+
+            if latest_timestamp is not None:
+                set_aggregate_watermark(region_id, latest_timestamp)
+
+    if recalculated:
+        bump_averages_version(metadata_table)
+
+    print(f"Recalculated {len(recalculated)} regions, skipped {len(skipped)} unchanged regions")
 
     return {
         "message": "Function execution completed successfully.",
-        "event": calc_func_name
+        "event": calc_func_name,
+        "recalculated": recalculated,
+        "skipped": skipped
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,71 @@
+from chalicelib.shared.tiered_storage import compact_day, ROLLUP_TABLE
+from chalicelib.shared.run_records import RUNS_TABLE, RUNS_TABLE_ENABLED
+from chalicelib.shared.instrumentation import span, count
+from chalicelib.shared.region_registry import get_region_registry
+from chalicelib.shared.lazy_clients import get_client, lazy_table
+from datetime import datetime, timedelta
+
+ping_table = lazy_table('PingTest', region_name="us-east-2")
+rollups_table = lazy_table(ROLLUP_TABLE, region_name="us-east-2")
+runs_table = lazy_table(RUNS_TABLE, region_name="us-east-2") if RUNS_TABLE_ENABLED else None
+region_registry = get_region_registry(lambda: get_client('dynamodb', region_name="us-east-2"))
+
+def get_regions_with_data():
+    """Get the names of all regions that have ever stored ping data."""
+    return [
+        region.name for region in region_registry.all()
+        if region.earliest_data_timestamp is not None
+    ]
+
+def compact(event=None):
+    """
+    Compact raw PingTest data into daily rollups.
+
+    By default the previous (complete) UTC day is compacted. Pass
+    {"days_back": N} to (re)compact the last N complete days, e.g. when
+    backfilling rollups before enabling the TTL on PingTest.
+    """
+    event = event or {}
+    days_back = int(event.get('days_back', 1))
+    today = datetime.utcnow().date()
+    days = [(today - timedelta(days=d)).strftime('%Y-%m-%d') for d in range(days_back, 0, -1)]
+
+    written = 0
+    for region_name in get_regions_with_data():
+        for day in days:
+            with span('compact_day'):
+                rollups = compact_day(ping_table, rollups_table, region_name, day, runs_table=runs_table)
+            print(f"Compacted {region_name} {day} into {rollups} rollups")
+            written += rollups
+
+    count('rollups_written', written)
+
+    return {
+        "message": f"Wrote {written} rollups for {len(days)} days",
+        "days": days
+    }
+
+def compact_today():
+    """
+    Roll up the current UTC day so far (complete=False).
+
+    Keeps today's per pair sketches current for sketch queries, the daily
+    compact() marks the day complete once it is over.
+    """
+    today = datetime.utcnow().strftime('%Y-%m-%d')
+
+    written = 0
+    for region_name in get_regions_with_data():
+        with span('compact_day'):
+            written += compact_day(ping_table, rollups_table, region_name, today,
+                                   complete=False, runs_table=runs_table)
+
+    count('rollups_written', written)
+
+    return {
+        "message": f"Wrote {written} partial rollups for {today}",
+        "days": [today]
+    }
+
+if __name__ == "__main__":
+    compact()
@@ -0,0 +1,129 @@
+from chalicelib.shared.anomaly import (
+    ANOMALIES_TABLE, ANOMALY_RETENTION_DAYS, PairBaselines, observation_rows
+)
+from chalicelib.shared.instrumentation import span, count, capture_capacity, capacity_kwargs
+from chalicelib.shared.region_catalog import get_region_catalog
+from chalicelib.shared.region_registry import get_region_registry
+from chalicelib.shared.run_records import RUNS_TABLE, RUNS_TABLE_ENABLED
+from chalicelib.shared.tiered_storage import query_raw, expiry_epoch
+from chalicelib.shared.lazy_clients import get_client, lazy_table
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import os
+
+ping_table = lazy_table('PingTest', region_name="us-east-2")
+runs_table = lazy_table(RUNS_TABLE, region_name="us-east-2") if RUNS_TABLE_ENABLED else None
+anomalies_table = lazy_table(ANOMALIES_TABLE, region_name="us-east-2")
+# One item holding the baselines of every pair and the last PingTest timestamp read per region
+state_table = lazy_table(os.environ.get('ANOMALY_STATE_TABLE', 'cloudping_anomaly_state'), region_name="us-east-2")
+region_registry = get_region_registry(lambda: get_client('dynamodb', region_name="us-east-2"))
+
+STATE_KEY = 'pair_baselines'
+# History read to warm up the baselines of a region seen for the first time
+BOOTSTRAP_DAYS = 7
+
+def load_state():
+    """
+    Load the persisted baselines.
+
+    Returns:
+        tuple: (region names the state is indexed by, PairBaselines or None, watermarks)
+    """
+    response = state_table.get_item(Key={'name': STATE_KEY}, **capacity_kwargs())
+    capture_capacity(response)
+    item = response.get('Item')
+    if not item:
+        return [], None, {}
+
+    state = {key: getattr(value, 'value', value) for key, value in item['baselines'].items()}
+    return list(item['regions']), PairBaselines.from_bytes(state), dict(item.get('watermarks', {}))
+
+def save_state(region_names, baselines, watermarks):
+    response = state_table.put_item(
+        Item={
+            'name': STATE_KEY,
+            'regions': list(region_names),
+            'baselines': baselines.to_bytes(),
+            'watermarks': watermarks,
+            'updated_at': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+        },
+        **capacity_kwargs()
+    )
+    capture_capacity(response)
+
+def read_new_items(region_name, watermark, now):
+    """Read the PingTest items a region wrote after its watermark."""
+    if watermark is None:
+        watermark = (now - timedelta(days=BOOTSTRAP_DAYS)).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+    end = now.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+    return [item for item in query_raw(ping_table, region_name, watermark, end, runs_table) if item['timestamp'] > watermark]
+
+def build_anomaly_item(detection, region_from, region_to, timestamp):
+    return {
+        'day': timestamp[:10],
+        'anomaly_key': f"{timestamp}#{region_from}#{region_to}#{detection.kind}",
+        'timestamp': timestamp,
+        'region_from': region_from,
+        'region_to': region_to,
+        'kind': detection.kind,
+        'value': Decimal(str(round(detection.value, 3))),
+        'baseline': Decimal(str(round(detection.baseline, 3))),
+        'score': Decimal(str(round(detection.score, 2))),
+        'expires_at': expiry_epoch(retention_days=ANOMALY_RETENTION_DAYS)
+    }
+
+def detect(event=None):
+    """
+    Fold the PingTest runs written since the last run into the per pair
+    baselines and store the spikes and step changes they reveal.
+
+    All pairs are updated at once per run slot, see shared/anomaly.py.
+    """
+    now = datetime.utcnow()
+    state_regions, baselines, watermarks = load_state()
+
+    items = []
+    with span('read'):
+        for region in region_registry.active():
+            new_items = read_new_items(region.name, watermarks.get(region.name), now)
+            if new_items:
+                watermarks[region.name] = max(item['timestamp'] for item in new_items)
+                # Runs where every attempt failed have no latency to compare
+                items.extend(item for item in new_items if 'avg' in item)
+    count('items', len(items))
+
+    catalog = get_region_catalog(
+        state_regions + [name for item in items for name in (item['region'], item['regionTo'])]
+    )
+    if baselines is None:
+        baselines = PairBaselines(catalog.size * catalog.size)
+    elif list(catalog.names) != state_regions:
+        baselines = baselines.remapped(state_regions, catalog.names)
+
+    with span('detect'):
+        rows, positions = observation_rows(
+            (catalog.pair_index_by_name(item['region'], item['regionTo']) for item in items),
+            (float(item['avg']) for item in items),
+            baselines.size,
+            order=[item['timestamp'] for item in items]
+        )
+        detections = baselines.update_rows(rows)
+
+    with span('write'):
+        with anomalies_table.batch_writer() as batch:
+            for row, detection in detections:
+                item = items[positions[row, detection.pair_index]]
+                batch.put_item(Item=build_anomaly_item(detection, item['region'], item['regionTo'], item['timestamp']))
+                print(f"{detection.kind} {item['region']} -> {item['regionTo']} at {item['timestamp']}: "
+                      f"{detection.value:.2f} ms vs baseline {detection.baseline:.2f} ms")
+        save_state(catalog.names, baselines, watermarks)
+    count('anomalies', len(detections))
+
+    return {
+        "message": f"Processed {len(items)} items, detected {len(detections)} anomalies",
+        "anomalies": len(detections)
+    }
+
+if __name__ == "__main__":
+    detect()
@@ -2,9 +2,15 @@ import boto3
 import time
 from botocore.exceptions import ClientError
 from boto3.dynamodb.conditions import Key, Attr
+from chalicelib.shared.instrumentation import span, count, capture_capacity, capacity_kwargs
+from chalicelib.shared.region_registry import bump_registry_version, get_region_registry
+from chalicelib.shared.run_records import RUNS_TABLE, RUNS_TABLE_ENABLED
+from chalicelib.shared.tiered_storage import ROLLUP_TABLE, day_bounds
+from chalicelib.shared.lazy_clients import get_client, get_resource, lazy_client
 
-# DynamoDB Table is always in us-east-2
-client = boto3.client('dynamodb', region_name="us-east-2")
+# DynamoDB Table is always in us-east-2, the client is created on first use
+client = lazy_client('dynamodb', region_name="us-east-2")
+region_registry = get_region_registry(lambda: get_client('dynamodb', region_name="us-east-2"))
 
 def chunk_list(lst, chunk_size):
     """Split a list into smaller chunks of specified size"""
@@ -22,7 +28,8 @@ def handle_unprocessed_items(client, unprocessed_items, max_retries=3):
         time.sleep(delay)
         
         try:
-            response = client.batch_write_item(RequestItems=items)
+            response = client.batch_write_item(RequestItems=items, **capacity_kwargs())
+            capture_capacity(response)
             items = response.get('UnprocessedItems', {})
             retries += 1
             
@@ -53,8 +60,10 @@ def write_results(results):
             response = client.batch_write_item(
                 RequestItems={
                     'cloudping_regions_enhanced': chunk
-                }
+                },
+                **capacity_kwargs()
             )
+            capture_capacity(response)
             
             # Handle any unprocessed items
             if response.get('UnprocessedItems'):
@@ -70,6 +79,9 @@ def write_results(results):
             print(f"Error processing chunk {i}: {str(e)}")
             raise
 
+    # Let cached region registries know the table changed
+    bump_registry_version(client)
+
 def check_function_exists(region_name):
     lambda_client = boto3.client('lambda', region_name=region_name)
     try:
@@ -81,35 +93,57 @@ def check_function_exists(region_name):
         return False
     return True
 
-def get_earliest_timestamp(region_name):
-    dynamodb = boto3.resource('dynamodb', region_name="us-east-2")
-    table = dynamodb.Table('PingTest')
-    
-    response = table.query(
-        IndexName='region-timestamp-index',
+def query_edge_timestamps(region_name, ascending):
+    """
+    Get the first (ascending) or last timestamp a region wrote, both to the
+    PingTest table and, with a run-level results layout, to the PingTestRuns
+    table.
+    """
+    dynamodb = get_resource('dynamodb', region_name="us-east-2")
+    tables = [('PingTest', {'IndexName': 'region-timestamp-index'})]
+    if RUNS_TABLE_ENABLED:
+        tables.append((RUNS_TABLE, {}))
+    timestamps = []
+    for table_name, kwargs in tables:
+        response = dynamodb.Table(table_name).query(
+            KeyConditionExpression=Key('region').eq(region_name),
+            Limit=1,  # We only need the first item
+            ScanIndexForward=ascending,
+            **kwargs,
+            **capacity_kwargs()
+        )
+        capture_capacity(response)
+        timestamps.extend(item['timestamp'] for item in response['Items'])
+    return timestamps
+
+def get_first_rollup_timestamp(region_name):
+    """Start of the first day of a region rolled up into PingTestDaily."""
+    response = get_resource('dynamodb', region_name="us-east-2").Table(ROLLUP_TABLE).query(
         KeyConditionExpression=Key('region').eq(region_name),
-        Limit=1,  # We only need the first item
-        ScanIndexForward=True  # True for ascending order (earliest first)
+        Limit=1,
+        ScanIndexForward=True,
+        **capacity_kwargs()
     )
-    
-    if response['Items']:
-        return response['Items'][0]['timestamp']
-    return None
+    capture_capacity(response)
+    return day_bounds(response['Items'][0]['day'])[0] if response['Items'] else None
+
+def get_earliest_timestamp(region_name):
+    """
+    Get the first timestamp of a region's data. Raw items expire after
+    HOT_RETENTION_DAYS, so the first rolled up day and the stored value keep
+    it from moving forward with the TTL.
+    """
+    timestamps = query_edge_timestamps(region_name, ascending=True)
+    timestamps.append(get_first_rollup_timestamp(region_name))
+    record = region_registry.get(region_name)
+    if record is not None:
+        timestamps.append(record.earliest_data_timestamp)
+    timestamps = [t for t in timestamps if t is not None]
+    return min(timestamps) if timestamps else None
 
 def get_latest_timestamp(region_name):
-    dynamodb = boto3.resource('dynamodb', region_name="us-east-2")
-    table = dynamodb.Table('PingTest')
-    
-    response = table.query(
-        IndexName='region-timestamp-index',
-        KeyConditionExpression=Key('region').eq(region_name),
-        Limit=1,  # We only need the first item
-        ScanIndexForward=False  # False for descending order (latest first)
-    )
-    
-    if response['Items']:
-        return response['Items'][0]['timestamp']
-    return None
+    timestamps = query_edge_timestamps(region_name, ascending=False)
+    return max(timestamps) if timestamps else None
 
 def store():
     """
@@ -128,9 +162,12 @@ def store():
                 region_name = region['RegionName']
                 status = region['RegionOptStatus']
                 is_opt_in = True if status != "ENABLED_BY_DEFAULT" else False
-                function_exists = check_function_exists(region_name)
-                earliest_timestamp = get_earliest_timestamp(region_name)
-                most_recent_timestamp = get_latest_timestamp(region_name)
+                count('regions')
+                with span('check_function'):
+                    function_exists = check_function_exists(region_name)
+                with span('query_timestamps'):
+                    earliest_timestamp = get_earliest_timestamp(region_name)
+                    most_recent_timestamp = get_latest_timestamp(region_name)
 
                 region_info = {
                     "region_name": {"S": region_name},
@@ -149,7 +186,8 @@ def store():
                     }
                 })
 
-        write_results(enabled_regions)
+        with span('write'):
+            write_results(enabled_regions)
 
     except ClientError as e:
         print(f"Error getting region status: {str(e)}")
@@ -0,0 +1,93 @@
+"""
+Event-driven aggregation of PingTest writes.
+
+A DynamoDB Streams consumer on PingTest receives the items written by every
+ping_from_region run. Inserts are grouped per source region and the 1D
+averages of only the affected regions are recalculated, so a late region
+shows up within minutes instead of waiting for the next calc_scheduler
+cycle. The longer timeframes barely move with one more run and stay with
+calc_scheduler, which is why the stream does not advance the aggregate
+watermarks.
+
+LocalStream stands in for DynamoDB Streams locally: items put into it are
+turned into stream records in the same shape Lambda receives them.
+"""
+
+from chalicelib.calculate_avgs import calculate
+from chalicelib.calculation_scheduler import store_averages, metadata_table
+from chalicelib.shared.averages_version import bump_averages_version
+from chalicelib.shared.instrumentation import span, count
+
+# Timeframes recalculated per batch, the others are left to calc_scheduler
+STREAM_TIMEFRAMES = ['1D']
+
+def group_inserts(records):
+    """
+    Group INSERT stream records by source region.
+
+    Args:
+        records: DynamoDB stream records as dicts (Lambda event format)
+
+    Returns:
+        dict: {source_region: set of destination regions}
+    """
+    regions = {}
+    for record in records:
+        if record.get('eventName') != 'INSERT':
+            continue
+        new_image = record.get('dynamodb', {}).get('NewImage', {})
+        if 'region' not in new_image:
+            continue
+        region_to = new_image.get('regionTo', {}).get('S')
+        regions.setdefault(new_image['region']['S'], set()).add(region_to)
+    return regions
+
+def process_records(records, calculate_func=calculate, store_func=store_averages):
+    """
+    Recalculate the stored 1D averages of every source region present in a batch.
+
+    Returns:
+        dict: {source_region: number of destination regions seen in the batch}
+    """
+    affected = group_inserts(records)
+    count('stream_records', len(records))
+    count('regions_recalculated', len(affected))
+
+    for region_id in sorted(affected):
+        print(f"Recalculating {region_id} after {len(affected[region_id])} new destinations")
+        for timeframe in STREAM_TIMEFRAMES:
+            with span('calculate'):
+                calculated_averages = calculate_func({
+                    'region': region_id,
+                    'execution_source': 'stream',
+                    'latency_range': timeframe
+                })
+            store_func(region_id, timeframe, calculated_averages)
+
+    if affected:
+        bump_averages_version(metadata_table)
+
+    return {region_id: len(regions_to) for region_id, regions_to in affected.items()}
+
+class LocalStream:
+    """In-memory stand-in for a DynamoDB stream on PingTest."""
+
+    def __init__(self):
+        self.records = []
+
+    def put(self, item):
+        """Record an INSERT of a low-level ({'S': ...}) PingTest item."""
+        self.records.append({
+            'eventName': 'INSERT',
+            'dynamodb': {'NewImage': item}
+        })
+
+    def batch_write(self, put_requests):
+        """Record a batch of PutRequests as written by ping_from_region."""
+        for request in put_requests:
+            self.put(request['PutRequest']['Item'])
+
+    def drain(self, handler=process_records):
+        """Pass all pending records to the handler as a single batch."""
+        records, self.records = self.records, []
+        return handler(records)
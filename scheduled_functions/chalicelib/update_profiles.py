@@ -0,0 +1,108 @@
+from chalicelib.shared.profiles import PROFILES_TABLE, PairProfiles, hour_of_week
+from chalicelib.shared.instrumentation import span, count, capture_capacity, capacity_kwargs
+from chalicelib.shared.metadata import METADATA_TABLE, read_metadata, write_metadata
+from chalicelib.shared.region_registry import get_region_registry
+from chalicelib.shared.run_records import RUNS_TABLE, RUNS_TABLE_ENABLED
+from chalicelib.shared.tiered_storage import query_raw
+from chalicelib.shared.lazy_clients import get_client, lazy_resource, lazy_table
+from datetime import datetime, timedelta
+
+dynamodb = lazy_resource('dynamodb', region_name="us-east-2")
+ping_table = lazy_table('PingTest', region_name="us-east-2")
+runs_table = lazy_table(RUNS_TABLE, region_name="us-east-2") if RUNS_TABLE_ENABLED else None
+# One item per (region_from, region_to) pair
+profiles_table = lazy_table(PROFILES_TABLE, region_name="us-east-2")
+# The last PingTest timestamp folded in per region, see shared/metadata.py
+metadata_table = lazy_table(METADATA_TABLE, region_name="us-east-2")
+region_registry = get_region_registry(lambda: get_client('dynamodb', region_name="us-east-2"))
+
+WATERMARKS_NAME = 'profile_watermarks'
+# History read to seed the profiles of a region seen for the first time
+BOOTSTRAP_DAYS = 28
+# Keys per batch_get_item request
+BATCH_GET_SIZE = 100
+
+def load_watermarks():
+    return dict(read_metadata(metadata_table, WATERMARKS_NAME).get('watermarks', {}))
+
+def save_watermarks(watermarks):
+    write_metadata(metadata_table, WATERMARKS_NAME, watermarks=watermarks)
+
+def read_new_items(region_name, watermark, now):
+    """Read the PingTest results with a latency a region wrote after its watermark."""
+    if watermark is None:
+        watermark = (now - timedelta(days=BOOTSTRAP_DAYS)).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+    end = now.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+    return [
+        item for item in query_raw(ping_table, region_name, watermark, end, runs_table)
+        if item['timestamp'] > watermark
+    ]
+
+def load_profiles(pairs):
+    """Get the stored profile items of the given (from, to) pairs, None where missing."""
+    found = {}
+    for i in range(0, len(pairs), BATCH_GET_SIZE):
+        request = {PROFILES_TABLE: {'Keys': [
+            {'region_from': region_from, 'region_to': region_to}
+            for region_from, region_to in pairs[i:i + BATCH_GET_SIZE]
+        ]}}
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request, **capacity_kwargs())
+            capture_capacity(response)
+            for item in response['Responses'].get(PROFILES_TABLE, []):
+                found[(item['region_from'], item['region_to'])] = item
+            request = response.get('UnprocessedKeys')
+    return [found.get(pair) for pair in pairs]
+
+def update(event=None):
+    """
+    Fold the PingTest runs written since the last run into the 7x24 profile
+    of every pair they measured.
+
+    Only the pairs with new runs are read and rewritten, see shared/profiles.py.
+    """
+    now = datetime.utcnow()
+    watermarks = load_watermarks()
+
+    items = []
+    with span('read'):
+        for region in region_registry.active():
+            new_items = read_new_items(region.name, watermarks.get(region.name), now)
+            if new_items:
+                watermarks[region.name] = max(item['timestamp'] for item in new_items)
+                items.extend(item for item in new_items if 'avg' in item)
+    count('items', len(items))
+
+    pairs = sorted({(item['region'], item['regionTo']) for item in items})
+    if pairs:
+        pair_ids = {pair: i for i, pair in enumerate(pairs)}
+        with span('load'):
+            profiles = PairProfiles.from_items(load_profiles(pairs))
+
+        with span('update'):
+            profiles.update(
+                [pair_ids[(item['region'], item['regionTo'])] for item in items],
+                hour_of_week([item['timestamp'] for item in items]),
+                [float(item['avg']) for item in items]
+            )
+
+        with span('write'):
+            with profiles_table.batch_writer() as batch:
+                for (region_from, region_to), pair in pair_ids.items():
+                    batch.put_item(Item={
+                        'region_from': region_from,
+                        'region_to': region_to,
+                        'updated_at': now.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z',
+                        **profiles.to_item(pair)
+                    })
+        count('profiles_updated', len(pairs))
+
+    save_watermarks(watermarks)
+
+    return {
+        "message": f"Folded {len(items)} runs into the profiles of {len(pairs)} pairs",
+        "items": len(items)
+    }
+
+if __name__ == "__main__":
+    update()
@@ -1,3 +1,13 @@
 #!/bin/bash
 
-chalice deploy --stage prod
\ No newline at end of file
+# Chalice does not package symlinks, so chalicelib/shared is a copy of shared/
+python "$(dirname "$0")/../tools/sync_shared.py" scheduled_functions
+
+# Event-driven aggregation subscribes to the PingTest stream
+export PING_TEST_STREAM_ARN=$(aws dynamodb describe-table \
+    --table-name PingTest \
+    --region us-east-2 \
+    --query "Table.LatestStreamArn" \
+    --output text)
+
+chalice deploy --stage prod
@@ -1,21 +1,79 @@
 """
 Shared utilities for cloudping cross-partition operations.
+
+Names are re-exported lazily: a submodule is only imported when one of its
+names is first used, so importing one module (e.g. shared.result_encoding)
+does not pull in boto3 and every other module at cold start.
 """
 
-from .cross_partition import (
-    get_current_partition,
-    get_dns_suffix,
-    get_arn_partition,
-    build_endpoint,
-    get_cross_partition_dynamodb_client,
-    get_regions_from_dynamodb,
-)
-
-__all__ = [
-    'get_current_partition',
-    'get_dns_suffix',
-    'get_arn_partition',
-    'build_endpoint',
-    'get_cross_partition_dynamodb_client',
-    'get_regions_from_dynamodb',
-]
+import importlib
+
+# Re-exported name -> submodule defining it
+_EXPORTS = {
+    'get_current_partition': 'cross_partition',
+    'get_dns_suffix': 'cross_partition',
+    'get_arn_partition': 'cross_partition',
+    'build_endpoint': 'cross_partition',
+    'get_cross_partition_dynamodb_client': 'cross_partition',
+    'get_regions_from_dynamodb': 'cross_partition',
+    'SAMPLES_ATTRIBUTE': 'result_encoding',
+    'SAMPLES_FORMAT_FLOAT32': 'result_encoding',
+    'SAMPLES_FORMAT_UINT16_TENTH_MS': 'result_encoding',
+    'encode_samples': 'result_encoding',
+    'decode_samples': 'result_encoding',
+    'item_samples': 'result_encoding',
+    'Metrics': 'instrumentation',
+    'instrumented': 'instrumentation',
+    'invocation': 'instrumentation',
+    'span': 'instrumentation',
+    'count': 'instrumentation',
+    'set_property': 'instrumentation',
+    'capture_capacity': 'instrumentation',
+    'capacity_kwargs': 'instrumentation',
+    'RegionRecord': 'region_registry',
+    'RegionRegistry': 'region_registry',
+    'get_region_registry': 'region_registry',
+    'bump_registry_version': 'region_registry',
+    'KNOWN_REGIONS': 'region_catalog',
+    'RegionCatalog': 'region_catalog',
+    'get_region_catalog': 'region_catalog',
+    'HOT_RETENTION_DAYS': 'tiered_storage',
+    'ROLLUP_TABLE': 'tiered_storage',
+    'TTL_ATTRIBUTE': 'tiered_storage',
+    'expiry_epoch': 'tiered_storage',
+    'compact_day': 'tiered_storage',
+    'read_run_averages': 'tiered_storage',
+    'read_pair_history': 'tiered_storage',
+    'RUNS_TABLE': 'run_records',
+    'RUNS_TABLE_ENABLED': 'run_records',
+    'build_run_item': 'run_records',
+    'expand_run_item': 'run_records',
+    'PipelinedBatchWriter': 'batch_writer',
+    'bump_averages_version': 'averages_version',
+    'read_averages_version': 'averages_version',
+    'METADATA_TABLE': 'metadata',
+    'bump_version': 'metadata',
+    'read_version': 'metadata',
+    'read_metadata': 'metadata',
+    'write_metadata': 'metadata',
+    'Lazy': 'lazy_clients',
+    'get_resource': 'lazy_clients',
+    'get_client': 'lazy_clients',
+    'lazy_resource': 'lazy_clients',
+    'lazy_client': 'lazy_clients',
+    'lazy_table': 'lazy_clients',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
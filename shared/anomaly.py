@@ -0,0 +1,196 @@
+"""
+Vectorized latency anomaly detection over all region pairs.
+
+PairBaselines keeps a robust rolling baseline for every (from, to) pair in
+flat arrays indexed by the region catalog's pair index, and updates all
+pairs at once from one row of new observations (NaN where a pair has no
+new value):
+
+- the baseline level is an EWMA and its scale an exponentially weighted
+  mean absolute deviation. Residuals are clipped to a few deviations
+  before updating, so single spikes barely move the baseline.
+- a spike is a single observation far outside the baseline.
+- a step change is detected with a two-sided CUSUM over the clipped
+  robust z-scores. When it fires, the baseline is reset to the new level.
+
+Pairs need MIN_OBSERVATIONS values before they can be flagged.
+"""
+
+import os
+import struct
+from typing import Dict, Iterable, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+ANOMALIES_TABLE = os.environ.get('ANOMALIES_TABLE', 'cloudping_anomalies')
+ANOMALY_RETENTION_DAYS = int(os.environ.get('ANOMALY_RETENTION_DAYS', '90'))
+
+ALPHA = 0.05
+MIN_OBSERVATIONS = 8
+SPIKE_Z = 8.0
+CUSUM_DRIFT = 0.5
+CUSUM_THRESHOLD = 8.0
+CLIP_Z = 4.0
+# Noise floor of the scale, so perfectly stable pairs do not flag tiny changes
+MIN_SCALE_MS = 0.5
+MIN_SCALE_RATIO = 0.02
+
+# Mean absolute deviation -> standard deviation for normal noise
+_MAD_TO_SIGMA = 1.2533
+
+STATE_FIELDS = ('mean', 'scale', 'cusum_pos', 'cusum_neg', 'observations')
+
+
+class Detection(NamedTuple):
+    pair_index: int
+    kind: str
+    value: float
+    baseline: float
+    score: float
+
+
+class PairBaselines:
+    """Rolling baselines and change detectors for `size` pairs."""
+
+    def __init__(self, size: int, alpha: float = ALPHA):
+        self.size = size
+        self.alpha = alpha
+        self.mean = np.zeros(size)
+        self.scale = np.zeros(size)
+        self.cusum_pos = np.zeros(size)
+        self.cusum_neg = np.zeros(size)
+        self.observations = np.zeros(size, dtype=np.int64)
+
+    def sigma(self) -> np.ndarray:
+        floor = np.maximum(MIN_SCALE_MS, MIN_SCALE_RATIO * np.abs(self.mean))
+        return np.maximum(self.scale * _MAD_TO_SIGMA, floor)
+
+    def update(self, values: Sequence[float]) -> List[Detection]:
+        """
+        Fold one row of observations into the baselines.
+
+        Args:
+            values: Array of size `size` with the new value of every pair,
+                    NaN for pairs without a new value
+
+        Returns:
+            list: The spikes and step changes detected in this row
+        """
+        x = np.asarray(values, dtype=np.float64)
+        present = ~np.isnan(x)
+        warm = present & (self.observations >= MIN_OBSERVATIONS)
+        cold = present & ~warm
+
+        sigma = self.sigma()
+        residual = np.where(present, x - self.mean, 0.0)
+        z = residual / sigma
+
+        # Two-sided CUSUM on the clipped scores of warm pairs
+        clipped = np.clip(z, -CLIP_Z, CLIP_Z)
+        self.cusum_pos = np.where(warm, np.maximum(0.0, self.cusum_pos + clipped - CUSUM_DRIFT), self.cusum_pos)
+        self.cusum_neg = np.where(warm, np.maximum(0.0, self.cusum_neg - clipped - CUSUM_DRIFT), self.cusum_neg)
+
+        spikes = warm & (np.abs(z) > SPIKE_Z)
+        steps_up = warm & (self.cusum_pos > CUSUM_THRESHOLD)
+        steps_down = warm & (self.cusum_neg > CUSUM_THRESHOLD)
+        steps = steps_up | steps_down
+
+        detections = []
+        for kind, mask in (('spike', spikes & ~steps), ('step_up', steps_up), ('step_down', steps_down)):
+            for index in np.flatnonzero(mask).tolist():
+                detections.append(Detection(index, kind, float(x[index]), float(self.mean[index]), float(z[index])))
+
+        # Warm pairs: robust EWMA update with clipped residuals
+        bounded = np.clip(residual, -CLIP_Z * sigma, CLIP_Z * sigma)
+        self.mean = np.where(warm, self.mean + self.alpha * bounded, self.mean)
+        self.scale = np.where(warm, self.scale + self.alpha * (np.abs(bounded) - self.scale), self.scale)
+
+        # Cold pairs: plain running mean and mean absolute deviation
+        weight = 1.0 / (self.observations + 1)
+        self.scale = np.where(cold, self.scale + weight * (np.abs(residual) - self.scale), self.scale)
+        self.mean = np.where(cold, self.mean + weight * residual, self.mean)
+
+        # Re-baseline pairs whose level changed
+        self.mean = np.where(steps, x, self.mean)
+        self.cusum_pos = np.where(steps, 0.0, self.cusum_pos)
+        self.cusum_neg = np.where(steps, 0.0, self.cusum_neg)
+
+        self.observations += present
+        return detections
+
+    def update_rows(self, rows: np.ndarray) -> List[Tuple[int, Detection]]:
+        """Update with several rows in order, returning (row, detection) pairs."""
+        detections = []
+        for row_index, row in enumerate(np.atleast_2d(rows)):
+            detections.extend((row_index, detection) for detection in self.update(row))
+        return detections
+
+    def to_bytes(self) -> Dict[str, bytes]:
+        """Serialize every state array, e.g. into DynamoDB binary attributes."""
+        state = {name: getattr(self, name).astype('<f8').tobytes() for name in STATE_FIELDS[:-1]}
+        state['observations'] = self.observations.astype('<u4').tobytes()
+        state['header'] = struct.pack('<Id', self.size, self.alpha)
+        return state
+
+    @classmethod
+    def from_bytes(cls, state: Dict[str, bytes]) -> 'PairBaselines':
+        size, alpha = struct.unpack('<Id', bytes(state['header']))
+        baselines = cls(size, alpha)
+        for name in STATE_FIELDS[:-1]:
+            setattr(baselines, name, np.frombuffer(bytes(state[name]), dtype='<f8').copy())
+        baselines.observations = np.frombuffer(bytes(state['observations']), dtype='<u4').astype(np.int64)
+        return baselines
+
+    def remapped(self, old_names: Sequence[str], new_names: Sequence[str]) -> 'PairBaselines':
+        """
+        Move the state to a catalog with different regions.
+
+        Pair indices depend on the catalog size, so state persisted with one
+        list of region names has to be remapped when regions are added.
+        """
+        old_pairs, new_pairs = pair_mapping(old_names, new_names)
+        baselines = PairBaselines(len(new_names) ** 2, self.alpha)
+        for name in STATE_FIELDS:
+            getattr(baselines, name)[new_pairs] = getattr(self, name)[old_pairs]
+        return baselines
+
+
+def pair_mapping(old_names: Sequence[str], new_names: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Return matching (old pair indexes, new pair indexes) of the common regions."""
+    new_ids = {name: i for i, name in enumerate(new_names)}
+    old_ids = np.array([i for i, name in enumerate(old_names) if name in new_ids], dtype=np.int64)
+    mapped = np.array([new_ids[old_names[i]] for i in old_ids], dtype=np.int64)
+    old_pairs = (old_ids[:, None] * len(old_names) + old_ids[None, :]).reshape(-1)
+    new_pairs = (mapped[:, None] * len(new_names) + mapped[None, :]).reshape(-1)
+    return old_pairs, new_pairs
+
+
+def observation_rows(pair_indexes: Iterable[int], values: Iterable[float], size: int,
+                     order: Iterable = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Arrange observations of many pairs into rows for PairBaselines.update.
+
+    The k-th observation of every pair (in `order`, e.g. timestamps) goes to
+    row k; pairs with fewer observations are NaN padded.
+
+    Returns:
+        tuple: (rows of shape (k, size), source position of every cell or -1)
+    """
+    pairs = np.asarray(list(pair_indexes), dtype=np.int64)
+    values = np.asarray(list(values), dtype=np.float64)
+    if not len(pairs):
+        return np.full((0, size), np.nan), np.full((0, size), -1, dtype=np.int64)
+
+    keys = np.arange(len(pairs)) if order is None else np.asarray(list(order))
+    sort = np.lexsort((keys, pairs))
+    sorted_pairs = pairs[sort]
+    # Position of every observation within its pair
+    starts = np.flatnonzero(np.r_[True, sorted_pairs[1:] != sorted_pairs[:-1]])
+    group_sizes = np.diff(np.r_[starts, len(sorted_pairs)])
+    rank = np.arange(len(sorted_pairs)) - np.repeat(starts, group_sizes)
+
+    rows = np.full((int(rank.max()) + 1, size), np.nan)
+    positions = np.full(rows.shape, -1, dtype=np.int64)
+    rows[rank, sorted_pairs] = values[sort]
+    positions[rank, sorted_pairs] = sort
+    return rows, positions
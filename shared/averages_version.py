@@ -0,0 +1,22 @@
+"""
+Version counter of the stored averages in cloudping_stored_avgs.
+
+The stored averages only change when calc_scheduler or the stream consumer
+recalculates them. Both bump a counter kept in the metadata table
+(shared.metadata) afterwards, so readers can cache anything derived from
+the averages until the version changes.
+"""
+
+from .metadata import bump_version, read_version
+
+AVERAGES_VERSION_NAME = 'averages_version'
+
+
+def bump_averages_version(metadata_table):
+    """Signal readers that the stored averages changed."""
+    bump_version(metadata_table, AVERAGES_VERSION_NAME)
+
+
+def read_averages_version(metadata_table):
+    """Get the current version of the stored averages (0 if never bumped)."""
+    return read_version(metadata_table, AVERAGES_VERSION_NAME)
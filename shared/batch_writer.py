@@ -0,0 +1,225 @@
+"""
+Pipelined DynamoDB batch writer.
+
+Items are written in the background while the caller keeps working: put()
+groups items into batch_write_item requests of up to 25 and hands full
+batches to a small thread pool, so up to `max_in_flight` requests are in
+flight at once. A partial batch is sent once it is `max_batch_age` old,
+even when no further put() follows. Unprocessed items and throttling
+errors are retried with full jitter exponential backoff. close() flushes
+what is left and waits for the writes, but does not retry past its
+deadline. It then re-raises the first non-retryable error (e.g.
+AccessDenied or a ValidationException), so a caller never reports success
+for writes that could not succeed.
+
+Usage:
+    writer = PipelinedBatchWriter(client, 'PingTest')
+    for target in targets:
+        writer.put(probe(target))
+    summary = writer.close(timeout=30)
+
+Works with a low-level client and low-level ({'S': ...}) items.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .instrumentation import capacity_kwargs, capture_capacity, count
+
+MAX_BATCH_SIZE = 25
+RETRYABLE_ERRORS = (
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'InternalServerError',
+)
+
+
+def is_retryable(error):
+    """True for DynamoDB throttling and transient server errors."""
+    code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+    return code in RETRYABLE_ERRORS
+
+
+class PipelinedBatchWriter:
+    """Background batch_write_item writer with bounded concurrency."""
+
+    def __init__(self, client, table_name, max_in_flight=4, batch_size=MAX_BATCH_SIZE,
+                 max_batch_age=2.0, max_retries=8, base_delay=0.05, max_delay=2.0,
+                 clock=time.monotonic, sleep=time.sleep, rng=random.random):
+        """
+        Args:
+            client: Low-level DynamoDB client
+            table_name: Table all items are written to
+            max_in_flight: Maximum number of concurrent batch_write_item calls
+            batch_size: Items per request (at most 25)
+            max_batch_age: Seconds after which a partial batch is sent
+            max_retries: Attempts per batch before its remaining items are given up
+            base_delay, max_delay: Bounds of the jittered exponential backoff, in seconds
+            clock, sleep, rng: Injectable for tests
+        """
+        self.client = client
+        self.table_name = table_name
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.max_batch_age = max_batch_age
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = rng
+
+        # The pool size bounds the requests in flight, further batches queue
+        # up in the executor so put() never blocks the caller
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_since = None
+        self._futures = []
+        self._deadline = None
+        self._timer = None
+        self._closed = False
+
+        self.written = 0
+        self.failed = 0
+        self.retries = 0
+        self.errors = []
+
+    def put(self, item):
+        """Queue one item, sending a batch when it is full or old enough."""
+        with self._lock:
+            if self._pending_since is None:
+                self._start_batch()
+            self._pending.append({'PutRequest': {'Item': item}})
+            if len(self._pending) < self.batch_size and \
+                    self.clock() - self._pending_since < self.max_batch_age:
+                return
+            batch = self._take_batch()
+        self._submit(batch)
+
+    def flush(self):
+        """Send the pending items without waiting for them to be written."""
+        with self._lock:
+            batch = self._take_batch()
+        if batch:
+            self._submit(batch)
+
+    def close(self, timeout=None):
+        """
+        Flush and wait for every write, giving up at the deadline.
+
+        Batches still queued at the deadline are dropped. Writes already in
+        flight stop retrying and are joined, so no thread keeps running
+        into a frozen Lambda container and their results are counted.
+
+        Returns:
+            dict: Counts of written items, failed items and items still
+                  unwritten at the deadline
+
+        Raises:
+            Exception: The first non-retryable error of any write
+        """
+        self._deadline = None if timeout is None else self.clock() + timeout
+        with self._lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+        self.flush()
+        wait(self._futures, timeout=timeout)
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+        unwritten = sum(len(future.batch) for future in self._futures if future.cancelled())
+        summary = {
+            'written': self.written,
+            'failed': self.failed,
+            'unwritten': unwritten,
+            'retries': self.retries,
+        }
+        count('items_written', self.written)
+        count('items_unwritten', self.failed + unwritten)
+        count('write_retries', self.retries)
+        if self.failed or unwritten:
+            print(f"Warning: {self.failed} items failed and {unwritten} items were not written "
+                  f"before the deadline")
+        if self.errors:
+            raise self.errors[0]
+        return summary
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _start_batch(self):
+        """Start the age of a new pending batch, called with the lock held."""
+        self._pending_since = self.clock()
+        if self._closed:
+            return
+        self._timer = threading.Timer(self.max_batch_age, self._flush_stale)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_stale(self):
+        """Timer callback: send the pending batch once it is old enough."""
+        with self._lock:
+            if self._closed or self._pending_since is None or \
+                    self.clock() - self._pending_since < self.max_batch_age:
+                return
+            self._submit(self._take_batch())
+
+    def _take_batch(self):
+        batch = self._pending[:self.batch_size]
+        self._pending = self._pending[self.batch_size:]
+        self._pending_since = None
+        if self._pending:
+            self._start_batch()
+        return batch
+
+    def _submit(self, batch):
+        future = self._executor.submit(self._write, batch)
+        future.batch = batch
+        self._futures.append(future)
+
+    def _backoff(self, attempt):
+        """Full jitter: a random delay up to the exponential bound."""
+        delay = self.rng() * min(self.max_delay, self.base_delay * (2 ** attempt))
+        if self._deadline is not None:
+            delay = min(delay, max(0.0, self._deadline - self.clock()))
+        self.sleep(delay)
+
+    def _write(self, batch):
+        requests = batch
+        for attempt in range(self.max_retries):
+            if attempt:
+                with self._lock:
+                    self.retries += 1
+                self._backoff(attempt)
+            if self._deadline is not None and self.clock() >= self._deadline:
+                break
+            try:
+                response = self.client.batch_write_item(
+                    RequestItems={self.table_name: requests},
+                    **capacity_kwargs()
+                )
+            except Exception as e:
+                if not is_retryable(e):
+                    self.errors.append(e)
+                    print(f"Error writing batch of {len(requests)} items: {str(e)}")
+                    break
+                print(f"Throttled writing batch of {len(requests)} items, retrying")
+                continue
+
+            capture_capacity(response)
+            unprocessed = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            with self._lock:
+                self.written += len(requests) - len(unprocessed)
+            if not unprocessed:
+                return
+            print(f"Retry {attempt + 1}: {len(unprocessed)} items unprocessed")
+            requests = unprocessed
+
+        with self._lock:
+            self.failed += len(requests)
@@ -114,7 +114,8 @@ def get_regions_from_dynamodb(dynamodb_client=None):
     Get all regions from both partitions via DynamoDB.
 
     This reads from the cloudping_regions_enhanced table which contains
-    regions from both main AWS and EUSC partitions.
+    regions from both main AWS and EUSC partitions. Without an explicit
+    client the container-wide cached region registry is used.
 
     Args:
         dynamodb_client: Optional DynamoDB client. If None, creates one.
@@ -122,32 +123,14 @@ def get_regions_from_dynamodb(dynamodb_client=None):
     Returns:
         list: List of dicts with 'RegionName' and 'partition' keys
     """
+    from .region_registry import get_region_registry, RegionRegistry
+
     if dynamodb_client is None:
-        dynamodb_client = get_cross_partition_dynamodb_client()
-
-    response = dynamodb_client.scan(TableName='cloudping_regions_enhanced')
-
-    regions = []
-    for item in response.get('Items', []):
-        status = item.get('status', {}).get('S', '')
-        if status in ['ENABLED', 'ENABLED_BY_DEFAULT']:
-            regions.append({
-                'RegionName': item['region_name']['S'],
-                'partition': item.get('partition', {'S': 'aws'})['S']
-            })
-
-    # Handle pagination
-    while 'LastEvaluatedKey' in response:
-        response = dynamodb_client.scan(
-            TableName='cloudping_regions_enhanced',
-            ExclusiveStartKey=response['LastEvaluatedKey']
-        )
-        for item in response.get('Items', []):
-            status = item.get('status', {}).get('S', '')
-            if status in ['ENABLED', 'ENABLED_BY_DEFAULT']:
-                regions.append({
-                    'RegionName': item['region_name']['S'],
-                    'partition': item.get('partition', {'S': 'aws'})['S']
-                })
-
-    return regions
+        registry = get_region_registry()
+    else:
+        registry = RegionRegistry(lambda: dynamodb_client)
+
+    return [
+        {'RegionName': record.name, 'partition': record.partition}
+        for record in registry.enabled()
+    ]
@@ -0,0 +1,182 @@
+"""
+Lightweight per-invocation instrumentation for the cloudping Lambdas.
+
+Each invocation collects timing spans, counters and the DynamoDB capacity
+it consumed, then prints a single JSON line in CloudWatch Embedded Metric
+Format. CloudWatch turns the line into metrics, and locally the same line
+can be captured from stdout.
+
+Usage:
+    @instrumented('ping')
+    def ping(event):
+        with span('get_regions'):
+            regions = get_regions()
+        count('targets', len(regions))
+        response = client.batch_write_item(**capacity_kwargs(), RequestItems=...)
+        capture_capacity(response)
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'CloudPing')
+
+
+class Metrics:
+    """Spans, counters and consumed capacity for one invocation."""
+
+    def __init__(self, function_name, clock=time.perf_counter, stream=None):
+        self.function_name = function_name
+        self.clock = clock
+        self.stream = stream
+        self.started = clock()
+        self.spans = {}
+        self.counters = {}
+        self.consumed_capacity = {}
+        self.properties = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        """Time a block, repeated spans with the same name accumulate."""
+        start = self.clock()
+        try:
+            yield
+        finally:
+            elapsed_ms = (self.clock() - start) * 1000
+            with self._lock:
+                self.spans[name] = self.spans.get(name, 0.0) + elapsed_ms
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_property(self, name, value):
+        """Attach a non-metric value (e.g. a region name) to the log line."""
+        self.properties[name] = value
+
+    def capture_capacity(self, response):
+        """Add the ConsumedCapacity of a DynamoDB response to the per-table totals."""
+        consumed = response.get('ConsumedCapacity') if response else None
+        if not consumed:
+            return
+        if isinstance(consumed, dict):
+            consumed = [consumed]
+        with self._lock:
+            for entry in consumed:
+                table = entry.get('TableName', 'unknown')
+                self.consumed_capacity[table] = (
+                    self.consumed_capacity.get(table, 0.0) + float(entry.get('CapacityUnits', 0))
+                )
+
+    def to_record(self, status='ok'):
+        """Build the Embedded Metric Format record for this invocation."""
+        duration_ms = (self.clock() - self.started) * 1000
+        values = {'duration_ms': duration_ms}
+        units = {'duration_ms': 'Milliseconds'}
+
+        for name, elapsed in self.spans.items():
+            values[f'{name}_ms'] = elapsed
+            units[f'{name}_ms'] = 'Milliseconds'
+        for name, value in self.counters.items():
+            values[name] = value
+            units[name] = 'Count'
+        for table, capacity in self.consumed_capacity.items():
+            values[f'{table}_capacity_units'] = capacity
+            units[f'{table}_capacity_units'] = 'Count'
+
+        record = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [['function']],
+                    'Metrics': [{'Name': name, 'Unit': unit} for name, unit in units.items()]
+                }]
+            },
+            'function': self.function_name,
+            'status': status,
+        }
+        record.update(self.properties)
+        record.update({name: round(value, 3) for name, value in values.items()})
+        return record
+
+    def emit(self, status='ok'):
+        """Print the invocation record as one JSON line."""
+        record = self.to_record(status)
+        stream = self.stream or sys.stdout
+        stream.write(json.dumps(record, default=str) + '\n')
+        stream.flush()
+        return record
+
+
+_current = None
+
+
+def current():
+    """Return the Metrics of the running invocation, if any."""
+    return _current
+
+
+@contextmanager
+def invocation(function_name, **kwargs):
+    """Collect metrics for the enclosed block and emit them when it exits."""
+    global _current
+    previous = _current
+    metrics = Metrics(function_name, **kwargs)
+    _current = metrics
+    status = 'ok'
+    try:
+        yield metrics
+    except Exception:
+        status = 'error'
+        raise
+    finally:
+        _current = previous
+        metrics.emit(status)
+
+
+def instrumented(function_name):
+    """Decorator emitting one metrics record per call of a Lambda handler."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with invocation(function_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def span(name):
+    """Time a block against the current invocation, no-op outside of one."""
+    if _current is None:
+        yield
+        return
+    with _current.span(name):
+        yield
+
+
+def count(name, value=1):
+    if _current is not None:
+        _current.count(name, value)
+
+
+def set_property(name, value):
+    if _current is not None:
+        _current.set_property(name, value)
+
+
+def capture_capacity(response):
+    if _current is not None:
+        _current.capture_capacity(response)
+
+
+def capacity_kwargs():
+    """Request arguments asking DynamoDB to report consumed capacity."""
+    return {'ReturnConsumedCapacity': 'TOTAL'}
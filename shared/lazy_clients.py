@@ -0,0 +1,74 @@
+"""
+Lazily created AWS clients, resources and tables.
+
+Creating a boto3 client or resource loads its service model, which is a
+noticeable part of a Lambda cold start. Module level tables and clients
+are declared with the helpers below instead: nothing is created until the
+first attribute access, and every table of the same service and region
+shares one cached resource.
+
+Usage:
+    ping_table = lazy_table('PingTest', region_name="us-east-2")
+    ping_table.query(...)   # the resource and table are created here
+"""
+
+import threading
+from functools import lru_cache
+
+_lock = threading.Lock()
+
+
+class Lazy:
+    """Proxy that creates the wrapped object on first attribute access."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Create (once) and return the wrapped object."""
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+@lru_cache(maxsize=None)
+def _resource(service, region_name):
+    import boto3
+    return boto3.session.Session().resource(service, region_name=region_name)
+
+
+@lru_cache(maxsize=None)
+def _client(service, region_name):
+    import boto3
+    return boto3.session.Session().client(service, region_name=region_name)
+
+
+def get_resource(service, region_name=None):
+    """The shared boto3 resource of a service and region (default: the Lambda's region)."""
+    with _lock:
+        return _resource(service, region_name)
+
+
+def get_client(service, region_name=None):
+    """The shared boto3 client of a service and region (default: the Lambda's region)."""
+    with _lock:
+        return _client(service, region_name)
+
+
+def lazy_resource(service, region_name=None):
+    return Lazy(lambda: get_resource(service, region_name))
+
+
+def lazy_client(service, region_name=None):
+    return Lazy(lambda: get_client(service, region_name))
+
+
+def lazy_table(table_name, region_name=None):
+    return Lazy(lambda: get_resource('dynamodb', region_name).Table(table_name))
@@ -0,0 +1,44 @@
+"""
+Bookkeeping items of the scheduled functions, kept out of the data tables.
+
+The cloudping_metadata table holds one item per name, e.g. the version
+counter of the stored averages. Keeping such items here means no data table
+has reserved keys that its scans and queries have to skip.
+"""
+
+import os
+
+from .instrumentation import capacity_kwargs, capture_capacity
+
+METADATA_TABLE = os.environ.get('METADATA_TABLE', 'cloudping_metadata')
+
+
+def bump_version(metadata_table, name):
+    """Increment the version counter stored under a name."""
+    response = metadata_table.update_item(
+        Key={'name': name},
+        UpdateExpression='ADD version :one',
+        ExpressionAttributeValues={':one': 1},
+        **capacity_kwargs()
+    )
+    capture_capacity(response)
+
+
+def read_version(metadata_table, name):
+    """Get the version counter stored under a name (0 if never bumped)."""
+    return int(read_metadata(metadata_table, name).get('version', 0))
+
+
+def read_metadata(metadata_table, name):
+    """Get the attributes stored under a name, empty if there are none."""
+    response = metadata_table.get_item(Key={'name': name}, **capacity_kwargs())
+    capture_capacity(response)
+    item = response.get('Item', {})
+    item.pop('name', None)
+    return item
+
+
+def write_metadata(metadata_table, name, **attributes):
+    """Replace the attributes stored under a name."""
+    response = metadata_table.put_item(Item={'name': name, **attributes}, **capacity_kwargs())
+    capture_capacity(response)
@@ -0,0 +1,180 @@
+"""
+Hour-of-day / day-of-week latency profiles per region pair.
+
+PairProfiles keeps a 7x24 grid (Monday 00:00 UTC first) for a set of pairs:
+the count and sum of the run averages that fell into every cell, and a
+DDSketch per cell with the buckets of shared.sketch. All cell sketches of
+all pairs live in one sparse array of (cell, bucket) keys and counts, so a
+batch of observations across every pair is folded in with a handful of
+NumPy operations instead of one sketch update per cell.
+
+Profiles are updated incrementally: a batch only reads and rewrites the
+pairs it has observations for. Each pair is persisted as one item (see
+to_item / from_item), cell sketches can be read back as LatencySketch.
+"""
+
+import math
+import os
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from .sketch import LatencySketch
+
+PROFILES_TABLE = os.environ.get('PROFILES_TABLE', 'cloudping_profiles')
+HOURS_PER_DAY = 24
+DAYS_PER_WEEK = 7
+CELLS = HOURS_PER_DAY * DAYS_PER_WEEK
+DAY_NAMES = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+PROFILE_RELATIVE_ACCURACY = 0.02
+# Bucket range of the cell sketches, values outside are clamped
+MIN_VALUE_MS = 0.01
+MAX_VALUE_MS = 100_000.0
+
+# 1970-01-01 was a Thursday
+_EPOCH_WEEKDAY = 3
+
+
+def hour_of_week(timestamps: Sequence[str]) -> np.ndarray:
+    """Cell index (weekday * 24 + hour, Monday first) of PingTest timestamps in UTC."""
+    seconds = np.array([t[:19] for t in timestamps], dtype='datetime64[s]').astype(np.int64)
+    hours = seconds // 3600
+    weekday = (hours // HOURS_PER_DAY + _EPOCH_WEEKDAY) % DAYS_PER_WEEK
+    return weekday * HOURS_PER_DAY + hours % HOURS_PER_DAY
+
+
+class PairProfiles:
+    """7x24 latency profiles of `size` pairs."""
+
+    def __init__(self, size: int, relative_accuracy: float = PROFILE_RELATIVE_ACCURACY):
+        self.size = size
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.min_bucket = math.ceil(math.log(MIN_VALUE_MS) / self._log_gamma)
+        self.buckets = math.ceil(math.log(MAX_VALUE_MS) / self._log_gamma) - self.min_bucket + 1
+
+        self.count = np.zeros((size, CELLS), dtype=np.int64)
+        self.total = np.zeros((size, CELLS))
+        # Sparse cell sketches: sorted keys (pair * CELLS + cell) * buckets + bucket
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def update(self, pairs: Sequence[int], cells: Sequence[int], values: Sequence[float]) -> None:
+        """
+        Fold a batch of observations into the profiles.
+
+        Args:
+            pairs: Pair (row) index of every observation
+            cells: Cell index of every observation, see hour_of_week
+            values: Latencies in milliseconds, NaN and non-positive values are ignored
+        """
+        pairs = np.asarray(pairs, dtype=np.int64)
+        cells = np.asarray(cells, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        valid = values > 0
+        pairs, cells, values = pairs[valid], cells[valid], values[valid]
+        if not len(values):
+            return
+
+        flat = pairs * CELLS + cells
+        self.count += np.bincount(flat, minlength=self.size * CELLS).reshape(self.size, CELLS)
+        self.total += np.bincount(flat, weights=values, minlength=self.size * CELLS).reshape(self.size, CELLS)
+
+        buckets = np.ceil(np.log(values) / self._log_gamma).astype(np.int64) - self.min_bucket
+        keys = flat * self.buckets + np.clip(buckets, 0, self.buckets - 1)
+        merged, inverse = np.unique(np.concatenate([self.keys, keys]), return_inverse=True)
+        weights = np.concatenate([self.counts, np.ones(len(keys), dtype=np.int64)])
+        self.keys = merged
+        self.counts = np.bincount(inverse, weights=weights).astype(np.int64)
+
+    def mean(self) -> np.ndarray:
+        """Mean per pair and cell, NaN for empty cells."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 0, self.total / np.maximum(self.count, 1), np.nan)
+
+    def quantiles(self, pair: int, qs: Sequence[float]) -> np.ndarray:
+        """
+        Estimate quantiles of every cell of one pair, qs in [0, 1].
+
+        Interpolates between neighbouring ranks like LatencySketch.quantiles.
+
+        Returns:
+            numpy.ndarray: len(qs) x CELLS, NaN for empty cells
+        """
+        keys, counts = self._pair_entries(pair)
+        qs = np.asarray(qs, dtype=np.float64)
+        result = np.full((len(qs), CELLS), np.nan)
+        if not len(keys):
+            return result
+
+        cells = keys // self.buckets % CELLS
+        cumulative = np.cumsum(counts)
+        totals = np.bincount(cells, weights=counts, minlength=CELLS).astype(np.int64)
+        # Cumulative count before the first entry of every cell
+        before = np.concatenate([[0], np.cumsum(totals)[:-1]])
+        occupied = np.flatnonzero(totals)
+
+        for row, q in enumerate(qs):
+            ranks = q * (totals[occupied] - 1)
+            lower = self._value_at(keys, cumulative, before[occupied] + np.floor(ranks))
+            upper = self._value_at(keys, cumulative, before[occupied] + np.ceil(ranks))
+            result[row, occupied] = lower + (ranks - np.floor(ranks)) * (upper - lower)
+        return result
+
+    def _value_at(self, keys, cumulative, ranks):
+        entry = np.minimum(np.searchsorted(cumulative, ranks, side='right'), len(keys) - 1)
+        bucket = keys[entry] % self.buckets + self.min_bucket
+        return 2 * self.gamma ** bucket / (self.gamma + 1)
+
+    def _pair_entries(self, pair):
+        first = np.searchsorted(self.keys, pair * CELLS * self.buckets)
+        last = np.searchsorted(self.keys, (pair + 1) * CELLS * self.buckets)
+        return self.keys[first:last], self.counts[first:last]
+
+    def cell_sketch(self, pair: int, cell: int) -> LatencySketch:
+        """The sketch of one cell as a LatencySketch."""
+        keys, counts = self._pair_entries(pair)
+        in_cell = keys // self.buckets % CELLS == cell
+        sketch = LatencySketch(self.relative_accuracy)
+        if in_cell.any():
+            buckets = keys[in_cell] % self.buckets + self.min_bucket
+            sketch.offset = int(buckets[0])
+            sketch.counts = np.zeros(int(buckets[-1] - buckets[0]) + 1, dtype=np.int64)
+            sketch.counts[buckets - buckets[0]] = counts[in_cell]
+        return sketch
+
+    def to_item(self, pair: int) -> Dict[str, bytes]:
+        """Serialize one pair's profile into binary attributes."""
+        keys, counts = self._pair_entries(pair)
+        local = keys - pair * CELLS * self.buckets
+        return {
+            'relative_accuracy': str(self.relative_accuracy),
+            'count': self.count[pair].astype('<u4').tobytes(),
+            'total': self.total[pair].astype('<f8').tobytes(),
+            'sketch_keys': local.astype('<u4').tobytes(),
+            'sketch_counts': counts.astype('<u4').tobytes(),
+        }
+
+    @classmethod
+    def from_items(cls, items: List[Dict], relative_accuracy: float = PROFILE_RELATIVE_ACCURACY) -> 'PairProfiles':
+        """
+        Load profiles from persisted items, in order; None for a pair without a profile yet.
+        """
+        profiles = cls(len(items), relative_accuracy)
+        keys, counts = [], []
+        for pair, item in enumerate(items):
+            if not item:
+                continue
+            state = {key: bytes(getattr(value, 'value', value)) for key, value in item.items()
+                     if key in ('count', 'total', 'sketch_keys', 'sketch_counts')}
+            profiles.count[pair] = np.frombuffer(state['count'], dtype='<u4')
+            profiles.total[pair] = np.frombuffer(state['total'], dtype='<f8')
+            keys.append(np.frombuffer(state['sketch_keys'], dtype='<u4').astype(np.int64)
+                        + pair * CELLS * profiles.buckets)
+            counts.append(np.frombuffer(state['sketch_counts'], dtype='<u4').astype(np.int64))
+        if keys:
+            profiles.keys = np.concatenate(keys)
+            profiles.counts = np.concatenate(counts)
+        return profiles
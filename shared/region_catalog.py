@@ -0,0 +1,135 @@
+"""
+Stable integer identifiers for regions across both partitions.
+
+Region names are only needed when reading from or writing to DynamoDB and
+when serializing API responses. In between, regions are small integers and
+a (from, to) pair is a single index into a flat N*N array:
+
+    pair_index = from_id * N + to_id
+
+KNOWN_REGIONS is append-only: a region keeps its position forever, so IDs
+are the same in every Lambda and every run. Regions missing from the list
+get provisional IDs after the known ones (in name order) until they are
+added here. Pair indices depend on the catalog size and must never be
+persisted, only region IDs are stable.
+
+The pair index is used where whole N*N matrices are built: the API's
+latency matrices (/latencies, /latencies/diff, /percentiles, /routes,
+/placement) and the anomaly detection baselines.
+The per source region aggregation (calculate_avgs, stream_aggregation)
+only ever holds one row and keeps it keyed by destination name. The prober
+uses the catalog for a stable target order.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Append new regions at the end, never reorder or remove entries
+KNOWN_REGIONS = (
+    'us-east-1',
+    'us-west-1',
+    'us-west-2',
+    'eu-west-1',
+    'ap-southeast-1',
+    'ap-northeast-1',
+    'ap-southeast-2',
+    'sa-east-1',
+    'us-east-2',
+    'ap-northeast-2',
+    'ap-south-1',
+    'ca-central-1',
+    'eu-central-1',
+    'eu-west-2',
+    'eu-west-3',
+    'ap-northeast-3',
+    'eu-north-1',
+    'ap-east-1',
+    'me-south-1',
+    'af-south-1',
+    'eu-south-1',
+    'ap-southeast-3',
+    'me-central-1',
+    'eu-central-2',
+    'eu-south-2',
+    'ap-south-2',
+    'ap-southeast-4',
+    'il-central-1',
+    'ca-west-1',
+    'ap-southeast-5',
+    'mx-central-1',
+    'ap-southeast-7',
+    'ap-east-2',
+    'ap-southeast-6',
+    'eusc-de-east-1',
+)
+
+
+class RegionCatalog:
+    """Bidirectional mapping between region names and dense integer IDs."""
+
+    def __init__(self, names: Iterable[str] = KNOWN_REGIONS):
+        self.names: Tuple[str, ...] = tuple(names)
+        self._ids: Dict[str, int] = {name: i for i, name in enumerate(self.names)}
+        if len(self._ids) != len(self.names):
+            raise ValueError("Region catalog contains duplicate names")
+
+    @property
+    def size(self) -> int:
+        return len(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._ids
+
+    def id(self, name: str) -> int:
+        return self._ids[name]
+
+    def name(self, region_id: int) -> str:
+        return self.names[region_id]
+
+    def ids(self, names: Iterable[str]) -> List[int]:
+        return [self._ids[name] for name in names]
+
+    def with_regions(self, names: Iterable[str]) -> 'RegionCatalog':
+        """Return this catalog, extended with provisional IDs for unknown names."""
+        unknown = sorted({name for name in names if name not in self._ids})
+        if not unknown:
+            return self
+        return RegionCatalog(self.names + tuple(unknown))
+
+    def pair_index(self, from_id: int, to_id: int) -> int:
+        return from_id * len(self.names) + to_id
+
+    def pair_index_by_name(self, from_name: str, to_name: str) -> int:
+        return self.pair_index(self._ids[from_name], self._ids[to_name])
+
+    def pair(self, index: int) -> Tuple[int, int]:
+        """Return the (from_id, to_id) of a pair index."""
+        return divmod(index, len(self.names))
+
+    def matrix_to_dict(self, values, ndigits: Optional[int] = None) -> Dict[str, Dict[str, float]]:
+        """
+        Serialize a flat N*N array (NaN = missing) into {from: {to: value}}.
+
+        This is the only place names are produced for matrix responses.
+        """
+        import numpy as np
+
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+        result: Dict[str, Dict[str, float]] = {}
+        for index in np.flatnonzero(~np.isnan(values)).tolist():
+            from_id, to_id = self.pair(index)
+            value = float(values[index])
+            if ndigits is not None:
+                value = round(value, ndigits)
+            result.setdefault(self.names[from_id], {})[self.names[to_id]] = value
+        return result
+
+
+_default_catalog = RegionCatalog()
+
+
+def get_region_catalog(names: Iterable[str] = ()) -> RegionCatalog:
+    """Get the default catalog, extended with any region names it does not know."""
+    return _default_catalog.with_regions(names)
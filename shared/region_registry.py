@@ -0,0 +1,185 @@
+"""
+Cached registry of the regions in the cloudping_regions_enhanced table.
+
+The table is small but was scanned in full by every ping function on every
+run, by the scheduler and by the API. The registry loads it once per Lambda
+container and keeps the records in memory across warm invocations.
+
+Writers of the table bump a version counter stored in a reserved item
+(region_name = '__version__'). Before reusing its copy the registry reads
+just that item, and only scans the table again when the version changed.
+"""
+
+import os
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from .instrumentation import capacity_kwargs, capture_capacity
+
+REGIONS_TABLE = os.environ.get('REGIONS_TABLE', 'cloudping_regions_enhanced')
+VERSION_ITEM_KEY = '__version__'
+ENABLED_STATUSES = ('ENABLED', 'ENABLED_BY_DEFAULT')
+
+
+class RegionRecord(NamedTuple):
+    """A single row of cloudping_regions_enhanced."""
+    name: str
+    partition: str
+    status: str
+    is_opt_in: bool
+    ping_function_exists: bool
+    earliest_data_timestamp: Optional[str]
+    most_recent_data_timestamp: Optional[str]
+    # The low-level item the record was read from, with every attribute
+    item: Optional[Dict] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.status in ENABLED_STATUSES
+
+    @property
+    def active(self) -> bool:
+        """Enabled, has a ping function and has produced data."""
+        return self.enabled and self.ping_function_exists and self.earliest_data_timestamp is not None
+
+    @classmethod
+    def from_item(cls, item: Dict) -> 'RegionRecord':
+        """Build a record from a low-level ({'S': ...}) DynamoDB item."""
+        def timestamp(name):
+            value = item.get(name, {}).get('S', 'None')
+            return None if value == 'None' else value
+
+        return cls(
+            name=item['region_name']['S'],
+            partition=item.get('partition', {'S': 'aws'})['S'],
+            status=item.get('status', {}).get('S', ''),
+            is_opt_in=item.get('is_opt_in', {}).get('BOOL', False),
+            ping_function_exists=item.get('ping_function_exists', {}).get('BOOL', False),
+            earliest_data_timestamp=timestamp('earliest_data_timestamp'),
+            most_recent_data_timestamp=timestamp('most_recent_data_timestamp'),
+            item=item,
+        )
+
+    def to_item(self) -> Dict:
+        """Serialize back to the deserialized table item shape served by the API."""
+        if self.item is not None:
+            # Every attribute of the row, as a table scan returns it
+            from boto3.dynamodb.types import TypeDeserializer
+            deserializer = TypeDeserializer()
+            return {name: deserializer.deserialize(value) for name, value in self.item.items()}
+        return {
+            'region_name': self.name,
+            'partition': self.partition,
+            'status': self.status,
+            'is_opt_in': self.is_opt_in,
+            'ping_function_exists': self.ping_function_exists,
+            'earliest_data_timestamp': str(self.earliest_data_timestamp),
+            'most_recent_data_timestamp': str(self.most_recent_data_timestamp),
+        }
+
+
+class RegionRegistry:
+    """In-memory, version checked copy of the regions table."""
+
+    def __init__(self, client_factory: Callable, table_name: str = REGIONS_TABLE,
+                 check_interval: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self._client_factory = client_factory
+        self._client = None
+        self.table_name = table_name
+        self.check_interval = check_interval
+        self.clock = clock
+        self.version = None
+        self._records: List[RegionRecord] = []
+        self._by_name: Dict[str, RegionRecord] = {}
+        self._checked_at = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._client_factory()
+        return self._client
+
+    def _read_version(self) -> int:
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={'region_name': {'S': VERSION_ITEM_KEY}},
+            ProjectionExpression='version',
+            **capacity_kwargs()
+        )
+        capture_capacity(response)
+        return int(response.get('Item', {}).get('version', {'N': '0'})['N'])
+
+    def _load(self) -> None:
+        records = []
+        kwargs = {'TableName': self.table_name, **capacity_kwargs()}
+        while True:
+            response = self.client.scan(**kwargs)
+            capture_capacity(response)
+            for item in response.get('Items', []):
+                if item['region_name']['S'] == VERSION_ITEM_KEY:
+                    continue
+                records.append(RegionRecord.from_item(item))
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        self._records = records
+        self._by_name = {record.name: record for record in records}
+        print(f"Loaded {len(records)} regions from {self.table_name} (version {self.version})")
+
+    def refresh(self, force: bool = False) -> None:
+        """Reload the table if its version changed since the last load."""
+        now = self.clock()
+        if not force and self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+
+        version = self._read_version()
+        self._checked_at = now
+        if force or version != self.version or not self._records:
+            self.version = version
+            self._load()
+
+    def all(self) -> List[RegionRecord]:
+        self.refresh()
+        return list(self._records)
+
+    def enabled(self) -> List[RegionRecord]:
+        return [record for record in self.all() if record.enabled]
+
+    def active(self) -> List[RegionRecord]:
+        return [record for record in self.all() if record.active]
+
+    def get(self, name: str) -> Optional[RegionRecord]:
+        self.refresh()
+        return self._by_name.get(name)
+
+
+_registries: Dict[str, RegionRegistry] = {}
+
+
+def get_region_registry(client_factory: Optional[Callable] = None,
+                        table_name: str = REGIONS_TABLE) -> RegionRegistry:
+    """
+    Get the registry shared by all invocations of this Lambda container.
+
+    Args:
+        client_factory: Callable returning a low-level DynamoDB client. Only
+                        used the first time, defaults to the cross-partition client.
+        table_name: The regions table name
+    """
+    if table_name not in _registries:
+        if client_factory is None:
+            from .cross_partition import get_cross_partition_dynamodb_client
+            client_factory = get_cross_partition_dynamodb_client
+        _registries[table_name] = RegionRegistry(client_factory, table_name)
+    return _registries[table_name]
+
+
+def bump_registry_version(client, table_name: str = REGIONS_TABLE) -> None:
+    """Signal cached registries that the regions table changed."""
+    client.update_item(
+        TableName=table_name,
+        Key={'region_name': {'S': VERSION_ITEM_KEY}},
+        UpdateExpression='ADD version :one',
+        ExpressionAttributeValues={':one': {'N': '1'}}
+    )
@@ -0,0 +1,234 @@
+"""
+Compact encoding of per-attempt ping results.
+
+PingTest items historically store every attempt as a DynamoDB list of maps
+(`{"M": {"seq": {"N": ..}, "time": {"N": ..}}}`), which dominates the item
+size. The packed representation stores the same data in a single binary
+`samples` attribute:
+
+    byte 0      format version
+    bytes 1..   one value per attempt, in attempt (seq) order, little-endian
+
+    version 1:  float32 milliseconds, NaN for a failed attempt
+    version 2:  uint16 tenths of a millisecond, 0xFFFF for a failed attempt
+
+Where the prober reads the kernel's RTT of each connection (TCP_INFO), it is
+stored next to the connect times: `rtt_samples` and `rttvar_samples` in the
+same format (milliseconds, NaN for failed attempts or attempts without
+kernel RTT), or `rtt_us`/`rttvar_us` in the maps of a results list. Readers
+choose the source of their latency values: "connect" (the wall-clock
+connect time) or "kernel".
+
+Runs that spread their attempts across an endpoint's front-end addresses
+store the sampled addresses in `frontends` (a list of strings) and the
+address of every attempt in `frontend_index`, one byte per attempt in seq
+order indexing into `frontends` (FRONTEND_UNKNOWN where not recorded).
+
+Encoding only needs the standard library so it can run in the ping functions.
+Decoding returns NumPy arrays via `frombuffer`, NumPy is imported lazily.
+"""
+
+import struct
+
+SAMPLES_ATTRIBUTE = 'samples'
+RTT_SAMPLES_ATTRIBUTE = 'rtt_samples'
+RTTVAR_SAMPLES_ATTRIBUTE = 'rttvar_samples'
+LATENCY_SOURCES = ('connect', 'kernel')
+FRONTENDS_ATTRIBUTE = 'frontends'
+FRONTEND_INDEX_ATTRIBUTE = 'frontend_index'
+FRONTEND_UNKNOWN = 0xFF
+SAMPLES_FORMAT_FLOAT32 = 1
+SAMPLES_FORMAT_UINT16_TENTH_MS = 2
+
+_UINT16_FAILED = 0xFFFF
+_UINT16_MAX_VALUE = 0xFFFE
+# Packed attribute and results list key (with its scale to ms) per latency source
+_SOURCE_ATTRIBUTES = {'connect': SAMPLES_ATTRIBUTE, 'kernel': RTT_SAMPLES_ATTRIBUTE}
+_SOURCE_RESULTS_KEYS = {'connect': ('time', 1.0), 'kernel': ('rtt_us', 1000.0)}
+
+
+def encode_samples(attempt_times, version=SAMPLES_FORMAT_FLOAT32):
+    """
+    Pack per-attempt connection times into a versioned binary blob.
+
+    Args:
+        attempt_times: List of times in milliseconds, one per attempt in seq
+                       order. Failed attempts are None.
+        version: SAMPLES_FORMAT_FLOAT32 or SAMPLES_FORMAT_UINT16_TENTH_MS
+
+    Returns:
+        bytes: The encoded samples
+    """
+    if version == SAMPLES_FORMAT_FLOAT32:
+        values = [float('nan') if t is None else float(t) for t in attempt_times]
+        return struct.pack(f'<B{len(values)}f', version, *values)
+
+    if version == SAMPLES_FORMAT_UINT16_TENTH_MS:
+        values = [
+            _UINT16_FAILED if t is None else min(int(round(float(t) * 10)), _UINT16_MAX_VALUE)
+            for t in attempt_times
+        ]
+        return struct.pack(f'<B{len(values)}H', version, *values)
+
+    raise ValueError(f"Unknown samples format version: {version}")
+
+
+def decode_samples(blob):
+    """
+    Decode a packed samples blob into a float64 NumPy array of milliseconds.
+
+    Failed attempts are returned as NaN so positions still match attempt seq.
+    """
+    import numpy as np
+
+    blob = bytes(blob)
+    if not blob:
+        return np.empty(0, dtype=np.float64)
+
+    version = blob[0]
+    if version == SAMPLES_FORMAT_FLOAT32:
+        return np.frombuffer(blob, dtype='<f4', offset=1).astype(np.float64)
+
+    if version == SAMPLES_FORMAT_UINT16_TENTH_MS:
+        raw = np.frombuffer(blob, dtype='<u2', offset=1)
+        values = raw.astype(np.float64) / 10.0
+        values[raw == _UINT16_FAILED] = np.nan
+        return values
+
+    raise ValueError(f"Unknown samples format version: {version}")
+
+
+def _unwrap(value, type_key):
+    """Return the raw value of a low-level ({'N': ...}) or deserialized attribute."""
+    if isinstance(value, dict) and type_key in value:
+        return value[type_key]
+    return value
+
+
+def item_samples(item, source='connect'):
+    """
+    Get the per-attempt samples of a PingTest item, whatever its encoding.
+
+    Works on both low-level client items and items deserialized by the
+    boto3 resource API. Only successful attempts are returned, and with
+    source="kernel" only the attempts that recorded a kernel RTT.
+
+    Returns:
+        numpy.ndarray: float64 latencies in milliseconds
+    """
+    import numpy as np
+
+    attribute = _SOURCE_ATTRIBUTES[source]
+    if attribute in item:
+        blob = _unwrap(item[attribute], 'B')
+        # boto3 resources wrap binary attributes in a Binary object
+        blob = getattr(blob, 'value', blob)
+        values = decode_samples(blob)
+        return values[~np.isnan(values)]
+
+    key, scale = _SOURCE_RESULTS_KEYS[source]
+    results = [_unwrap(r, 'M') for r in _unwrap(item.get('results', []), 'L')]
+    return np.array(
+        [float(_unwrap(r[key], 'N')) / scale for r in results if key in r],
+        dtype=np.float64
+    )
+
+
+def run_average(item, source='connect'):
+    """
+    Average latency of one PingTest item in ms, None for a run without any
+    successful attempt (or without kernel RTT, for source="kernel").
+    """
+    if source == 'connect':
+        return float(_unwrap(item['avg'], 'N')) if 'avg' in item else None
+    values = item_samples(item, source)
+    return float(values.mean()) if len(values) else None
+
+
+def concat_samples(items, source='connect'):
+    """
+    Get the successful attempt samples of many PingTest items as one array.
+
+    Packed samples of the same format are joined into a single buffer and
+    decoded at once, so only items with a legacy results list are read
+    value by value.
+
+    Returns:
+        numpy.ndarray: float64 latencies in milliseconds
+    """
+    import numpy as np
+
+    attribute = _SOURCE_ATTRIBUTES[source]
+    blobs = {}
+    parts = []
+    for item in items:
+        if attribute in item:
+            blob = _unwrap(item[attribute], 'B')
+            blob = bytes(getattr(blob, 'value', blob))
+            if len(blob) > 1:
+                blobs.setdefault(blob[0], []).append(blob[1:])
+        elif SAMPLES_ATTRIBUTE not in item:
+            parts.append(item_samples(item, source))
+
+    for version, chunks in blobs.items():
+        values = decode_samples(bytes([version]) + b''.join(chunks))
+        parts.append(values[~np.isnan(values)])
+
+    if not parts:
+        return np.empty(0, dtype=np.float64)
+    return np.concatenate(parts)
+
+
+def attempt_values(item, source='connect'):
+    """
+    Every attempt's latency of a PingTest item in seq order, NaN for failed
+    attempts (and, for source="kernel", attempts without kernel RTT).
+
+    Returns:
+        numpy.ndarray: float64 latencies in milliseconds, one per attempt
+    """
+    import numpy as np
+
+    attribute = _SOURCE_ATTRIBUTES[source]
+    attempts = int(_unwrap(item.get('attempts', 0), 'N'))
+    if attribute in item:
+        blob = _unwrap(item[attribute], 'B')
+        return decode_samples(getattr(blob, 'value', blob))
+
+    values = np.full(attempts, np.nan)
+    if SAMPLES_ATTRIBUTE in item:
+        return values
+    key, scale = _SOURCE_RESULTS_KEYS[source]
+    for result in _unwrap(item.get('results', []), 'L'):
+        result = _unwrap(result, 'M')
+        seq = int(_unwrap(result['seq'], 'N'))
+        if key in result and seq < attempts:
+            values[seq] = float(_unwrap(result[key], 'N')) / scale
+    return values
+
+
+def frontend_samples(items, source='connect'):
+    """
+    Group the attempts of PingTest items by the front-end address they connected to.
+
+    Items without front-end addresses are skipped.
+
+    Returns:
+        dict: {address: numpy.ndarray}, float64 latencies of every attempt
+              in milliseconds with NaN for failed attempts
+    """
+    import numpy as np
+
+    parts = {}
+    for item in items:
+        if FRONTEND_INDEX_ATTRIBUTE not in item:
+            continue
+        addresses = [_unwrap(address, 'S') for address in _unwrap(item[FRONTENDS_ATTRIBUTE], 'L')]
+        blob = _unwrap(item[FRONTEND_INDEX_ATTRIBUTE], 'B')
+        indexes = np.frombuffer(bytes(getattr(blob, 'value', blob)), dtype=np.uint8)
+        values = attempt_values(item, source)[:len(indexes)]
+        indexes = indexes[:len(values)]
+        for index in np.unique(indexes):
+            if index < len(addresses):
+                parts.setdefault(addresses[index], []).append(values[indexes == index])
+    return {address: np.concatenate(values) for address, values in parts.items()}
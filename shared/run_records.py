@@ -0,0 +1,177 @@
+"""
+Run-level PingTest records.
+
+Instead of one PingTest item per destination, a probe run can be stored as
+a single item per (source region, timestamp) in the PingTestRuns table,
+with every destination's statistics in compact columnar attributes:
+
+    regionsTo       comma separated destination regions, in column order
+    partitionsTo    comma separated destination partitions
+    stats           binary, see below
+    samples         binary, every destination's attempts back to back in
+                    shared.result_encoding format (one version byte)
+    rtt_samples     optional, the attempts' kernel RTT and RTT variance laid
+    rttvar_samples  out like samples (float32), when the prober read them
+    frontends       optional, each destination's sampled front-end addresses,
+                    comma separated, destinations separated by semicolons
+    frontend_index  optional, one byte per attempt laid out like samples
+                    (no version byte), see shared.result_encoding
+
+    stats layout (little-endian):
+        B       format version (2)
+        H       number of destinations n
+        n*d     avg, then n*d min, n*d max, n*d variance (NaN for failed runs)
+        n*B     attempts, then n*B successful attempts, n*B truncated flag
+        n*B     timed out attempts, then n*B refused attempts (version 2)
+
+Readers never see run items directly: expand_run_item turns one into the
+per-destination items a PingTest query would have returned, so rollups,
+averages and history read both layouts the same way.
+"""
+
+import math
+import os
+import struct
+from decimal import Decimal
+
+from .result_encoding import (
+    SAMPLES_FORMAT_FLOAT32, SAMPLES_FORMAT_UINT16_TENTH_MS, RTT_SAMPLES_ATTRIBUTE, RTTVAR_SAMPLES_ATTRIBUTE,
+    FRONTENDS_ATTRIBUTE, FRONTEND_INDEX_ATTRIBUTE, FRONTEND_UNKNOWN, encode_samples
+)
+
+RUNS_TABLE = os.environ.get('RUNS_TABLE', 'PingTestRuns')
+# Readers take every run from exactly one table. With RESULTS_LAYOUT "both"
+# each run is also a PingTest item, so only "run" reads the runs table
+RUNS_TABLE_ENABLED = os.environ.get('RESULTS_LAYOUT', 'items') == 'run'
+RUN_FORMAT_VERSION = 2
+
+_HEADER = struct.Struct('<BH')
+_LATENCY_COLUMNS = ('avg', 'min', 'max', 'variance')
+_COUNT_COLUMNS = {
+    1: ('attempts', 'attemptsSuccess', 'truncated'),
+    2: ('attempts', 'attemptsSuccess', 'truncated', 'failuresTimeout', 'failuresRefused'),
+}
+_SAMPLE_SIZES = {SAMPLES_FORMAT_FLOAT32: 4, SAMPLES_FORMAT_UINT16_TENTH_MS: 2}
+
+
+def build_run_item(region_name, partition, timestamp, port, sampling_mode, destinations,
+                   samples_format=SAMPLES_FORMAT_FLOAT32):
+    """
+    Build the low-level ({'S': ...}) run item of one probe run.
+
+    Args:
+        destinations: One dict per destination with regionTo, partitionTo,
+                      avg, min, max, variance (NaN for failed runs), attempts,
+                      attemptsSuccess, truncated, failuresTimeout,
+                      failuresRefused, attempt_times (None for failed attempts)
+                      and optionally kernel_rtts ((rtt_us, rttvar_us) or None),
+                      frontends (addresses) and frontend_index (one per attempt)
+    """
+    n = len(destinations)
+    stats = _HEADER.pack(RUN_FORMAT_VERSION, n)
+    for column in _LATENCY_COLUMNS:
+        stats += struct.pack(f'<{n}d', *(float(d[column]) for d in destinations))
+    for column in _COUNT_COLUMNS[RUN_FORMAT_VERSION]:
+        stats += struct.pack(f'<{n}B', *(min(int(d[column]), 255) for d in destinations))
+
+    attempt_times = [t for d in destinations for t in d['attempt_times']]
+    item = {
+        'region': {'S': region_name},
+        'timestamp': {'S': timestamp},
+        'partition': {'S': partition},
+        'port': {'N': str(port)},
+        'samplingMode': {'S': sampling_mode},
+        'destinations': {'N': str(n)},
+        'regionsTo': {'S': ','.join(d['regionTo'] for d in destinations)},
+        'partitionsTo': {'S': ','.join(d['partitionTo'] for d in destinations)},
+        'stats': {'B': stats},
+        'samples': {'B': encode_samples(attempt_times, samples_format)},
+    }
+    kernel_rtts = [
+        rtt for d in destinations for rtt in d.get('kernel_rtts') or [None] * len(d['attempt_times'])
+    ]
+    if any(kernel_rtts):
+        for attribute, index in ((RTT_SAMPLES_ATTRIBUTE, 0), (RTTVAR_SAMPLES_ATTRIBUTE, 1)):
+            values = [None if rtt is None else rtt[index] / 1000 for rtt in kernel_rtts]
+            item[attribute] = {'B': encode_samples(values)}
+    if any(d.get('frontends') for d in destinations):
+        item[FRONTENDS_ATTRIBUTE] = {'S': ';'.join(','.join(d.get('frontends') or []) for d in destinations)}
+        item[FRONTEND_INDEX_ATTRIBUTE] = {'B': bytes(
+            index for d in destinations
+            for index in d.get('frontend_index') or [FRONTEND_UNKNOWN] * len(d['attempt_times'])
+        )}
+    return item
+
+
+def _blob(value):
+    return bytes(getattr(value, 'value', value))
+
+
+def expand_run_item(item):
+    """
+    Expand a deserialized run item into per-destination PingTest style items.
+
+    Numbers are Decimals and samples are packed per destination, like the
+    items boto3's resource API returns for the legacy layout. Failed runs
+    have no latency attributes.
+    """
+    stats = _blob(item['stats'])
+    version, n = _HEADER.unpack_from(stats)
+    if version not in _COUNT_COLUMNS:
+        raise ValueError(f"Unknown run format version: {version}")
+
+    offset = _HEADER.size
+    columns = {}
+    for column in _LATENCY_COLUMNS:
+        columns[column] = struct.unpack_from(f'<{n}d', stats, offset)
+        offset += 8 * n
+    for column in _COUNT_COLUMNS[version]:
+        columns[column] = struct.unpack_from(f'<{n}B', stats, offset)
+        offset += n
+
+    samples = _blob(item['samples'])
+    samples_format = samples[0]
+    sample_size = _SAMPLE_SIZES[samples_format]
+    rtt_blobs = {
+        attribute: _blob(item[attribute])
+        for attribute in (RTT_SAMPLES_ATTRIBUTE, RTTVAR_SAMPLES_ATTRIBUTE) if attribute in item
+    }
+    regions_to = item['regionsTo'].split(',') if n else []
+    frontends = item[FRONTENDS_ATTRIBUTE].split(';') if FRONTENDS_ATTRIBUTE in item else [''] * n
+    frontend_index = _blob(item[FRONTEND_INDEX_ATTRIBUTE]) if FRONTEND_INDEX_ATTRIBUTE in item else b''
+    partitions_to = item['partitionsTo'].split(',') if n else []
+
+    expanded = []
+    position = 1
+    attempt = 0
+    for i in range(n):
+        attempts = columns['attempts'][i]
+        end = position + attempts * sample_size
+        destination = {
+            'region': item['region'],
+            'regionTo': regions_to[i],
+            'partition': item['partition'],
+            'partitionTo': partitions_to[i],
+            'timestamp': item['timestamp'],
+            'port': item['port'],
+            'samplingMode': item['samplingMode'],
+            'truncated': bool(columns['truncated'][i]),
+            'samples': bytes([samples_format]) + samples[position:end],
+        }
+        for attribute, blob in rtt_blobs.items():
+            size = _SAMPLE_SIZES[blob[0]]
+            start = 1 + attempt * size
+            destination[attribute] = blob[:1] + blob[start:start + attempts * size]
+        if frontends[i]:
+            destination[FRONTENDS_ATTRIBUTE] = frontends[i].split(',')
+            destination[FRONTEND_INDEX_ATTRIBUTE] = frontend_index[attempt:attempt + attempts]
+        for column in _COUNT_COLUMNS[version]:
+            if column != 'truncated':
+                destination[column] = Decimal(columns[column][i])
+        if not math.isnan(columns['avg'][i]):
+            for column in _LATENCY_COLUMNS:
+                destination[column] = Decimal(repr(columns[column][i]))
+        expanded.append(destination)
+        position = end
+        attempt += attempts
+    return expanded
@@ -0,0 +1,170 @@
+"""
+Mergeable latency quantile sketch.
+
+LatencySketch is a DDSketch: values are counted in logarithmic buckets so
+that any quantile is returned with a bounded relative error (1% by
+default), and two sketches are merged by adding their bucket counts. This
+makes sketches over days, weeks or groups of regions cheap to combine
+without going back to the raw data.
+
+Serialized layout (little-endian):
+
+    B   format version (1)
+    d   relative accuracy
+    I   count of zero / non-positive values
+    i   index of the first bucket
+    I   number of buckets
+    B   bytes per bucket count (2 or 4)
+    ... bucket counts
+"""
+
+import math
+import struct
+
+import numpy as np
+
+SKETCH_FORMAT_VERSION = 1
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+_HEADER = struct.Struct('<BdIiIB')
+
+
+class LatencySketch:
+    """DDSketch over positive latencies in milliseconds."""
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.zero_count = 0
+        self.offset = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    @property
+    def count(self):
+        return int(self.counts.sum()) + self.zero_count
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self, min_index, max_index):
+        """Make sure buckets min_index..max_index exist."""
+        if not len(self.counts):
+            self.offset = min_index
+            self.counts = np.zeros(max_index - min_index + 1, dtype=np.int64)
+            return
+        new_offset = min(self.offset, min_index)
+        new_end = max(self.offset + len(self.counts) - 1, max_index)
+        if new_offset == self.offset and new_end == self.offset + len(self.counts) - 1:
+            return
+        counts = np.zeros(new_end - new_offset + 1, dtype=np.int64)
+        start = self.offset - new_offset
+        counts[start:start + len(self.counts)] = self.counts
+        self.offset = new_offset
+        self.counts = counts
+
+    def add(self, values):
+        """Add one value or an array of values (vectorized)."""
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+        values = values[~np.isnan(values)]
+        positive = values[values > 0]
+        self.zero_count += int(len(values) - len(positive))
+        if not len(positive):
+            return self
+
+        indexes = np.ceil(np.log(positive) / self._log_gamma).astype(np.int64)
+        min_index = int(indexes.min())
+        self._grow(min_index, int(indexes.max()))
+        bucket_counts = np.bincount(indexes - min_index)
+        start = min_index - self.offset
+        self.counts[start:start + len(bucket_counts)] += bucket_counts
+        return self
+
+    def merge(self, other):
+        """Add the counts of another sketch with the same accuracy into this one."""
+        if not math.isclose(other.relative_accuracy, self.relative_accuracy):
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        self.zero_count += other.zero_count
+        if len(other.counts):
+            self._grow(other.offset, other.offset + len(other.counts) - 1)
+            start = other.offset - self.offset
+            self.counts[start:start + len(other.counts)] += other.counts
+        return self
+
+    def quantiles(self, qs):
+        """
+        Estimate quantiles, qs in [0, 1].
+
+        Uses the same rank definition as numpy's default (linear) percentile
+        so results are directly comparable.
+        """
+        qs = np.asarray(qs, dtype=np.float64)
+        total = self.count
+        if total == 0:
+            return np.full(qs.shape, np.nan)
+
+        # Interpolate between neighbouring ranks like numpy.percentile
+        ranks = qs * (total - 1)
+        lower = self._value_at_rank(np.floor(ranks))
+        upper = self._value_at_rank(np.ceil(ranks))
+        return lower + (ranks - np.floor(ranks)) * (upper - lower)
+
+    def _value_at_rank(self, ranks):
+        """Representative value of the buckets holding the given 0-based ranks."""
+        if not len(self.counts):
+            return np.zeros(np.shape(ranks))
+        cumulative = np.cumsum(self.counts) + self.zero_count
+        bucket = np.searchsorted(cumulative, ranks, side='right')
+        bucket = np.minimum(bucket, len(self.counts) - 1)
+        values = 2 * self.gamma ** (bucket + self.offset) / (self.gamma + 1)
+        return np.where(ranks < self.zero_count, 0.0, values)
+
+    def quantile(self, q):
+        return float(self.quantiles([q])[0])
+
+    def to_bytes(self):
+        counts = self.counts
+        # Trim empty buckets at both ends
+        nonzero = np.flatnonzero(counts)
+        offset = self.offset
+        if len(nonzero):
+            counts = counts[nonzero[0]:nonzero[-1] + 1]
+            offset += int(nonzero[0])
+        else:
+            counts = counts[:0]
+
+        width = 2 if not len(counts) or counts.max() <= 0xFFFF else 4
+        dtype = '<u2' if width == 2 else '<u4'
+        header = _HEADER.pack(SKETCH_FORMAT_VERSION, self.relative_accuracy,
+                              self.zero_count, offset, len(counts), width)
+        return header + counts.astype(dtype).tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob):
+        blob = bytes(blob)
+        version, relative_accuracy, zero_count, offset, length, width = _HEADER.unpack_from(blob)
+        if version != SKETCH_FORMAT_VERSION:
+            raise ValueError(f"Unknown sketch format version: {version}")
+        sketch = cls(relative_accuracy)
+        sketch.zero_count = zero_count
+        sketch.offset = offset
+        sketch.counts = np.frombuffer(
+            blob, dtype='<u2' if width == 2 else '<u4', count=length, offset=_HEADER.size
+        ).astype(np.int64)
+        return sketch
+
+    @classmethod
+    def from_values(cls, values, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        return cls(relative_accuracy).add(values)
+
+
+def merge_sketches(sketches, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+    """Merge an iterable of sketches (or serialized sketches) into a new one."""
+    merged = LatencySketch(relative_accuracy)
+    for sketch in sketches:
+        if not isinstance(sketch, LatencySketch):
+            sketch = LatencySketch.from_bytes(getattr(sketch, 'value', sketch))
+        merged.merge(sketch)
+    return merged
@@ -0,0 +1,421 @@
+"""
+Tiered storage for raw PingTest data.
+
+Raw PingTest items are the hot tier: they carry an `expires_at` TTL attribute
+and are kept for HOT_RETENTION_DAYS. Before they expire, every day of data is
+compacted into one rollup item per (source region, destination region, day)
+in the PingTestDaily table. Rollups keep float32 copies of the per-run
+averages packed with shared.result_encoding, so percentiles over rollups
+match the raw data to float32 precision, a mergeable LatencySketch
+(shared.sketch) of the same values, the successful attempt times of the
+day for attempt-level percentiles, and the day's connection counts (runs,
+failed runs, attempts, timeouts, refused). Runs that recorded the kernel
+RTT (see shared.result_encoding) also get their kernel run averages and
+attempt RTTs rolled up.
+
+The current day is rolled up after every round of ping runs with
+complete=False (scheduled_functions compact_today). Those partial rollups
+only feed sketch queries, never the readers below.
+
+Readers ask for a time window and get the per-run averages grouped by
+destination region; full days are served from rollups when they exist and
+the remainder of the window from the raw table. Raw data written as one
+run-level item per probe run (shared.run_records) is read transparently
+when the readers are given the runs table and RUNS_TABLE_ENABLED, so every
+run comes from exactly one table. The readers' `source` picks the connect
+times ("connect") or the kernel RTTs ("kernel").
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from .instrumentation import capacity_kwargs, capture_capacity
+from .result_encoding import (
+    encode_samples, decode_samples, item_samples, concat_samples, run_average, RTT_SAMPLES_ATTRIBUTE
+)
+from . import run_records
+from .run_records import expand_run_item
+
+HOT_RETENTION_DAYS = int(os.environ.get('HOT_RETENTION_DAYS', '35'))
+ROLLUP_TABLE = os.environ.get('ROLLUP_TABLE', 'PingTestDaily')
+TTL_ATTRIBUTE = 'expires_at'
+
+DAY_FORMAT = '%Y-%m-%d'
+# Connection counts kept per pair, see connection_counts()
+CONNECTION_COUNTS = ('runs', 'failed_runs', 'attempts', 'attempts_success', 'timeouts', 'refused')
+# Rollup attribute of the day's attempt times per latency source
+ATTEMPT_SAMPLES_ATTRIBUTES = {'connect': 'attempt_samples', 'kernel': 'attempt_rtt_samples'}
+
+
+def expiry_epoch(now=None, retention_days=None):
+    """Epoch seconds at which a raw item written now should expire."""
+    if retention_days is None:
+        retention_days = HOT_RETENTION_DAYS
+    if now is None:
+        now = datetime.now(timezone.utc)
+    return int((now + timedelta(days=retention_days)).timestamp())
+
+
+def day_bounds(day):
+    """Return the first and last PingTest timestamp strings of a YYYY-MM-DD day."""
+    return f"{day}T00:00:00.000Z", f"{day}T23:59:59.999Z"
+
+
+def full_days(start, end):
+    """List the YYYY-MM-DD days lying entirely within the [start, end] timestamps."""
+    start_dt = datetime.strptime(start[:10], DAY_FORMAT)
+    end_dt = datetime.strptime(end[:10], DAY_FORMAT)
+
+    if start > day_bounds(start[:10])[0]:
+        start_dt += timedelta(days=1)
+    if end < day_bounds(end[:10])[1]:
+        end_dt -= timedelta(days=1)
+
+    days = []
+    while start_dt <= end_dt:
+        days.append(start_dt.strftime(DAY_FORMAT))
+        start_dt += timedelta(days=1)
+    return days
+
+
+def key_between(partition_key, value, sort_key, low, high):
+    """
+    Key condition of a partition key value and a sort key range.
+
+    boto3's condition builders are imported here rather than at module load:
+    ping_from_region only needs expiry_epoch and the constants of this module
+    at cold start.
+    """
+    from boto3.dynamodb.conditions import Key
+    return Key(partition_key).eq(value) & Key(sort_key).between(low, high)
+
+
+def query_all(table, **kwargs):
+    """Run a query and follow LastEvaluatedKey until all items are read."""
+    kwargs.update(capacity_kwargs())
+    response = table.query(**kwargs)
+    capture_capacity(response)
+    items = response.get('Items', [])
+    while 'LastEvaluatedKey' in response:
+        response = table.query(ExclusiveStartKey=response['LastEvaluatedKey'], **kwargs)
+        capture_capacity(response)
+        items.extend(response.get('Items', []))
+    return items
+
+
+def query_raw(table, region_name, start, end, runs_table=None):
+    """
+    Query raw PingTest items for a source region between two timestamps.
+
+    With a runs table and RUNS_TABLE_ENABLED, run-level items (see
+    shared.run_records) are read as well and expanded to the same
+    per-destination items.
+    """
+    items = query_all(
+        table,
+        IndexName='region-timestamp-index',
+        KeyConditionExpression=key_between('region', region_name, 'timestamp', start, end)
+    )
+    if runs_table is not None:
+        items.extend(query_runs(runs_table, region_name, start, end))
+    return items
+
+
+def query_runs(runs_table, region_name, start, end):
+    """
+    Query run-level items of a source region, expanded to per-destination items.
+
+    Without a runs table, unless RUNS_TABLE_ENABLED (with RESULTS_LAYOUT
+    "both" the same runs are read from PingTest), or while it does not exist
+    yet, there are no run-level items.
+    """
+    if runs_table is None or not run_records.RUNS_TABLE_ENABLED:
+        return []
+    try:
+        runs = query_all(
+            runs_table,
+            KeyConditionExpression=key_between('region', region_name, 'timestamp', start, end)
+        )
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') != 'ResourceNotFoundException':
+            raise
+        print(f"Runs table {runs_table.name} not found, reading no run-level items")
+        return []
+    items = []
+    for run in runs:
+        items.extend(expand_run_item(run))
+    return items
+
+
+def query_rollups(rollups_table, region_name, first_day, last_day):
+    """Query daily rollup items for a source region between two days (inclusive)."""
+    return query_all(
+        rollups_table,
+        KeyConditionExpression=key_between('region', region_name, 'day_region_to', f"{first_day}#", f"{last_day}#~")
+    )
+
+
+def connection_counts(items):
+    """
+    Sum the connection counts of raw PingTest items.
+
+    Items written before failures were classified count their failed
+    attempts as neither timeouts nor refused.
+
+    Returns:
+        dict: {count name: int} for every name in CONNECTION_COUNTS
+    """
+    counts = dict.fromkeys(CONNECTION_COUNTS, 0)
+    for item in items:
+        attempts = int(item.get('attempts', 0))
+        counts['runs'] += 1
+        counts['failed_runs'] += 'avg' not in item
+        counts['attempts'] += attempts
+        counts['attempts_success'] += int(item.get('attemptsSuccess', attempts))
+        counts['timeouts'] += int(item.get('failuresTimeout', 0))
+        counts['refused'] += int(item.get('failuresRefused', 0))
+    return counts
+
+
+def build_rollup(region_name, region_to, day, run_avgs, complete=True, attempt_times=None,
+                 counts=None, kernel_avgs=None, kernel_attempt_times=None):
+    """
+    Build a daily rollup item from the per-run averages of one region pair.
+
+    attempt_times, the successful attempt times of the day, are stored packed
+    and counts (see connection_counts) as numbers when given. A day where
+    every run failed has no latency attributes. kernel_avgs and
+    kernel_attempt_times are the same from the kernel RTTs, stored when
+    any run recorded them.
+    """
+    # NumPy is only available where rollups are built, not in the ping functions
+    from .sketch import LatencySketch
+
+    values = [float(v) for v in run_avgs]
+    rollup = {
+        'region': region_name,
+        'regionTo': region_to,
+        'day': day,
+        'day_region_to': f"{day}#{region_to}",
+        'count': len(values),
+        'samples': encode_samples(values),
+        'complete': complete,
+    }
+    if values:
+        rollup.update({
+            'sum': Decimal(str(sum(values))),
+            'min': Decimal(str(min(values))),
+            'max': Decimal(str(max(values))),
+            'avg': Decimal(str(sum(values) / len(values))),
+            'sketch': LatencySketch.from_values(values).to_bytes(),
+        })
+    if attempt_times is not None:
+        rollup['attempt_samples'] = encode_samples(attempt_times)
+    if counts is not None:
+        rollup.update(counts)
+    if kernel_avgs:
+        rollup[RTT_SAMPLES_ATTRIBUTE] = encode_samples(kernel_avgs)
+        rollup[ATTEMPT_SAMPLES_ATTRIBUTES['kernel']] = encode_samples(kernel_attempt_times or [])
+    return rollup
+
+
+def kernel_rollup_values(items):
+    """The kernel run averages and attempt RTTs of raw items, as build_rollup takes them."""
+    averages = [run_average(item, 'kernel') for item in items]
+    return {
+        'kernel_avgs': [avg for avg in averages if avg is not None],
+        'kernel_attempt_times': concat_samples(items, 'kernel').tolist(),
+    }
+
+
+def compact_day(table, rollups_table, region_name, day, complete=True, runs_table=None):
+    """
+    Compact one day of raw data for a source region into rollup items.
+
+    Rollup keys are deterministic, so compacting the same day twice simply
+    overwrites the previous rollups. Pass complete=False for a day that is
+    still receiving data.
+
+    Returns:
+        int: Number of rollup items written
+    """
+    start, end = day_bounds(day)
+    grouped = {}
+    for item in query_raw(table, region_name, start, end, runs_table):
+        grouped.setdefault(item['regionTo'], []).append(item)
+
+    with rollups_table.batch_writer() as batch:
+        for region_to, items in grouped.items():
+            batch.put_item(Item=build_rollup(
+                region_name, region_to, day, [item['avg'] for item in items if 'avg' in item], complete,
+                attempt_times=concat_samples(items).tolist(),
+                counts=connection_counts(items),
+                **kernel_rollup_values(items)
+            ))
+
+    return len(grouped)
+
+
+def read_run_averages(table, rollups_table, region_name, start, end, rollup_before=None,
+                      runs_table=None, source='connect'):
+    """
+    Read the per-run averages of a source region between two timestamps.
+
+    Full days ending before `rollup_before` (default: `end`) are read from
+    the rollup tier where available, the rest of the window from raw items.
+
+    Returns:
+        dict: {region_to: [avg, ...]} with float values
+    """
+    return read_run_samples(table, rollups_table, region_name, start, end, rollup_before,
+                            runs_table, attempts=False, source=source)[0]
+
+
+def read_run_samples(table, rollups_table, region_name, start, end, rollup_before=None,
+                     runs_table=None, attempts=True, source='connect'):
+    """
+    Read the per-run averages, attempt times and connection counts of a source region.
+
+    Like read_run_averages, but with attempts=True also collects every
+    successful attempt into one contiguous array per destination. Rollups
+    compacted before they stored attempts or counts contribute run averages
+    only. With source="kernel" only runs and rollups that recorded kernel
+    RTTs contribute latencies; connection counts cover every run.
+
+    Returns:
+        tuple: ({region_to: [avg, ...]}, {region_to: numpy.ndarray},
+                {region_to: connection counts})
+    """
+    import numpy as np
+
+    if rollup_before is None:
+        rollup_before = end
+
+    candidate_days = [d for d in full_days(start, end) if day_bounds(d)[1] <= rollup_before]
+    regions_to_avg = {}
+    attempt_parts = {}
+    regions_to_counts = {}
+    covered_days = set()
+    attempt_attribute = ATTEMPT_SAMPLES_ATTRIBUTES[source]
+
+    if candidate_days:
+        for item in query_rollups(rollups_table, region_name, candidate_days[0], candidate_days[-1]):
+            if not item.get('complete', True):
+                continue
+            covered_days.add(item['day'])
+            regions_to_avg.setdefault(item['regionTo'], []).extend(item_samples(item, source).tolist())
+            if 'runs' in item:
+                counts = regions_to_counts.setdefault(item['regionTo'], dict.fromkeys(CONNECTION_COUNTS, 0))
+                for name in CONNECTION_COUNTS:
+                    counts[name] += int(item[name])
+            if attempts and attempt_attribute in item:
+                blob = getattr(item[attempt_attribute], 'value', item[attempt_attribute])
+                attempt_parts.setdefault(item['regionTo'], []).append(decode_samples(blob))
+
+    # Query raw data for the gaps between covered days
+    raw_items = {}
+    for raw_start, raw_end in uncovered_ranges(start, end, sorted(covered_days)):
+        for item in query_raw(table, region_name, raw_start, raw_end, runs_table):
+            raw_items.setdefault(item['regionTo'], []).append(item)
+            avg = run_average(item, source)
+            if avg is not None:
+                regions_to_avg.setdefault(item['regionTo'], []).append(avg)
+
+    for region_to, items in raw_items.items():
+        counts = regions_to_counts.setdefault(region_to, dict.fromkeys(CONNECTION_COUNTS, 0))
+        for name, value in connection_counts(items).items():
+            counts[name] += value
+
+    regions_to_attempts = {}
+    if attempts:
+        for region_to, items in raw_items.items():
+            attempt_parts.setdefault(region_to, []).append(concat_samples(items, source))
+        regions_to_attempts = {
+            region_to: np.concatenate(parts) for region_to, parts in attempt_parts.items()
+        }
+
+    return regions_to_avg, regions_to_attempts, regions_to_counts
+
+
+def uncovered_ranges(start, end, covered_days):
+    """Split [start, end] into the timestamp ranges not covered by the sorted days."""
+    ranges = []
+    cursor = start
+    for day in covered_days:
+        if day_bounds(day)[0] > cursor:
+            previous_end = (datetime.strptime(day, DAY_FORMAT) - timedelta(days=1)).strftime(DAY_FORMAT)
+            ranges.append((cursor, day_bounds(previous_end)[1]))
+        next_day = (datetime.strptime(day, DAY_FORMAT) + timedelta(days=1)).strftime(DAY_FORMAT)
+        cursor = day_bounds(next_day)[0]
+    if cursor <= end:
+        ranges.append((cursor, end))
+    return ranges
+
+
+def read_pair_history(table, rollups_table, region_name, region_to, start, end, rollup_before=None,
+                      runs_table=None):
+    """
+    Read the time series of one region pair between two timestamps.
+
+    Days served from the rollup tier yield one daily point at the start of
+    the day; raw days yield one point per probe run.
+
+    Returns:
+        list: [{'timestamp': str, 'value': float, 'resolution': 'run' | 'day'}]
+    """
+    if rollup_before is None:
+        rollup_before = end
+
+    candidate_days = [d for d in full_days(start, end) if day_bounds(d)[1] <= rollup_before]
+    points = []
+    covered_days = set()
+
+    if candidate_days:
+        for item in query_rollups(rollups_table, region_name, candidate_days[0], candidate_days[-1]):
+            if item['regionTo'] != region_to or not item.get('complete', True):
+                continue
+            covered_days.add(item['day'])
+            if 'avg' not in item:
+                continue
+            points.append({
+                'timestamp': day_bounds(item['day'])[0],
+                'value': float(item['avg']),
+                'resolution': 'day'
+            })
+
+    for raw_start, raw_end in uncovered_ranges(start, end, sorted(covered_days)):
+        for item in query_raw(table, region_name, raw_start, raw_end, runs_table):
+            if item['regionTo'] != region_to or 'avg' not in item:
+                continue
+            points.append({
+                'timestamp': item['timestamp'],
+                'value': float(item['avg']),
+                'resolution': 'run'
+            })
+
+    return sorted(points, key=lambda p: p['timestamp'])
+
+
+def query_sketches(rollups_table, region_name, first_day, last_day, regions_to=None):
+    """
+    Get the daily sketches of a source region between two days (inclusive).
+
+    Partial rollups of the current day are included.
+
+    Returns:
+        dict: {region_to: [serialized sketch, ...]}
+    """
+    sketches = {}
+    for item in query_all(
+        rollups_table,
+        KeyConditionExpression=key_between('region', region_name, 'day_region_to', f"{first_day}#", f"{last_day}#~"),
+        ProjectionExpression='#to, #sketch',
+        ExpressionAttributeNames={'#to': 'regionTo', '#sketch': 'sketch'}
+    ):
+        if 'sketch' not in item:
+            continue
+        if regions_to is not None and item['regionTo'] not in regions_to:
+            continue
+        sketches.setdefault(item['regionTo'], []).append(item['sketch'])
+    return sketches
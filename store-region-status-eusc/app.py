@@ -12,6 +12,10 @@ hardcoded in the EUSC_REGIONS list. Update this list as new regions become avail
 """
 
 from chalice import Chalice, Cron
+from chalicelib.shared.instrumentation import instrumented, span, count, capture_capacity, capacity_kwargs
+from chalicelib.shared.region_registry import bump_registry_version, get_region_registry
+from chalicelib.shared.run_records import RUNS_TABLE, RUNS_TABLE_ENABLED
+from chalicelib.shared.tiered_storage import ROLLUP_TABLE, day_bounds
 import boto3
 import json
 import time
@@ -66,36 +70,69 @@ def check_function_exists(region_name):
         return False
 
 
-def get_earliest_timestamp(dynamodb_client, region_name):
-    """Get the earliest ping data timestamp for a region from PingTest table."""
+def query_edge_timestamps(dynamodb_client, region_name, ascending):
+    """
+    Get the first (ascending) or last timestamp a region wrote, both to the
+    PingTest table and, with a run-level results layout, to the PingTestRuns
+    table.
+    """
+    tables = [('PingTest', {'IndexName': 'region-timestamp-index'})]
+    if RUNS_TABLE_ENABLED:
+        tables.append((RUNS_TABLE, {}))
+    timestamps = []
+    for table_name, kwargs in tables:
+        response = dynamodb_client.query(
+            TableName=table_name,
+            KeyConditionExpression='#r = :region',
+            ExpressionAttributeNames={'#r': 'region'},
+            ExpressionAttributeValues={':region': {'S': region_name}},
+            Limit=1,
+            ScanIndexForward=ascending,
+            **kwargs,
+            **capacity_kwargs()
+        )
+        capture_capacity(response)
+        timestamps.extend(item['timestamp']['S'] for item in response.get('Items', []))
+    return timestamps
+
+
+def get_first_rollup_timestamp(dynamodb_client, region_name):
+    """Start of the first day of a region rolled up into PingTestDaily."""
     response = dynamodb_client.query(
-        TableName='PingTest',
-        IndexName='region-timestamp-index',
+        TableName=ROLLUP_TABLE,
         KeyConditionExpression='#r = :region',
         ExpressionAttributeNames={'#r': 'region'},
         ExpressionAttributeValues={':region': {'S': region_name}},
         Limit=1,
-        ScanIndexForward=True  # Ascending order (earliest first)
+        ScanIndexForward=True,
+        **capacity_kwargs()
     )
+    capture_capacity(response)
     if response.get('Items'):
-        return response['Items'][0]['timestamp']['S']
+        return day_bounds(response['Items'][0]['day']['S'])[0]
     return None
 
 
+def get_earliest_timestamp(dynamodb_client, region_name):
+    """
+    Get the earliest ping data timestamp for a region.
+
+    Raw items expire after HOT_RETENTION_DAYS, so the first rolled up day and
+    the stored value keep it from moving forward with the TTL.
+    """
+    timestamps = query_edge_timestamps(dynamodb_client, region_name, ascending=True)
+    timestamps.append(get_first_rollup_timestamp(dynamodb_client, region_name))
+    record = get_region_registry(lambda: dynamodb_client).get(region_name)
+    if record is not None:
+        timestamps.append(record.earliest_data_timestamp)
+    timestamps = [t for t in timestamps if t is not None]
+    return min(timestamps) if timestamps else None
+
+
 def get_latest_timestamp(dynamodb_client, region_name):
-    """Get the most recent ping data timestamp for a region from PingTest table."""
-    response = dynamodb_client.query(
-        TableName='PingTest',
-        IndexName='region-timestamp-index',
-        KeyConditionExpression='#r = :region',
-        ExpressionAttributeNames={'#r': 'region'},
-        ExpressionAttributeValues={':region': {'S': region_name}},
-        Limit=1,
-        ScanIndexForward=False  # Descending order (latest first)
-    )
-    if response.get('Items'):
-        return response['Items'][0]['timestamp']['S']
-    return None
+    """Get the most recent ping data timestamp for a region."""
+    timestamps = query_edge_timestamps(dynamodb_client, region_name, ascending=False)
+    return max(timestamps) if timestamps else None
 
 
 def chunk_list(lst, chunk_size):
@@ -114,7 +151,8 @@ def handle_unprocessed_items(client, unprocessed_items, max_retries=3):
         time.sleep(delay)
 
         try:
-            response = client.batch_write_item(RequestItems=items)
+            response = client.batch_write_item(RequestItems=items, **capacity_kwargs())
+            capture_capacity(response)
             items = response.get('UnprocessedItems', {})
             retries += 1
 
@@ -145,8 +183,10 @@ def write_results(client, results):
             response = client.batch_write_item(
                 RequestItems={
                     'cloudping_regions_enhanced': chunk
-                }
+                },
+                **capacity_kwargs()
             )
+            capture_capacity(response)
 
             # Handle any unprocessed items
             if response.get('UnprocessedItems'):
@@ -162,8 +202,12 @@ def write_results(client, results):
             print(f"Error processing chunk {i}: {str(e)}")
             raise
 
+    # Let cached region registries know the table changed
+    bump_registry_version(client)
+
 
 @app.schedule(Cron("30", "0,6,12,18", "*", "*", "?", "*"))
+@instrumented('store_eusc')
 def store(event):
     """
     Store EUSC region status to main AWS DynamoDB.
@@ -183,12 +227,16 @@ def store(event):
         current_time = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + "Z"
 
         for region_name in EUSC_REGIONS:
+            count('regions')
+
             # Check if ping function exists in this region
-            function_exists = check_function_exists(region_name)
+            with span('check_function'):
+                function_exists = check_function_exists(region_name)
 
-            # Get timestamp data from PingTest table
-            earliest_timestamp = get_earliest_timestamp(dynamodb, region_name)
-            most_recent_timestamp = get_latest_timestamp(dynamodb, region_name)
+            # Get timestamp data from PingTest (and PingTestRuns)
+            with span('query_timestamps'):
+                earliest_timestamp = get_earliest_timestamp(dynamodb, region_name)
+                most_recent_timestamp = get_latest_timestamp(dynamodb, region_name)
 
             # EUSC regions are opt-in by default
             region_info = {
@@ -209,7 +257,8 @@ def store(event):
             })
 
         if enabled_regions:
-            write_results(dynamodb, enabled_regions)
+            with span('write'):
+                write_results(dynamodb, enabled_regions)
             print(f"Successfully stored {len(enabled_regions)} EUSC regions to main AWS DynamoDB")
 
         return {
@@ -0,0 +1,21 @@
+"""
+Import paths of the tests.
+
+The Lambda apps are not installable packages: shared/ is imported from the
+repository root, the way tools/ does, and ping_from_region's modules as
+chalicelib.*, with shared/ synced into it as for a deployment. Only one
+app's chalicelib can be imported per test session.
+"""
+
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+sys.path.insert(0, os.path.join(ROOT, 'tools'))
+sys.path.insert(0, os.path.join(ROOT, 'ping_from_region'))
+sys.path.insert(0, ROOT)
+
+from sync_shared import sync  # noqa: E402
+
+sync(['ping_from_region'])
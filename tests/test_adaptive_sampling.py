@@ -0,0 +1,62 @@
+import math
+
+import pytest
+
+from chalicelib import probe
+from chalicelib.probe import median_ci_half_width, should_continue_sampling
+
+STABLE = [20.0, 20.1, 19.9]
+NOISY = [20.0, 40.0, 10.0]
+
+
+@pytest.fixture(autouse=True)
+def policy(monkeypatch):
+    """The default adaptive policy, whatever the environment sets."""
+    monkeypatch.setattr(probe, 'SAMPLING_MIN_ATTEMPTS', 3)
+    monkeypatch.setattr(probe, 'SAMPLING_MAX_ATTEMPTS', 10)
+    monkeypatch.setattr(probe, 'SAMPLING_CI_TOLERANCE', 0.05)
+
+
+def test_median_ci_half_width():
+    assert median_ci_half_width([]) == math.inf
+    assert median_ci_half_width([20.0]) == math.inf
+    assert median_ci_half_width([20.0] * 4) == 0.0
+    # One slow connection does not widen the interval
+    assert median_ci_half_width([20.0, 20.0, 20.0, 20.0, 500.0]) == 0.0
+    # 1.96 * 1.2533 * 1.4826 * MAD / sqrt(n)
+    assert median_ci_half_width(NOISY) == pytest.approx(1.96 * 1.2533 * 1.4826 * 10.0 / math.sqrt(3))
+    assert median_ci_half_width(NOISY * 4) < median_ci_half_width(NOISY)
+
+
+def test_minimum_attempts_are_always_made():
+    assert should_continue_sampling(0, [], mode='adaptive')
+    assert should_continue_sampling(2, [20.0, 20.0], mode='adaptive')
+
+
+def test_tight_interval_stops_early():
+    assert median_ci_half_width(STABLE) < probe.SAMPLING_CI_FLOOR_MS
+    assert not should_continue_sampling(3, STABLE, mode='adaptive')
+
+
+def test_high_variance_extends_sampling():
+    assert should_continue_sampling(3, NOISY, mode='adaptive')
+    assert should_continue_sampling(9, NOISY * 3, mode='adaptive')
+
+
+def test_failures_do_not_count_towards_the_minimum():
+    # Five attempts, three of them failed
+    assert should_continue_sampling(5, STABLE[:2], mode='adaptive')
+    assert not should_continue_sampling(6, STABLE, mode='adaptive')
+
+
+@pytest.mark.parametrize('times_list', [NOISY * 4, [20.0]])
+def test_attempt_cap(times_list):
+    assert not should_continue_sampling(10, times_list, mode='adaptive')
+    assert should_continue_sampling(5, times_list, mode='adaptive')
+    assert not should_continue_sampling(5, times_list, mode='adaptive', attempt_limit=5)
+
+
+def test_fixed_mode_makes_the_fixed_attempts():
+    assert [should_continue_sampling(count, STABLE, mode='fixed') for count in range(probe.FIXED_ATTEMPTS + 1)] == \
+        [True] * probe.FIXED_ATTEMPTS + [False]
+    assert not should_continue_sampling(2, NOISY, mode='fixed', attempt_limit=2)
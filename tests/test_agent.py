@@ -0,0 +1,164 @@
+import io
+import threading
+import time
+
+import pytest
+
+from chalicelib import agent
+from chalicelib.agent import ProbeAgent, ResultBuffer
+from chalicelib.shared.instrumentation import invocation
+
+TARGETS = [{'RegionName': f'region-{i}', 'partition': 'aws'} for i in range(8)]
+
+
+class FakeClock:
+    """Monotonic clock advancing a fixed step per reading."""
+
+    def __init__(self, step=1.0):
+        self.now = 0.0
+        self.step = step
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.now += self.step
+            return self.now
+
+
+class FakeSink:
+    """Sink recording the batches it was given, raising on the batches listed in fail_on."""
+
+    def __init__(self, fail_on=()):
+        self.batches = []
+        self.fail_on = set(fail_on)
+        self.closed = False
+
+    def write(self, items):
+        if len(self.batches) in self.fail_on:
+            self.fail_on.discard(len(self.batches))
+            raise ConnectionError('sink unavailable')
+        self.batches.append(items)
+        return {'written': len(items), 'failed': 0, 'unwritten': 0, 'retries': 0}
+
+    def close(self):
+        self.closed = True
+
+    @property
+    def items(self):
+        return [item for batch in self.batches for item in batch]
+
+
+class FakeProbe:
+    """probe_target stand-in tracking the runs in flight, held at the gate until it opens."""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.in_flight = 0
+        self.most_in_flight = 0
+        self.runs = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, target, port, site, partition, planner, plan, log=None, sleep=None):
+        with self._lock:
+            self.in_flight += 1
+            self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        self.gate.wait(5)
+        with self._lock:
+            self.in_flight -= 1
+            self.runs += 1
+            run = self.runs
+        return {'region': {'S': site}, 'regionTo': {'S': target['RegionName']}, 'run': {'N': str(run)}}, [], []
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def make_agent(sink, **kwargs):
+    # Clock steps longer than the interval: the scheduler never waits for a run to come due
+    return ProbeAgent(lambda: TARGETS, 'onprem-test', sink, interval=0.5, clock=FakeClock(step=1.0), **kwargs)
+
+
+def start(probe_agent):
+    thread = threading.Thread(target=probe_agent.run, daemon=True)
+    thread.start()
+    return thread
+
+
+@pytest.fixture
+def fake_probe(monkeypatch):
+    fake = FakeProbe()
+    monkeypatch.setattr(agent, 'probe_target', fake)
+    yield fake
+    fake.gate.set()
+
+
+def test_full_buffer_drops_and_counts_the_oldest_items():
+    stream = io.StringIO()
+    buffer = ResultBuffer(3)
+    with invocation('test', stream=stream) as metrics:
+        for i in range(5):
+            buffer.put(i)
+    assert buffer.dropped == 2
+    assert metrics.counters['items_dropped'] == 2
+    assert len(buffer) == 3
+    assert buffer.drain(10) == [2, 3, 4]
+    assert buffer.drain(10) == []
+
+
+def test_at_most_concurrency_runs_in_flight(fake_probe):
+    sink = FakeSink()
+    probe_agent = make_agent(sink, concurrency=3, flush_interval=3600.0, metrics_interval=3600.0)
+    thread = start(probe_agent)
+
+    wait_for(lambda: fake_probe.in_flight == 3)
+    # Every target is due, the scheduler still waits for a free slot
+    time.sleep(0.2)
+    assert fake_probe.in_flight == 3
+
+    fake_probe.gate.set()
+    wait_for(lambda: fake_probe.runs >= 2 * len(TARGETS))
+    probe_agent.stop()
+    thread.join(10)
+    assert not thread.is_alive()
+    assert fake_probe.most_in_flight == 3
+
+
+def test_sink_error_keeps_the_remaining_buffer():
+    sink = FakeSink(fail_on=[1])
+    probe_agent = make_agent(sink, flush_batch=2)
+    for i in range(5):
+        probe_agent.buffer.put(i)
+
+    with invocation('test', stream=io.StringIO()) as metrics:
+        probe_agent._flush()
+    # The failed batch is lost and counted, the batch after it waits for the next flush
+    assert sink.items == [0, 1]
+    assert metrics.counters['items_unwritten'] == 2
+    assert len(probe_agent.buffer) == 1
+
+    probe_agent._flush()
+    assert sink.items == [0, 1, 4]
+    assert len(probe_agent.buffer) == 0
+
+
+def test_stop_flushes_what_is_buffered(fake_probe):
+    sink = FakeSink()
+    probe_agent = make_agent(sink, flush_interval=3600.0, flush_batch=1000, metrics_interval=3600.0)
+    thread = start(probe_agent)
+
+    fake_probe.gate.set()
+    wait_for(lambda: len(probe_agent.buffer) >= len(TARGETS))
+    assert sink.batches == []
+    probe_agent.stop()
+    thread.join(10)
+
+    assert not thread.is_alive()
+    assert sink.closed
+    assert len(probe_agent.buffer) == 0
+    # Runs still in progress at stop() are written too
+    assert len(sink.items) == fake_probe.runs
+    assert sorted(int(item['run']['N']) for item in sink.items) == list(range(1, fake_probe.runs + 1))
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from shared.anomaly import PairBaselines, observation_rows
+
+RUNS_PER_DAY = 4
+REGIONS = 35
+DAYS = 30
+
+
+def simulate(rng, pairs, runs, changes, spikes):
+    """Lognormal noise around per-pair levels, with injected steps and spikes."""
+    levels = rng.uniform(1, 300, pairs)
+    series = levels * rng.lognormal(0, 0.01, (runs, pairs))
+
+    step_pairs = rng.choice(pairs, changes, replace=False)
+    step_runs = rng.integers(runs // 3, runs - 8, changes)
+    step_sizes = rng.choice([-1, 1], changes) * rng.uniform(0.15, 0.5, changes)
+    for pair, run, size in zip(step_pairs, step_runs, step_sizes):
+        series[run:, pair] *= 1 + size
+
+    clean = np.setdiff1d(np.arange(pairs), step_pairs)
+    spike_pairs = rng.choice(clean, spikes, replace=False)
+    spike_runs = rng.integers(runs // 3, runs, spikes)
+    series[spike_runs, spike_pairs] *= rng.uniform(2, 5, spikes)
+
+    # Some runs fail to report a value
+    series[rng.random(series.shape) < 0.02] = np.nan
+    return series, dict(zip(step_pairs.tolist(), step_runs.tolist())), dict(zip(spike_pairs.tolist(), spike_runs.tolist()))
+
+
+def score(detections, steps, spikes):
+    """Detected steps with their delay in runs, detected spikes and false positives."""
+    found_steps = {}
+    found_spikes = set()
+    false_positives = 0
+    for row, detection in detections:
+        pair = detection.pair_index
+        if detection.kind.startswith('step') and pair in steps and row >= steps[pair]:
+            found_steps.setdefault(pair, row - steps[pair])
+        elif detection.kind == 'spike' and spikes.get(pair) == row:
+            found_spikes.add(pair)
+        elif pair in steps and row >= steps[pair]:
+            continue  # Spikes flagged on the first runs after a step
+        else:
+            false_positives += 1
+    return found_steps, found_spikes, false_positives
+
+
+@pytest.mark.parametrize('seed', [7, 11, 23])
+def test_injected_shifts_are_detected_without_false_positives(seed):
+    rng = np.random.default_rng(seed)
+    pairs = REGIONS * REGIONS
+    series, steps, spikes = simulate(rng, pairs, DAYS * RUNS_PER_DAY, changes=50, spikes=50)
+
+    baselines = PairBaselines(pairs)
+    detections = baselines.update_rows(series)
+    found_steps, found_spikes, false_positives = score(detections, steps, spikes)
+
+    assert len(found_steps) / len(steps) >= 0.9
+    assert np.median(list(found_steps.values())) <= 4
+    assert len(found_spikes) / len(spikes) >= 0.9
+    assert false_positives <= 0.001 * int((~np.isnan(series)).sum())
+
+
+def test_clean_series_is_not_flagged():
+    rng = np.random.default_rng(5)
+    pairs = 100
+    series = rng.uniform(1, 300, pairs) * rng.lognormal(0, 0.01, (DAYS * RUNS_PER_DAY, pairs))
+    assert PairBaselines(pairs).update_rows(series) == []
+
+
+def test_observation_rows_keep_every_pair_in_order():
+    rng = np.random.default_rng(3)
+    pairs = 50
+    series = rng.uniform(1, 300, (20, pairs))
+    series[rng.random(series.shape) < 0.2] = np.nan
+
+    run_index, pair_index = np.nonzero(~np.isnan(series))
+    rows, positions = observation_rows(pair_index, series[run_index, pair_index], pairs, order=run_index)
+    for pair in range(pairs):
+        column = series[:, pair]
+        assert np.array_equal(rows[:, pair][positions[:, pair] >= 0], column[~np.isnan(column)])
+
+
+def test_state_survives_serialization_and_remapping():
+    rng = np.random.default_rng(9)
+    names = ['us-east-1', 'eu-west-1', 'ap-south-1']
+    baselines = PairBaselines(len(names) ** 2)
+    baselines.update_rows(rng.uniform(10, 20, (12, len(names) ** 2)))
+
+    restored = PairBaselines.from_bytes(baselines.to_bytes())
+    assert np.array_equal(restored.mean, baselines.mean)
+    assert np.array_equal(restored.observations, baselines.observations)
+
+    extended = restored.remapped(names, names + ['il-central-1'])
+    assert extended.size == 16
+    assert extended.mean[0 * 4 + 1] == baselines.mean[0 * 3 + 1]
+    assert extended.observations[3 * 4 + 3] == 0
@@ -0,0 +1,33 @@
+import numpy as np
+
+from backfill_packed_samples import packed_item
+from shared.result_encoding import (
+    SAMPLES_FORMAT_UINT16_TENTH_MS, RTT_SAMPLES_ATTRIBUTE, RTTVAR_SAMPLES_ATTRIBUTE, attempt_values, decode_samples
+)
+
+
+def legacy_item(results):
+    return {
+        'region': {'S': 'us-east-1'},
+        'attempts': {'N': '3'},
+        'results': {'L': [{'M': {name: {'N': str(value)} for name, value in result.items()}} for result in results]},
+    }
+
+
+def test_kernel_rtts_are_packed_with_the_samples():
+    item = legacy_item([
+        {'seq': 0, 'time': 10.5, 'rtt_us': 10000, 'rttvar_us': 500},
+        {'seq': 2, 'time': 11.5, 'rtt_us': 11000, 'rttvar_us': 400},
+    ])
+    packed = packed_item(item, SAMPLES_FORMAT_UINT16_TENTH_MS)
+
+    assert 'results' not in packed
+    assert np.allclose(attempt_values(packed), [10.5, np.nan, 11.5], equal_nan=True)
+    assert np.allclose(attempt_values(packed, 'kernel'), attempt_values(item, 'kernel'), equal_nan=True)
+    assert np.allclose(decode_samples(packed[RTTVAR_SAMPLES_ATTRIBUTE]['B']), [0.5, np.nan, 0.4], equal_nan=True)
+
+
+def test_items_without_kernel_rtts_get_no_rtt_columns():
+    packed = packed_item(legacy_item([{'seq': 0, 'time': 10.5}, {'seq': 1, 'time': 12.0}]), 1)
+    assert RTT_SAMPLES_ATTRIBUTE not in packed and RTTVAR_SAMPLES_ATTRIBUTE not in packed
+    assert np.allclose(attempt_values(packed), [10.5, 12.0, np.nan], equal_nan=True)
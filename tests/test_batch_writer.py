@@ -0,0 +1,128 @@
+import random
+import threading
+import time
+
+import pytest
+
+from shared.batch_writer import PipelinedBatchWriter
+
+
+class ClientError(Exception):
+    """Stand-in for botocore's ClientError, with the same `response` shape."""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class StubClient:
+    """Thread safe fake of batch_write_item with injected throttling and unprocessed items."""
+
+    def __init__(self, latency=0.005, throttle=0.0, unprocessed=0.0, error=None, seed=7):
+        self.latency = latency
+        self.throttle = throttle
+        self.unprocessed = unprocessed
+        self.error = error
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stored = {}
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            throttled = self.rng.random() < self.throttle
+            draws = [self.rng.random() for _ in range(sum(len(r) for r in RequestItems.values()))]
+        try:
+            time.sleep(self.latency)
+            if self.error:
+                raise ClientError(self.error)
+            if throttled:
+                raise ClientError('ProvisionedThroughputExceededException')
+            unprocessed = {}
+            draws = iter(draws)
+            for table, requests in RequestItems.items():
+                for request in requests:
+                    if next(draws) < self.unprocessed:
+                        unprocessed.setdefault(table, []).append(request)
+                        continue
+                    with self.lock:
+                        key = request['PutRequest']['Item']['id']['S']
+                        self.stored[key] = self.stored.get(key, 0) + 1
+            return {'UnprocessedItems': unprocessed}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def put_items(writer, count):
+    for i in range(count):
+        writer.put({'id': {'S': str(i)}})
+
+
+def test_every_item_written_once_despite_throttling():
+    client = StubClient(throttle=0.3, unprocessed=0.2)
+    writer = PipelinedBatchWriter(client, 'PingTest', max_in_flight=4, max_retries=20, base_delay=0.001)
+    put_items(writer, 500)
+    summary = writer.close(timeout=60)
+
+    assert summary['written'] == 500
+    assert summary['failed'] == summary['unwritten'] == 0
+    assert summary['retries'] > 0
+    assert len(client.stored) == 500
+    assert set(client.stored.values()) == {1}
+    assert client.max_in_flight <= 4
+
+
+def test_close_returns_at_the_deadline_and_accounts_for_every_item():
+    client = StubClient(throttle=1.0)
+    writer = PipelinedBatchWriter(client, 'PingTest', max_in_flight=4, max_retries=1000)
+    put_items(writer, 500)
+
+    started = time.perf_counter()
+    summary = writer.close(timeout=0.5)
+    assert time.perf_counter() - started < 1.0
+    assert summary['written'] == 0
+    assert summary['failed'] + summary['unwritten'] == 500
+    # Writes in flight at the deadline were joined, not left running
+    assert client.in_flight == 0
+
+
+def test_non_retryable_error_is_raised_from_close():
+    client = StubClient(error='AccessDeniedException')
+    writer = PipelinedBatchWriter(client, 'PingTest')
+    put_items(writer, 30)
+
+    with pytest.raises(ClientError, match='AccessDeniedException'):
+        writer.close(timeout=5)
+    assert writer.failed == 30
+    # Not retried
+    assert client.calls == 2
+
+
+def test_partial_batch_is_sent_without_another_put():
+    client = StubClient()
+    writer = PipelinedBatchWriter(client, 'PingTest', max_batch_age=0.05)
+    put_items(writer, 3)
+
+    deadline = time.monotonic() + 2
+    while len(client.stored) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(client.stored) == 3
+    assert writer.close(timeout=5)['written'] == 3
+
+
+def test_full_batches_are_sent_while_putting():
+    client = StubClient()
+    writer = PipelinedBatchWriter(client, 'PingTest', max_batch_age=60)
+    put_items(writer, 50)
+
+    deadline = time.monotonic() + 2
+    while len(client.stored) < 50 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert client.calls == 2
+    assert writer.close(timeout=5)['written'] == 50
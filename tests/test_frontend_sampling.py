@@ -0,0 +1,139 @@
+import socket
+import threading
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from chalicelib import probe
+from chalicelib.probe_budget import ProbePlan
+from chalicelib.shared.result_encoding import frontend_samples
+from chalicelib.shared.run_records import build_run_item, expand_run_item
+
+GOOD_ADDRESSES = ['127.0.0.2', '127.0.0.3', '127.0.0.4']
+# Nothing listens here, so every attempt on this front end is refused
+BAD_ADDRESS = '127.0.0.5'
+
+
+def listen(family, address, port):
+    """Accept and close connections on address:port; returns (server, port)."""
+    server = socket.socket(family, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((address, port))
+    server.listen(socket.SOMAXCONN)
+
+    def accept():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            conn.close()
+
+    threading.Thread(target=accept, daemon=True).start()
+    return server, server.getsockname()[1]
+
+
+@pytest.fixture(scope='module')
+def frontends():
+    """Listeners on every good address, on one shared port; returns (port, addresses)."""
+    server, port = listen(socket.AF_INET, GOOD_ADDRESSES[0], 0)
+    servers = [server]
+    addresses = [(socket.AF_INET, GOOD_ADDRESSES[0])]
+    for address in GOOD_ADDRESSES[1:]:
+        servers.append(listen(socket.AF_INET, address, port)[0])
+        addresses.append((socket.AF_INET, address))
+    if socket.has_ipv6:
+        try:
+            servers.append(listen(socket.AF_INET6, '::1', port)[0])
+            addresses.append((socket.AF_INET6, '::1'))
+        except OSError:
+            pass  # No IPv6 loopback here
+    yield port, addresses + [(socket.AF_INET, BAD_ADDRESS)]
+    for server in servers:
+        server.close()
+
+
+class StubResolver:
+    """getaddrinfo stand-in answering with fixed addresses, counting its calls."""
+
+    def __init__(self, addresses):
+        self.addresses = addresses
+        self.calls = 0
+
+    def __call__(self, host, port, family=0, type=0):
+        self.calls += 1
+        infos = []
+        for address_family, address in self.addresses:
+            sockaddr = (address, port) if address_family == socket.AF_INET else (address, port, 0, 0)
+            infos.append((address_family, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', sockaddr))
+        return infos + infos[:1]  # Resolvers repeat addresses, e.g. per protocol
+
+
+class FixedPlanner:
+    def expired(self, plan):
+        return False
+
+
+def deserialize(item):
+    """Low-level item -> resource style values, enough for the readers."""
+    values = {}
+    for name, value in item.items():
+        (kind, raw), = value.items()
+        if kind == 'L':
+            values[name] = [entry['S'] for entry in raw]
+        else:
+            values[name] = {'N': lambda v: Decimal(v), 'B': bytes}.get(kind, lambda v: v)(raw)
+    return values
+
+
+def run_probe(monkeypatch, port, resolver, sample_size, mode):
+    monkeypatch.setattr(probe, 'ADDRESS_SAMPLE_SIZE', sample_size)
+    monkeypatch.setattr(probe, 'SAMPLING_MODE', mode)
+    monkeypatch.setattr(probe, 'RESULTS_ENCODING', 'packed')
+    return probe.probe_target({'RegionName': 'loopback-1'}, port, 'loopback-0', 'aws', FixedPlanner(),
+                              ProbePlan(probe.max_attempts(mode), 1, None, False),
+                              log=lambda *args: None, sleep=lambda seconds: None, resolver=resolver)
+
+
+def failed(samples):
+    return {address: int(np.isnan(values).sum()) for address, values in samples.items()}
+
+
+@pytest.mark.parametrize('mode, sample_size', [('fixed', None), ('adaptive', None), ('adaptive', 2)])
+def test_attempts_rotate_over_the_sampled_frontends(monkeypatch, frontends, mode, sample_size):
+    port, addresses = frontends
+    sample_size = sample_size or len(addresses)
+    resolver = StubResolver(addresses)
+    item, attempt_times, kernel_rtts = run_probe(monkeypatch, port, resolver, sample_size, mode)
+    stored = deserialize(item)
+    sampled = stored['frontends']
+    index = list(stored['frontend_index'])
+
+    # Resolved once per run, without the repeated address
+    assert resolver.calls == 1
+    assert len(sampled) == len(set(sampled)) == min(sample_size, len(addresses))
+    assert len(index) == len(attempt_times)
+    attempts = [index.count(i) for i in range(len(sampled))]
+    assert max(attempts) - min(attempts) <= 1
+
+    # Refused attempts stay attributed to the refusing front end
+    per_frontend = frontend_samples([stored])
+    for address, values in per_frontend.items():
+        assert failed(per_frontend)[address] == (len(values) if address == BAD_ADDRESS else 0)
+    assert sum(len(values) for values in per_frontend.values()) == len(attempt_times)
+
+    # Run-level layout, between two destinations without front ends
+    plain = {**probe.run_destination(item, attempt_times, kernel_rtts), 'frontends': [], 'frontend_index': None}
+    run = build_run_item('loopback-0', 'aws', item['timestamp']['S'], port, 'fixed',
+                         [plain, probe.run_destination(item, attempt_times, kernel_rtts), plain])
+    expanded = expand_run_item(deserialize(run))
+    assert 'frontends' not in expanded[0] and 'frontends' not in expanded[2]
+    assert failed(frontend_samples([expanded[1]])) == failed(per_frontend)
+
+
+def test_resolver_failure_falls_back_to_no_addresses():
+    def failing_resolver(*args):
+        raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+
+    assert probe.resolve_addresses('dynamodb.loopback-1.amazonaws.com', 443, failing_resolver) == []
@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from shared.instrumentation import invocation, instrumented, span, count, set_property, capture_capacity
+
+
+class FakeClock:
+    """perf_counter stand-in returning the readings it is given, in order."""
+
+    def __init__(self, *readings):
+        self.readings = list(readings)
+
+    def __call__(self):
+        return self.readings.pop(0)
+
+
+def emitted(capsys):
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 1
+    return json.loads(lines[0])
+
+
+def test_invocation_emits_one_emf_line(capsys):
+    @instrumented('ping')
+    def handler(event):
+        set_property('region', 'us-east-1')
+        with span('get_regions'):
+            pass
+        with span('get_regions'):
+            pass
+        count('targets', 3)
+        count('targets')
+        capture_capacity({'ConsumedCapacity': [{'TableName': 'PingTest', 'CapacityUnits': 2.5},
+                                               {'TableName': 'PingTestRuns', 'CapacityUnits': 1.0}]})
+        capture_capacity({'ConsumedCapacity': {'TableName': 'PingTest', 'CapacityUnits': 0.5}})
+        return 'done'
+
+    assert handler({}) == 'done'
+    record = emitted(capsys)
+
+    assert record['function'] == 'ping'
+    assert record['status'] == 'ok'
+    assert record['region'] == 'us-east-1'
+    assert record['targets'] == 4
+    assert record['PingTest_capacity_units'] == 3.0
+    assert record['PingTestRuns_capacity_units'] == 1.0
+    assert record['get_regions_ms'] >= 0
+    assert record['duration_ms'] >= record['get_regions_ms']
+
+    metrics, = record['_aws']['CloudWatchMetrics']
+    assert metrics['Dimensions'] == [['function']]
+    units = {metric['Name']: metric['Unit'] for metric in metrics['Metrics']}
+    assert units == {
+        'duration_ms': 'Milliseconds',
+        'get_regions_ms': 'Milliseconds',
+        'targets': 'Count',
+        'PingTest_capacity_units': 'Count',
+        'PingTestRuns_capacity_units': 'Count',
+    }
+    # Properties are not metrics
+    assert 'region' not in units
+
+
+def test_spans_are_timed_with_the_clock(capsys):
+    # started, span start, span end, record
+    with invocation('ping', clock=FakeClock(10.0, 10.5, 10.75, 11.0)):
+        with span('write'):
+            pass
+    record = emitted(capsys)
+    assert record['write_ms'] == 250.0
+    assert record['duration_ms'] == 1000.0
+
+
+def test_failed_handler_emits_an_error_record(capsys):
+    @instrumented('ping')
+    def handler(event):
+        count('targets', 2)
+        raise RuntimeError('no regions')
+
+    with pytest.raises(RuntimeError):
+        handler({})
+    record = emitted(capsys)
+    assert record['status'] == 'error'
+    assert record['targets'] == 2
+
+
+def test_helpers_are_no_ops_outside_an_invocation(capsys):
+    with span('get_regions'):
+        count('targets')
+        set_property('region', 'us-east-1')
+        capture_capacity({'ConsumedCapacity': {'TableName': 'PingTest', 'CapacityUnits': 1.0}})
+    assert capsys.readouterr().out == ''
@@ -0,0 +1,110 @@
+import socket
+import threading
+from decimal import Decimal
+
+import pytest
+
+from chalicelib import probe
+from chalicelib.probe_budget import ProbePlan
+from chalicelib.shared.result_encoding import item_samples, run_average, concat_samples
+from chalicelib.shared.run_records import build_run_item, expand_run_item
+from chalicelib.shared.tiered_storage import build_rollup, kernel_rollup_values
+
+CONNECTIONS = 200
+
+supported = pytest.mark.skipif(not hasattr(socket, 'TCP_INFO'), reason='no TCP_INFO on this platform')
+
+
+@pytest.fixture(scope='module')
+def port():
+    """Port of a loopback listener that accepts and closes connections."""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(socket.SOMAXCONN)
+
+    def accept():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            conn.close()
+
+    threading.Thread(target=accept, daemon=True).start()
+    yield server.getsockname()[1]
+    server.close()
+
+
+@pytest.fixture
+def closed_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+class FixedPlanner:
+    def expired(self, plan):
+        return False
+
+
+def deserialize(item):
+    """Low-level item -> resource style values, enough for the readers."""
+    values = {}
+    for name, value in item.items():
+        (kind, raw), = value.items()
+        values[name] = {'N': lambda v: Decimal(v), 'B': bytes}.get(kind, lambda v: v)(raw)
+    return values
+
+
+def probe_loopback(monkeypatch, port, encoding):
+    """probe_target against the listener, with the target endpoint swapped for loopback."""
+    connect = probe.connect_attempt
+    monkeypatch.setattr(probe, 'connect_attempt', lambda endpoint, _, **kwargs: connect('127.0.0.1', port, **kwargs))
+    monkeypatch.setattr(probe, 'RESULTS_ENCODING', encoding)
+    return probe.probe_target({'RegionName': 'loopback-1'}, port, 'loopback-0', 'aws', FixedPlanner(),
+                              ProbePlan(probe.FIXED_ATTEMPTS, 1, None, False),
+                              log=lambda *args: None, sleep=lambda seconds: None)
+
+
+@supported
+def test_every_connection_reports_a_kernel_rtt(port):
+    results = [probe.connect_attempt('127.0.0.1', port) for _ in range(CONNECTIONS)]
+
+    assert all(failure is None for _, _, failure in results)
+    assert all(rtt is not None for _, rtt, _ in results)
+    # The handshake the kernel timed is part of the wall-clock connect time
+    assert all(rtt_us / 1000 <= ms + 0.01 for ms, (rtt_us, _), _ in results)
+
+
+def test_no_kernel_rtt_when_disabled(monkeypatch, port):
+    monkeypatch.setattr(probe, 'KERNEL_RTT', 'off')
+    assert not probe.kernel_rtt_supported()
+    ms, rtt, failure = probe.connect_attempt('127.0.0.1', port)
+    assert failure is None and rtt is None
+
+
+def test_no_kernel_rtt_for_a_refused_connection(closed_port):
+    assert probe.connect_attempt('127.0.0.1', closed_port, log=lambda *args: None) == (None, None, 'refused')
+
+
+@pytest.mark.parametrize('encoding', ['packed', 'list'])
+def test_kernel_rtts_read_back_from_every_layout(monkeypatch, port, encoding):
+    item, attempt_times, kernel_rtts = probe_loopback(monkeypatch, port, encoding)
+    stored = deserialize(item)
+    expected = [round(rtt[0] / 1000, 3) for rtt in kernel_rtts if rtt is not None]
+
+    assert [round(v, 3) for v in item_samples(stored, 'kernel').tolist()] == expected
+    assert len(item_samples(stored).tolist()) == len(attempt_times)
+
+    run = build_run_item('loopback-0', 'aws', item['timestamp']['S'], port, 'fixed',
+                         [probe.run_destination(item, attempt_times, kernel_rtts)] * 2)
+    for destination in expand_run_item(deserialize(run)):
+        assert concat_samples([destination], 'kernel').round(3).tolist() == expected
+
+    rollup = build_rollup('loopback-0', 'loopback-1', '2026-01-01', [run_average(stored)],
+                          **kernel_rollup_values([stored]))
+    if probe.kernel_rtt_supported():
+        assert run_average(stored, 'kernel') is not None
+        assert item_samples(rollup, 'kernel').size == 1
@@ -0,0 +1,75 @@
+import pytest
+
+from chalicelib.probe_budget import ProbePlanner
+
+ATTEMPT_SECONDS = 2.0
+RESERVE_SECONDS = 35
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeContext:
+    """Stand-in for the Lambda context, its remaining time follows the fake clock."""
+
+    def __init__(self, clock, timeout_seconds):
+        self.clock = clock
+        self.end = clock() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return int(max(0.0, self.end - self.clock()) * 1000)
+
+
+@pytest.mark.parametrize('timeout', [120, 300, 900])
+@pytest.mark.parametrize('targets', [10, 35, 60, 120])
+@pytest.mark.parametrize('attempts', [5, 10])
+def test_plan_fits_the_budget(timeout, targets, attempts):
+    clock = FakeClock()
+    planner = ProbePlanner(ATTEMPT_SECONDS, RESERVE_SECONDS, max_concurrency=4, clock=clock)
+    plan = planner.plan(targets, attempts, FakeContext(clock, timeout))
+
+    expected = targets * plan.attempts * ATTEMPT_SECONDS / plan.concurrency
+    assert expected <= timeout - RESERVE_SECONDS or plan.attempts == 1
+    assert 1 <= plan.concurrency <= 4
+    assert plan.reduced == (plan.attempts < attempts)
+    assert plan.deadline == clock() + timeout - RESERVE_SECONDS
+
+
+def test_concurrency_is_only_raised_when_needed():
+    clock = FakeClock()
+    planner = ProbePlanner(ATTEMPT_SECONDS, RESERVE_SECONDS, max_concurrency=4, clock=clock)
+    plan = planner.plan(10, 5, FakeContext(clock, 900))
+    assert (plan.attempts, plan.concurrency, plan.reduced) == (5, 1, False)
+
+
+def test_deadline_stops_attempts():
+    clock = FakeClock()
+    planner = ProbePlanner(ATTEMPT_SECONDS, RESERVE_SECONDS, clock=clock)
+    plan = planner.plan(35, 5, FakeContext(clock, 60))
+
+    clock.now += 60 - RESERVE_SECONDS - 0.1
+    assert not planner.expired(plan)
+    clock.now += 0.2
+    assert planner.expired(plan)
+
+
+def test_no_context_is_not_limited():
+    planner = ProbePlanner(ATTEMPT_SECONDS, RESERVE_SECONDS, clock=FakeClock())
+    plan = planner.plan(35, 5)
+    assert plan.deadline is None
+    assert plan.attempts == 5
+    assert not planner.expired(plan)
+
+
+def test_app_plans_attempts_at_their_timeout():
+    from chalicelib.probe import CONNECT_TIMEOUT, SAMPLING_INTERVAL
+
+    import app
+
+    planner = app.get_probe_planner()
+    assert planner.attempt_seconds >= SAMPLING_INTERVAL + CONNECT_TIMEOUT
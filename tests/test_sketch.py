@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from shared.sketch import LatencySketch, merge_sketches
+
+PERCENTILES = [10, 25, 50, 75, 90, 95, 98, 99, 99.9]
+
+
+def synthetic_day(rng, runs, base_ms):
+    """Mostly stable latencies with a lognormal body and occasional spikes."""
+    values = base_ms * rng.lognormal(0, 0.05, runs)
+    spikes = rng.random(runs) < 0.02
+    values[spikes] *= rng.uniform(2, 10, spikes.sum())
+    return values
+
+
+@pytest.mark.parametrize('days, runs_per_day', [(1, 4), (30, 4), (7, 96)])
+def test_merged_daily_sketches_within_relative_accuracy(days, runs_per_day):
+    rng = np.random.default_rng(7)
+    for _ in range(50):
+        base_ms = rng.uniform(1, 300)
+        daily = [synthetic_day(rng, runs_per_day, base_ms) for _ in range(days)]
+        merged = merge_sketches([LatencySketch.from_values(values).to_bytes() for values in daily])
+
+        exact = np.percentile(np.concatenate(daily), PERCENTILES)
+        estimated = merged.quantiles([p / 100 for p in PERCENTILES])
+        errors = np.abs(estimated - exact) / exact
+        assert errors.max() <= merged.relative_accuracy + 1e-9
+
+
+def test_round_trip_keeps_counts_and_quantiles():
+    values = np.random.default_rng(1).lognormal(4, 0.3, 1000)
+    sketch = LatencySketch.from_values(values)
+    restored = LatencySketch.from_bytes(sketch.to_bytes())
+    assert restored.count == sketch.count == len(values)
+    assert restored.quantiles([0.5, 0.99]).tolist() == sketch.quantiles([0.5, 0.99]).tolist()
+
+
+def test_sketch_size_stays_small():
+    rng = np.random.default_rng(3)
+    sizes = [len(LatencySketch.from_values(synthetic_day(rng, 4, rng.uniform(1, 300))).to_bytes())
+             for _ in range(100)]
+    assert np.mean(sizes) < 100
@@ -0,0 +1,101 @@
+import importlib
+from decimal import Decimal
+
+import pytest
+
+from shared import run_records
+from shared.run_records import build_run_item, expand_run_item
+from shared.tiered_storage import read_run_samples
+
+START = '2026-01-01T06:00:00.000Z'
+END = '2026-01-01T18:00:00.000Z'
+RUN_TIMESTAMP = '2026-01-01T12:00:00.000Z'
+ATTEMPTS = [10.0, 12.0, 14.0]
+
+
+class FakeTable:
+    """query() stand-in that answers every query with its fixed items, on one page."""
+
+    def __init__(self, name, items):
+        self.name = name
+        self.items = items
+
+    def query(self, **kwargs):
+        return {'Items': list(self.items)}
+
+
+def ping_test_item(region_to):
+    """A per-destination PingTest item of the run, as the boto3 resource API reads it."""
+    return {
+        'region': 'us-east-1',
+        'regionTo': region_to,
+        'timestamp': '2026-01-01T12:00:01.250Z',
+        'avg': Decimal('12.0'),
+        'attempts': Decimal(3),
+        'attemptsSuccess': Decimal(3),
+        'results': [{'seq': Decimal(i), 'time': Decimal(str(t))} for i, t in enumerate(ATTEMPTS)],
+    }
+
+
+def run_item(regions_to):
+    """The same run written as one PingTestRuns item, deserialized."""
+    destinations = [{
+        'regionTo': region_to, 'partitionTo': 'aws',
+        'avg': 12.0, 'min': 10.0, 'max': 14.0, 'variance': 4.0,
+        'attempts': 3, 'attemptsSuccess': 3, 'truncated': False, 'failuresTimeout': 0, 'failuresRefused': 0,
+        'attempt_times': ATTEMPTS,
+    } for region_to in regions_to]
+    item = build_run_item('us-east-1', 'aws', RUN_TIMESTAMP, 443, 'fixed', destinations)
+    values = {}
+    for name, value in item.items():
+        (kind, raw), = value.items()
+        values[name] = {'N': Decimal, 'B': bytes}.get(kind, lambda v: v)(raw)
+    return values
+
+
+@pytest.fixture
+def layout(monkeypatch):
+    """Set RESULTS_LAYOUT, as the readers' Lambda environment would."""
+    def set_layout(name):
+        monkeypatch.setenv('RESULTS_LAYOUT', name)
+        importlib.reload(run_records)
+
+    yield set_layout
+    monkeypatch.delenv('RESULTS_LAYOUT', raising=False)
+    importlib.reload(run_records)
+
+
+def read(ping_items, runs):
+    return read_run_samples(FakeTable('PingTest', ping_items), FakeTable('PingTestDaily', []), 'us-east-1',
+                            START, END, runs_table=FakeTable('PingTestRuns', runs))
+
+
+def test_both_layout_counts_every_run_once(layout):
+    layout('both')
+    regions_to = ['eu-west-1', 'ap-south-1']
+    assert len(expand_run_item(run_item(regions_to))) == len(regions_to)
+
+    # The run is in both tables, under different timestamps
+    averages, attempts, counts = read([ping_test_item(region_to) for region_to in regions_to],
+                                      [run_item(regions_to)])
+    for region_to in regions_to:
+        assert averages[region_to] == [12.0]
+        assert attempts[region_to].tolist() == ATTEMPTS
+        assert counts[region_to]['runs'] == 1
+        assert counts[region_to]['attempts'] == 3
+
+
+def test_run_layout_reads_older_items_and_runs(layout):
+    layout('run')
+    # An item written before the switch, and a run written after it
+    averages, attempts, counts = read([ping_test_item('eu-west-1')], [run_item(['eu-west-1'])])
+    assert averages['eu-west-1'] == [12.0, 12.0]
+    assert counts['eu-west-1']['runs'] == 2
+
+
+@pytest.mark.parametrize('name', ['items', 'both'])
+def test_runs_table_is_not_read_without_the_run_layout(layout, name):
+    layout(name)
+    assert not run_records.RUNS_TABLE_ENABLED
+    averages, _, _ = read([], [run_item(['eu-west-1'])])
+    assert averages == {}
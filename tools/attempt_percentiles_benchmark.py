@@ -0,0 +1,104 @@
+"""
+Benchmark attempt-level percentiles against per-run average percentiles.
+
+Builds the PingTest items of one source region over a window (packed
+samples and legacy results lists) and times the percentiles that
+calculate_avgs computes per destination: over per-run averages, and over
+every attempt flattened with concat_samples. Also reports the extra bytes
+the attempt samples add to the daily rollups.
+
+Usage:
+    python tools/attempt_percentiles_benchmark.py --days 365 --destinations 35
+"""
+
+import argparse
+import os
+import sys
+import time
+from decimal import Decimal
+
+import numpy as np
+
+# Import the module directly so the script runs without the AWS dependencies of shared/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+
+from result_encoding import concat_samples, encode_samples  # noqa: E402
+
+PERCENTILES = [10, 25, 50, 75, 90, 98, 99]
+
+
+def synthetic_items(rng, destinations, runs, attempts, packed):
+    """Resource-format PingTest items, grouped by destination."""
+    grouped = {}
+    for destination in range(destinations):
+        base_ms = rng.uniform(1, 300)
+        times = base_ms * rng.lognormal(0, 0.05, (runs, attempts))
+        spikes = rng.random((runs, attempts)) < 0.02
+        times[spikes] *= rng.uniform(2, 10, spikes.sum())
+        items = []
+        for run in times.round(2):
+            item = {'regionTo': f"region-{destination}", 'avg': Decimal(str(run.mean()))}
+            if packed:
+                item['samples'] = encode_samples(run.tolist())
+            else:
+                item['results'] = [
+                    {'seq': Decimal(seq), 'time': Decimal(str(t))} for seq, t in enumerate(run)
+                ]
+            items.append(item)
+        grouped[f"region-{destination}"] = items
+    return grouped
+
+
+def timed(func, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_percentiles(grouped):
+    return {
+        region_to: np.percentile(np.array([float(item['avg']) for item in items]), PERCENTILES)
+        for region_to, items in grouped.items()
+    }
+
+
+def attempt_percentiles(grouped):
+    return {
+        region_to: np.percentile(concat_samples(items), PERCENTILES)
+        for region_to, items in grouped.items()
+    }
+
+
+def main(days, runs_per_day, attempts, destinations, seed):
+    rng = np.random.default_rng(seed)
+    runs = days * runs_per_day
+    print(f"{destinations} destinations x {runs} runs x {attempts} attempts "
+          f"= {destinations * runs * attempts} attempt samples")
+
+    for packed in (True, False):
+        grouped = synthetic_items(rng, destinations, runs, attempts, packed)
+        run_seconds, run_result = timed(lambda: run_percentiles(grouped))
+        attempt_seconds, attempt_result = timed(lambda: attempt_percentiles(grouped))
+        gap = np.mean([attempt_result[r][-1] / run_result[r][-1] - 1 for r in grouped])
+        print(f"{'packed samples' if packed else 'results lists'}: "
+              f"run averages {run_seconds * 1000:.1f} ms, attempts {attempt_seconds * 1000:.1f} ms "
+              f"({attempt_seconds / run_seconds:.1f}x), attempt p99 {gap:+.1%} vs run p99")
+
+    run_bytes = len(encode_samples([0.0] * runs_per_day))
+    attempt_bytes = len(encode_samples([0.0] * runs_per_day * attempts))
+    print(f"Rollup item per pair and day: {run_bytes} bytes of run averages, "
+          f"+{attempt_bytes} bytes of attempt samples")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--runs-per-day', type=int, default=4)
+    parser.add_argument('--attempts', type=int, default=5)
+    parser.add_argument('--destinations', type=int, default=35)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    main(args.days, args.runs_per_day, args.attempts, args.destinations, args.seed)
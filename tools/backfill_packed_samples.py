@@ -0,0 +1,162 @@
+"""
+Backfill the packed `samples` attribute onto existing PingTest items.
+
+Scans PingTest for items that still carry the legacy `results` list, rewrites
+them with the compact binary encoding from shared.result_encoding and removes
+the list. Kernel RTTs recorded in the list (rtt_us, rttvar_us) are packed into
+rtt_samples and rttvar_samples in ms, as the prober writes them. Run with --dry-run first to get the size and write unit comparison
+without modifying anything.
+
+Usage:
+    python tools/backfill_packed_samples.py --dry-run
+    python tools/backfill_packed_samples.py --format 2 --limit 10000
+"""
+
+import argparse
+import math
+import os
+import sys
+
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from shared.result_encoding import (  # noqa: E402
+    SAMPLES_ATTRIBUTE,
+    SAMPLES_FORMAT_FLOAT32,
+    RTT_SAMPLES_ATTRIBUTE,
+    RTTVAR_SAMPLES_ATTRIBUTE,
+    encode_samples,
+)
+
+TABLE_NAME = 'PingTest'
+
+
+def attribute_size(value):
+    """Approximate the DynamoDB storage size of a low-level attribute value."""
+    (type_key, raw), = value.items()
+    if type_key == 'S':
+        return len(raw.encode('utf-8'))
+    if type_key == 'N':
+        digits = len(raw.lstrip('-').replace('.', '').lstrip('0')) or 1
+        return int(math.ceil(digits / 2.0)) + 1
+    if type_key == 'B':
+        return len(raw)
+    if type_key == 'BOOL' or type_key == 'NULL':
+        return 1
+    if type_key == 'L':
+        return 3 + sum(1 + attribute_size(v) for v in raw)
+    if type_key == 'M':
+        return 3 + sum(1 + len(k.encode('utf-8')) + attribute_size(v) for k, v in raw.items())
+    raise ValueError(f"Unsupported attribute type: {type_key}")
+
+
+def item_size(item):
+    """Approximate the DynamoDB size of a low-level item in bytes."""
+    return sum(len(name.encode('utf-8')) + attribute_size(value) for name, value in item.items())
+
+
+def write_units(size):
+    """Write capacity units consumed by a standard put of an item of this size."""
+    return max(1, int(math.ceil(size / 1024.0)))
+
+
+def legacy_attempt_times(item, key='time', scale=1.0):
+    """
+    Rebuild a per-attempt value list from a legacy item.
+
+    Args:
+        key: The results entry to read ('time', 'rtt_us' or 'rttvar_us')
+        scale: Divisor of the stored value, 1000.0 for microseconds to ms
+
+    Returns:
+        list: One value per attempt, None for failed attempts and attempts
+              without the key
+    """
+    attempts = int(item.get('attempts', {'N': '0'})['N'])
+    results = [r['M'] for r in item['results']['L']]
+    by_seq = {int(r['seq']['N']): float(r[key]['N']) / scale for r in results if key in r}
+    attempts = max([attempts] + [int(r['seq']['N']) + 1 for r in results])
+    return [by_seq.get(seq) for seq in range(attempts)]
+
+
+def packed_item(item, version):
+    """Return a copy of the item with `results` replaced by packed samples."""
+    packed = {k: v for k, v in item.items() if k != 'results'}
+    packed[SAMPLES_ATTRIBUTE] = {'B': encode_samples(legacy_attempt_times(item), version)}
+    # Kernel RTTs stay float32 whatever the samples format, like the prober stores them
+    for attribute, key in ((RTT_SAMPLES_ATTRIBUTE, 'rtt_us'), (RTTVAR_SAMPLES_ATTRIBUTE, 'rttvar_us')):
+        values = legacy_attempt_times(item, key, 1000.0)
+        if any(value is not None for value in values):
+            packed[attribute] = {'B': encode_samples(values)}
+    return packed
+
+
+def backfill(client, version, dry_run=False, limit=None):
+    scanned = 0
+    converted = 0
+    bytes_before = 0
+    bytes_after = 0
+    wcu_before = 0
+    wcu_after = 0
+
+    kwargs = {'TableName': TABLE_NAME}
+    while True:
+        response = client.scan(**kwargs)
+        for item in response.get('Items', []):
+            scanned += 1
+            if 'results' not in item or SAMPLES_ATTRIBUTE in item:
+                continue
+
+            new_item = packed_item(item, version)
+            size_before = item_size(item)
+            size_after = item_size(new_item)
+            bytes_before += size_before
+            bytes_after += size_after
+            wcu_before += write_units(size_before)
+            wcu_after += write_units(size_after)
+
+            if not dry_run:
+                client.put_item(TableName=TABLE_NAME, Item=new_item)
+            converted += 1
+
+            if limit and converted >= limit:
+                break
+
+        if (limit and converted >= limit) or 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    print(f"Scanned {scanned} items, {'would convert' if dry_run else 'converted'} {converted}")
+    if converted:
+        print(f"Average item size: {bytes_before / converted:.1f} B -> {bytes_after / converted:.1f} B "
+              f"({100.0 * (1 - bytes_after / bytes_before):.1f}% smaller)")
+        print(f"Write units per put: {wcu_before / converted:.2f} -> {wcu_after / converted:.2f}")
+
+    return {
+        'scanned': scanned,
+        'converted': converted,
+        'bytes_before': bytes_before,
+        'bytes_after': bytes_after,
+        'wcu_before': wcu_before,
+        'wcu_after': wcu_after,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--format', type=int, default=SAMPLES_FORMAT_FLOAT32,
+                        help='Samples format version (1=float32, 2=uint16 tenth-ms)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only report size and write unit savings')
+    parser.add_argument('--limit', type=int, default=None,
+                        help='Stop after converting this many items')
+    parser.add_argument('--region', default='us-east-2')
+    args = parser.parse_args()
+
+    backfill(
+        boto3.client('dynamodb', region_name=args.region),
+        version=args.format,
+        dry_run=args.dry_run,
+        limit=args.limit
+    )
@@ -0,0 +1,145 @@
+"""
+Check the cold-start import cost of every Lambda app against a budget.
+
+Runs `python -X importtime -c "import app"` in each app directory (the
+import Lambda performs before the first invocation), prints the slowest
+imports and fails when:
+
+  - a module that must stay lazy is imported eagerly (e.g. NumPy in
+    ping_from_region and cloudping-api, or the scheduled_functions modules
+    at app load)
+  - the cumulative import time exceeds the baseline in
+    tools/import_budget.json by more than the tolerance, or the app has no
+    baseline
+
+Import times depend on the machine, so record the baseline where the apps'
+requirements are installed and check against it on the same kind of host.
+The committed baseline was recorded on a Linux host with Python 3 and the
+requirements of every app installed.
+
+Usage:
+    python tools/import_budget.py --record       # write tools/import_budget.json
+    python tools/import_budget.py                # check against it
+    python tools/import_budget.py --apps cloudping-api --top 20
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from sync_shared import sync, APPS as SHARED_APPS
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'import_budget.json')
+
+# Modules each app must not import before its first invocation
+FORBIDDEN = {
+    'ping_from_region': [
+        'boto3', 'numpy', 'chalicelib.shared.sketch', 'chalicelib.shared.profiles', 'chalicelib.agent',
+    ],
+    'scheduled_functions': [
+        'numpy', 'chalicelib.calculate_avgs', 'chalicelib.calculation_scheduler',
+        'chalicelib.compact_ping_data', 'chalicelib.detect_anomalies',
+        'chalicelib.store_region_status', 'chalicelib.stream_aggregation',
+        'chalicelib.update_profiles',
+    ],
+    'cloudping-api': [
+        'boto3', 'numpy', 'chalicelib.latency_matrix', 'chalicelib.sketch_queries', 'chalicelib.placement',
+        'chalicelib.shared.anomaly', 'chalicelib.shared.profiles',
+    ],
+    'ping-function-deployer': ['numpy'],
+    'account-region-manager': ['numpy'],
+}
+
+
+def measure(app_dir):
+    """
+    Import app.py of one app in a fresh interpreter.
+
+    Returns:
+        dict: {module: cumulative microseconds}, in import order
+    """
+    env = dict(os.environ, AWS_DEFAULT_REGION=os.environ.get('AWS_DEFAULT_REGION', 'us-east-2'))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=os.path.join(ROOT, app_dir), env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        # The last stderr line is the ImportError of a missing requirement
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def check(app_dir, modules, baseline, tolerance, top):
+    """Print the report of one app and return its failures (baseline None: not checked)."""
+    failures = []
+    total_ms = modules.get('app', 0) / 1000
+    print(f"{app_dir}: {total_ms:.1f} ms, {len(modules)} modules")
+    slowest = sorted(modules.items(), key=lambda m: m[1], reverse=True)[1:top + 1]
+    for name, cumulative in slowest:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    eager = [name for name in FORBIDDEN.get(app_dir, []) if name in modules]
+    if eager:
+        failures.append(f"{app_dir}: imported at cold start: {', '.join(eager)}")
+
+    if baseline is None:
+        return failures
+    budget_ms = baseline.get(app_dir)
+    if budget_ms is None:
+        failures.append(f"{app_dir}: no baseline, record one with --record")
+    elif total_ms > budget_ms * (1 + tolerance):
+        failures.append(f"{app_dir}: {total_ms:.1f} ms exceeds the baseline {budget_ms:.1f} ms "
+                        f"by more than {tolerance:.0%}")
+    return failures
+
+
+def main(apps, record, tolerance, top, runs):
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+
+    sync([app_dir for app_dir in apps if app_dir in SHARED_APPS])
+    failures = []
+    measured = {}
+    for app_dir in apps:
+        try:
+            # Best of several runs, the first one also warms the bytecode cache
+            samples = [measure(app_dir) for _ in range(runs)]
+        except RuntimeError as e:
+            failures.append(f"{app_dir}: import failed: {e}")
+            continue
+        modules = min(samples, key=lambda m: m.get('app', 0))
+        measured[app_dir] = round(modules.get('app', 0) / 1000, 1)
+        failures += check(app_dir, modules, None if record else baseline, tolerance, top)
+
+    if record and not failures:
+        with open(BASELINE_PATH, 'w') as f:
+            # Apps that were not measured keep their baseline
+            json.dump({**baseline, **measured}, f, indent=2, sort_keys=True)
+        print(f"Recorded the baseline of {len(measured)} apps in {BASELINE_PATH}")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--apps', nargs='+', default=list(FORBIDDEN))
+    parser.add_argument('--record', action='store_true', help='Write the measured times as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown over the baseline')
+    parser.add_argument('--top', type=int, default=10, help='Slowest imports to list per app')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+    sys.exit(main(args.apps, args.record, args.tolerance, args.top, args.runs))
@@ -0,0 +1,83 @@
+"""
+Benchmark the region placement solver.
+
+Builds a latency matrix from random points on a sphere (latency grows with
+great circle distance, plus noise), then times solve_placement for every
+k and objective with all regions as both users and candidates. Reports how
+far the greedy solution is from the exact one where both are computed,
+and exits non-zero when any solve takes longer than the budget.
+
+Usage:
+    python tools/placement_benchmark.py --regions 40 --max-k 6
+"""
+
+import argparse
+import os
+import sys
+import time
+from math import comb
+
+import numpy as np
+
+# Import the module directly so the script runs without the API's AWS dependencies
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cloudping-api', 'chalicelib'))
+
+from placement import EXACT_MAX_COMBINATIONS, OBJECTIVES, solve_placement  # noqa: E402
+
+
+def synthetic_matrix(rng, regions):
+    """Flat N*N latencies, roughly 1 ms per 100 km of great circle distance."""
+    lat = np.arcsin(rng.uniform(-1, 1, regions))
+    lon = rng.uniform(-np.pi, np.pi, regions)
+    cos_angle = (np.sin(lat)[:, None] * np.sin(lat)[None, :] +
+                 np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.cos(lon[:, None] - lon[None, :]))
+    km = 6371 * np.arccos(np.clip(cos_angle, -1, 1))
+    matrix = 2 + km / 100 * rng.uniform(1.0, 1.3, (regions, regions))
+    matrix[rng.random((regions, regions)) < 0.01] = np.nan
+    return matrix.reshape(-1)
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main(regions, max_k, budget_ms, seed):
+    rng = np.random.default_rng(seed)
+    matrix = synthetic_matrix(rng, regions)
+    everyone = list(range(regions))
+    slowest = 0.0
+
+    for objective in OBJECTIVES:
+        for k in range(1, max_k + 1):
+            result, elapsed = timed(lambda: solve_placement(matrix, regions, everyone, everyone, k, objective))
+            slowest = max(slowest, elapsed)
+            line = (f"{objective:6} k={k} {result.method:6} {elapsed:8.1f} ms  "
+                    f"worst={result.worst_latency:7.1f} mean={result.mean_latency:7.1f}")
+
+            # Compare greedy with exact where exact stays affordable
+            if comb(regions, k) <= EXACT_MAX_COMBINATIONS * 20:
+                exact, _ = timed(lambda: solve_placement(matrix, regions, everyone, everyone, k, objective, 'exact',
+                                                         max_combinations=EXACT_MAX_COMBINATIONS * 20))
+                greedy, _ = timed(lambda: solve_placement(matrix, regions, everyone, everyone, k, objective, 'greedy'))
+                key = 'worst_latency' if objective == 'center' else 'mean_latency'
+                gap = getattr(greedy, key) / getattr(exact, key) - 1
+                line += f"  greedy gap={gap:.2%}"
+            print(line)
+
+    print(f"Slowest solve: {slowest:.1f} ms (budget {budget_ms:.0f} ms)")
+    if slowest > budget_ms:
+        print("FAILED")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--regions', type=int, default=40)
+    parser.add_argument('--max-k', type=int, default=6)
+    parser.add_argument('--budget-ms', type=float, default=1000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    sys.exit(main(args.regions, args.max_k, args.budget_ms, args.seed))
@@ -0,0 +1,593 @@
+"""
+Recompute the daily rollups and the stored averages from the raw history.
+
+Instead of invoking calculate_avgs region by region, the tool reads every
+table once with DynamoDB parallel scans: the scan of each table is split
+into --segments segments (Segment/TotalSegments) that a pool of --workers
+processes works through. Each segment folds its items into per (source,
+destination, day) partial aggregates, so the scans never need to meet.
+
+  PingTest, PingTestRuns   raw runs; run-level items are expanded like the
+                           readers of shared.tiered_storage do (PingTestRuns
+                           only with RESULTS_LAYOUT run or both)
+  PingTestDaily            complete rollups, used for the days that have
+                           aged out of the raw tier
+
+Afterwards the partials are merged and
+
+  - every day still fully present in the raw tier is rolled up again with
+    tiered_storage.build_rollup (today as an incomplete rollup)
+  - the 1D/1W/1M/1Y averages of every pair are recalculated with
+    calculate_avgs.summarize_pairs over the same days and rollups that
+    calculate() would read, and written to cloudping_stored_avgs
+
+Writes go through shared.batch_writer in batches of 25. When any item is
+not written the checkpoints are kept and the tool exits non-zero; running it
+again skips the scans and writes everything again.
+
+Progress is checkpointed per segment in --checkpoint-dir (last evaluated
+key plus the partials so far), so an interrupted run resumes where each
+segment stopped. Scans are throttled to --max-rcu read capacity units per
+second in total, measured from the ConsumedCapacity of every page.
+
+--synthetic replaces DynamoDB with an in-process stand-in holding a
+generated PingTest history, to measure the tool's throughput without AWS.
+
+Usage:
+    python tools/recompute_aggregates.py --dry-run
+    python tools/recompute_aggregates.py --segments 32 --workers 8 --max-rcu 2000
+    python tools/recompute_aggregates.py --synthetic --regions 35 --days 35 --dry-run
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import random
+import shutil
+import sys
+import time
+from datetime import datetime, timedelta
+
+import boto3
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+from sync_shared import sync
+
+if multiprocessing.parent_process() is None:  # Workers import the parent's copy
+    sync(['scheduled_functions'])
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scheduled_functions'))
+
+from backfill_packed_samples import item_size  # noqa: E402
+from chalicelib.calculate_avgs import summarize_pairs, AGGREGATION_MODE, LATENCY_SOURCE, TIMEFRAME_DAYS  # noqa: E402
+from chalicelib.calculation_scheduler import averages_item, TIMEFRAMES_TO_STORE  # noqa: E402
+from chalicelib.shared.averages_version import bump_averages_version  # noqa: E402
+from chalicelib.shared.metadata import METADATA_TABLE  # noqa: E402
+from chalicelib.shared.batch_writer import PipelinedBatchWriter  # noqa: E402
+from chalicelib.shared.result_encoding import (  # noqa: E402
+    concat_samples, decode_samples, encode_samples, item_samples, run_average, LATENCY_SOURCES, RTT_SAMPLES_ATTRIBUTE
+)
+from chalicelib.shared.run_records import expand_run_item, RUNS_TABLE, RUNS_TABLE_ENABLED  # noqa: E402
+from chalicelib.shared.tiered_storage import (  # noqa: E402
+    build_rollup, connection_counts, ATTEMPT_SAMPLES_ATTRIBUTES, CONNECTION_COUNTS, ROLLUP_TABLE
+)
+
+import numpy as np  # noqa: E402
+
+PING_TEST_TABLE = 'PingTest'
+AVERAGES_TABLE = 'cloudping_stored_avgs'
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+# What each scanned table contributes, see PairDays. Like the readers, every
+# run comes from one layout: with RESULTS_LAYOUT=both the runs are also in
+# PingTest, so PingTestRuns is only scanned with RESULTS_LAYOUT=run
+TABLES = {PING_TEST_TABLE: 'raw', ROLLUP_TABLE: 'rollups'}
+if RUNS_TABLE_ENABLED:
+    TABLES[RUNS_TABLE] = 'runs'
+
+_deserializer = TypeDeserializer()
+_serializer = TypeSerializer()
+
+
+def timestamp(dt):
+    return dt.strftime(TIMESTAMP_FORMAT)[:-3] + 'Z'
+
+
+class CapacityThrottle:
+    """Sleeps to keep the capacity consumed since the start under `rate` units per second."""
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self.started = clock()
+        self.consumed = 0.0
+
+    def consume(self, units):
+        self.consumed += units
+        if not self.rate:
+            return
+        ahead = self.consumed / self.rate - (self.clock() - self.started)
+        if ahead > 0:
+            self.sleep(ahead)
+
+
+def new_entry():
+    return {'counts': dict.fromkeys(CONNECTION_COUNTS, 0), 'connect': ([], []), 'kernel': ([], [])}
+
+
+def add_counts(target, counts):
+    for name, value in counts.items():
+        target[name] += value
+
+
+class PairDays:
+    """
+    Partial aggregates per (source, destination, day), mergeable across segments.
+
+    raw      connection counts, and run averages plus attempt time arrays per
+             latency source, of the raw runs (see new_entry)
+    edges    (timestamp, counts, {source: (average or None, attempt times)})
+             of every raw run on a window's first day, which calculate()
+             reads by timestamp
+    rollups  (counts or None, {source: (run averages, attempt times or None)})
+             of complete rollups, kernel only when the rollup has kernel RTTs
+    """
+
+    def __init__(self, now, edge_days):
+        self.now = now
+        self.edge_days = set(edge_days)
+        self.raw = {}
+        self.edges = {}
+        self.rollups = {}
+
+    def add(self, kind, items):
+        if kind == 'rollups':
+            self.add_rollups(items)
+            return
+        if kind == 'runs':
+            items = [destination for run in items for destination in expand_run_item(run)]
+
+        grouped = {}
+        for item in items:
+            if item['timestamp'] <= self.now:
+                grouped.setdefault((item['region'], item['regionTo'], item['timestamp'][:10]), []).append(item)
+        for key, group in grouped.items():
+            entry = self.raw.setdefault(key, new_entry())
+            add_counts(entry['counts'], connection_counts(group))
+            for source in LATENCY_SOURCES:
+                averages = (run_average(item, source) for item in group)
+                entry[source][0].extend(avg for avg in averages if avg is not None)
+                entry[source][1].append(concat_samples(group, source))
+            if key[2] in self.edge_days:
+                self.edges.setdefault(key, []).extend(
+                    (item['timestamp'], connection_counts([item]), {
+                        source: (run_average(item, source), concat_samples([item], source))
+                        for source in LATENCY_SOURCES
+                    })
+                    for item in group
+                )
+
+    def add_rollups(self, items):
+        for item in items:
+            if not item.get('complete', True):
+                continue
+            values = {}
+            for source in LATENCY_SOURCES:
+                attempts = item.get(ATTEMPT_SAMPLES_ATTRIBUTES[source])
+                if source == 'connect' or RTT_SAMPLES_ATTRIBUTE in item:
+                    values[source] = (
+                        item_samples(item, source),
+                        None if attempts is None else decode_samples(bytes(getattr(attempts, 'value', attempts)))
+                    )
+            self.rollups[(item['region'], item['regionTo'], item['day'])] = (
+                {name: int(item[name]) for name in CONNECTION_COUNTS} if 'runs' in item else None,
+                values
+            )
+
+    def merge(self, other):
+        for key, other_entry in other.raw.items():
+            entry = self.raw.setdefault(key, new_entry())
+            add_counts(entry['counts'], other_entry['counts'])
+            for source in LATENCY_SOURCES:
+                entry[source][0].extend(other_entry[source][0])
+                entry[source][1].extend(other_entry[source][1])
+        for key, runs in other.edges.items():
+            self.edges.setdefault(key, []).extend(runs)
+        self.rollups.update(other.rollups)
+
+
+# Per process state of the pool, set by init_worker
+_worker = {}
+
+
+def init_worker(config):
+    _worker['config'] = config
+    if config['synthetic']:
+        _worker['client'] = SyntheticDynamoDB(**config['synthetic'])
+    else:
+        _worker['client'] = boto3.client('dynamodb', region_name=config['region'],
+                                         endpoint_url=config['endpoint_url'])
+
+
+def checkpoint_path(directory, table_name, segment):
+    return os.path.join(directory, f"{table_name}-{segment:05d}.pickle")
+
+
+def save_checkpoint(path, state):
+    """Write atomically, an interrupted write leaves the previous checkpoint."""
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path)
+
+
+def scan_segment(task):
+    """Scan one segment of one table into its checkpoint file, resuming where it stopped."""
+    table_name, segment = task
+    config = _worker['config']
+    client = _worker['client']
+    path = checkpoint_path(config['checkpoint_dir'], table_name, segment)
+
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        if state['done']:
+            return {'table': table_name, 'segment': segment, 'items': 0, 'capacity': 0.0,
+                    'seconds': 0.0, 'resumed': True}
+    else:
+        state = {'last_key': None, 'done': False, 'items': 0, 'capacity': 0.0,
+                 'partials': PairDays(config['now'], config['edge_days'])}
+
+    started = time.monotonic()
+    items_before, capacity_before = state['items'], state['capacity']
+    throttle = CapacityThrottle(config['max_rcu'] / config['workers'])
+    kwargs = {
+        'TableName': table_name,
+        'Segment': segment,
+        'TotalSegments': config['segments'],
+        'ReturnConsumedCapacity': 'TOTAL',
+    }
+    pages = 0
+    while True:
+        if state['last_key']:
+            kwargs['ExclusiveStartKey'] = state['last_key']
+        try:
+            response = client.scan(**kwargs)
+        except client.exceptions.ResourceNotFoundException:
+            # e.g. no PingTestRuns table when only the item layout was ever written
+            state['done'] = True
+            break
+
+        items = [{k: _deserializer.deserialize(v) for k, v in item.items()} for item in response['Items']]
+        state['partials'].add(TABLES[table_name], items)
+        units = response.get('ConsumedCapacity', {}).get('CapacityUnits', 0.0)
+        state['items'] += len(items)
+        state['capacity'] += units
+        state['last_key'] = response.get('LastEvaluatedKey')
+        pages += 1
+        if not state['last_key']:
+            state['done'] = True
+            break
+        if pages % config['checkpoint_pages'] == 0:
+            save_checkpoint(path, state)
+        throttle.consume(units)
+
+    save_checkpoint(path, state)
+    return {
+        'table': table_name,
+        'segment': segment,
+        'items': state['items'] - items_before,
+        'capacity': state['capacity'] - capacity_before,
+        'seconds': time.monotonic() - started,
+        'resumed': items_before > 0,
+    }
+
+
+def load_partials(config):
+    """Merge the partials of every finished segment."""
+    merged = PairDays(config['now'], config['edge_days'])
+    for table_name in TABLES:
+        for segment in range(config['segments']):
+            with open(checkpoint_path(config['checkpoint_dir'], table_name, segment), 'rb') as f:
+                merged.merge(pickle.load(f)['partials'])
+    return merged
+
+
+def build_rollups(partials, today):
+    """
+    Rollups of every pair-day whose raw runs are all still present.
+
+    The oldest raw day of a source region may have partly expired, it keeps
+    its existing rollup.
+
+    Returns:
+        tuple: (rollup items, {source region: first rebuilt day})
+    """
+    first_raw_day = {}
+    for region, _, day in partials.raw:
+        first_raw_day[region] = min(day, first_raw_day.get(region, day))
+    first_day = {
+        region: (datetime.strptime(day, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        for region, day in first_raw_day.items()
+    }
+
+    rollups = []
+    for (region, region_to, day), entry in sorted(partials.raw.items()):
+        if day < first_day[region]:
+            continue
+        attempt_times = {
+            source: np.concatenate(entry[source][1]).tolist() if entry[source][1] else []
+            for source in LATENCY_SOURCES
+        }
+        rollups.append(build_rollup(
+            region, region_to, day, entry['connect'][0], complete=day < today,
+            attempt_times=attempt_times['connect'], counts=entry['counts'],
+            kernel_avgs=entry['kernel'][0], kernel_attempt_times=attempt_times['kernel']
+        ))
+    return rollups, first_day
+
+
+def pair_samples(partials, first_day, window_start, today, attempts, source):
+    """
+    The inputs of summarize_pairs per source region for one window, read like
+    tiered_storage.read_run_samples: full days from complete rollups unless
+    they were rebuilt, everything else from the raw runs.
+    """
+    rollup_days = {(region, day) for region, _, day in partials.rollups}
+    start_day = window_start[:10]
+    samples = {}
+
+    def entry(region, region_to):
+        avgs, parts, counts = samples.setdefault(region, ({}, {}, {}))
+        return (avgs.setdefault(region_to, []), parts.setdefault(region_to, []),
+                counts.setdefault(region_to, dict.fromkeys(CONNECTION_COUNTS, 0)))
+
+    for (region, region_to, day), (counts, values) in partials.rollups.items():
+        if start_day < day < today and day < first_day.get(region, '~'):
+            pair_avgs, pair_parts, pair_counts = entry(region, region_to)
+            avgs, parts = values.get(source, (np.empty(0), None))
+            pair_avgs.extend(avgs.tolist())
+            if parts is not None:
+                pair_parts.append(parts)
+            if counts is not None:
+                add_counts(pair_counts, counts)
+
+    for (region, region_to, day), raw in partials.raw.items():
+        if day <= start_day:
+            continue
+        if day < today and day < first_day.get(region, '~') and (region, day) in rollup_days:
+            continue
+        pair_avgs, pair_parts, pair_counts = entry(region, region_to)
+        pair_avgs.extend(raw[source][0])
+        pair_parts.extend(raw[source][1])
+        add_counts(pair_counts, raw['counts'])
+
+    # The window's first day is only read from the window start on
+    for (region, region_to, day), runs in partials.edges.items():
+        if day != start_day:
+            continue
+        for run_timestamp, counts, values in runs:
+            if run_timestamp < window_start:
+                continue
+            pair_avgs, pair_parts, pair_counts = entry(region, region_to)
+            avg, parts = values[source]
+            if avg is not None:
+                pair_avgs.append(avg)
+            pair_parts.append(parts)
+            add_counts(pair_counts, counts)
+
+    return {
+        region: (avgs, {
+            region_to: np.concatenate(parts) for region_to, parts in all_parts.items() if parts
+        } if attempts else {}, counts)
+        for region, (avgs, all_parts, counts) in samples.items()
+    }
+
+
+def summarize_region(task):
+    """Averages items of one source region and timeframe (runs in the pool)."""
+    region, timeframe, (avgs, attempt_times, counts) = task
+    return [averages_item(region, timeframe, avg) for avg in summarize_pairs(avgs, attempt_times, counts)]
+
+
+def write_items(client, table_name, items, max_in_flight):
+    """Batch write resource-format items, returns the batch writer summary."""
+    writer = PipelinedBatchWriter(client, table_name, max_in_flight=max_in_flight)
+    for item in items:
+        writer.put({key: _serializer.serialize(value) for key, value in item.items()})
+    return writer.close()
+
+
+class SyntheticDynamoDB:
+    """
+    In-process stand-in for the low-level DynamoDB client: scans of a generated
+    PingTest history (empty rollup and run tables) with 1 MB pages and
+    eventually consistent read capacity, writes are counted and dropped.
+    """
+
+    def __init__(self, regions=20, days=35, runs_per_day=4, attempts=5, now=None, seed=7):
+        self.regions = [f"synthetic-{i}" for i in range(regions)]
+        self.days = days
+        self.runs_per_day = runs_per_day
+        self.attempts = attempts
+        self.now = datetime.strptime(now[:19], '%Y-%m-%dT%H:%M:%S') if now else datetime.utcnow()
+        self.seed = seed
+        self.total = regions * days * runs_per_day * (regions - 1)
+        self.written = 0
+
+        class Exceptions:
+            ResourceNotFoundException = type('ResourceNotFoundException', (Exception,), {})
+        self.exceptions = Exceptions
+
+    def item(self, index):
+        destinations = len(self.regions) - 1
+        run, destination = divmod(index, destinations)
+        source, run = divmod(run, self.days * self.runs_per_day)
+        region_to = destination + (destination >= source)
+        run_time = self.now - timedelta(hours=24 * self.days * (1 - run / (self.days * self.runs_per_day)))
+
+        rng = random.Random(self.seed * 1_000_003 + index)
+        base = 1 + (source * 31 + region_to * 17) % 250
+        times = [round(base * rng.lognormvariate(0, 0.05), 2) if rng.random() > 0.01 else None
+                 for _ in range(self.attempts)]
+        ok = [t for t in times if t is not None]
+        item = {
+            'region': {'S': self.regions[source]},
+            'regionTo': {'S': self.regions[region_to]},
+            'timestamp': {'S': timestamp(run_time)},
+            'partition': {'S': 'aws'},
+            'partitionTo': {'S': 'aws'},
+            'port': {'N': '443'},
+            'attempts': {'N': str(self.attempts)},
+            'attemptsSuccess': {'N': str(len(ok))},
+            'failuresTimeout': {'N': str(self.attempts - len(ok))},
+            'failuresRefused': {'N': '0'},
+            'samples': {'B': encode_samples(times)},
+            'i': {'N': str(index)},
+        }
+        if ok:
+            item.update({
+                'avg': {'N': str(sum(ok) / len(ok))},
+                'min': {'N': str(min(ok))},
+                'max': {'N': str(max(ok))},
+            })
+        return item
+
+    def scan(self, TableName, Segment, TotalSegments, ExclusiveStartKey=None, **kwargs):
+        if TableName != PING_TEST_TABLE:
+            return {'Items': [], 'ConsumedCapacity': {'TableName': TableName, 'CapacityUnits': 0.5}}
+        index = int(ExclusiveStartKey['i']['N']) + TotalSegments if ExclusiveStartKey else Segment
+        items, size = [], 0
+        while index < self.total and size < 1024 * 1024:
+            item = self.item(index)
+            items.append(item)
+            size += item_size(item)
+            index += TotalSegments
+        response = {
+            'Items': items,
+            'ConsumedCapacity': {'TableName': TableName, 'CapacityUnits': max(0.5, size / 4096 / 2)},
+        }
+        if index < self.total:
+            response['LastEvaluatedKey'] = {'i': items[-1]['i']}
+        return response
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        (table_name, requests), = RequestItems.items()
+        self.written += len(requests)
+        return {'UnprocessedItems': {}, 'ConsumedCapacity': [
+            {'TableName': table_name, 'CapacityUnits': float(len(requests))}
+        ]}
+
+
+def main(args):
+    manifest_path = os.path.join(args.checkpoint_dir, 'manifest.json')
+    if args.reset and os.path.exists(args.checkpoint_dir):
+        shutil.rmtree(args.checkpoint_dir)
+    os.makedirs(args.checkpoint_dir, exist_ok=True)
+
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest['segments'] != args.segments or manifest['synthetic'] != args.synthetic:
+            sys.exit(f"{args.checkpoint_dir} belongs to a run with other settings, pass --reset to start over")
+        print(f"Resuming the recompute of {manifest['now']}")
+    else:
+        manifest = {'now': timestamp(datetime.utcnow()), 'segments': args.segments,
+                    'synthetic': args.synthetic}
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f)
+
+    now = manifest['now']
+    now_dt = datetime.strptime(now[:19], '%Y-%m-%dT%H:%M:%S')
+    today = now[:10]
+    window_starts = {
+        timeframe: timestamp(now_dt - timedelta(days=TIMEFRAME_DAYS[timeframe]))
+        for timeframe in TIMEFRAMES_TO_STORE
+    }
+    config = {
+        'now': now,
+        'edge_days': sorted(start[:10] for start in window_starts.values()),
+        'segments': args.segments,
+        'workers': args.workers,
+        'max_rcu': args.max_rcu,
+        'checkpoint_dir': args.checkpoint_dir,
+        'checkpoint_pages': args.checkpoint_pages,
+        'region': args.region,
+        'endpoint_url': args.endpoint_url,
+        'synthetic': {'regions': args.regions, 'days': args.days, 'now': now} if args.synthetic else None,
+    }
+
+    tasks = [(table_name, segment) for table_name in TABLES for segment in range(args.segments)]
+    started = time.monotonic()
+    scanned = capacity = 0
+    with multiprocessing.Pool(args.workers, initializer=init_worker, initargs=(config,)) as pool:
+        for done, result in enumerate(pool.imap_unordered(scan_segment, tasks), 1):
+            scanned += result['items']
+            capacity += result['capacity']
+            if result['items'] or result['resumed']:
+                print(f"[{done}/{len(tasks)}] {result['table']} segment {result['segment']}: "
+                      f"{result['items']} items, {result['capacity']:.0f} RCU in {result['seconds']:.1f}s"
+                      f"{' (resumed)' if result['resumed'] else ''}")
+        scan_seconds = time.monotonic() - started
+        print(f"Scanned {scanned} items ({capacity:.0f} RCU) in {scan_seconds:.1f}s: "
+              f"{scanned / max(scan_seconds, 1e-9):.0f} items/s, {capacity / max(scan_seconds, 1e-9):.0f} RCU/s")
+
+        merge_started = time.monotonic()
+        partials = load_partials(config)
+        rollups, first_day = build_rollups(partials, today)
+        summary_tasks = [
+            (region, timeframe, samples)
+            for timeframe in TIMEFRAMES_TO_STORE
+            for region, samples in pair_samples(partials, first_day, window_starts[timeframe], today,
+                                                args.attempts, args.source).items()
+        ]
+        averages = [item for items in pool.imap_unordered(summarize_region, summary_tasks) for item in items]
+    print(f"Built {len(rollups)} rollups and {len(averages)} averages of "
+          f"{len({task[0] for task in summary_tasks})} source regions in {time.monotonic() - merge_started:.1f}s")
+
+    if args.dry_run:
+        print("Dry run, nothing written")
+        return
+
+    client = SyntheticDynamoDB(**config['synthetic']) if args.synthetic else \
+        boto3.client('dynamodb', region_name=args.region, endpoint_url=args.endpoint_url)
+    write_started = time.monotonic()
+    not_written = 0
+    for table_name, items in ((ROLLUP_TABLE, rollups), (args.averages_table, averages)):
+        summary = write_items(client, table_name, items, args.max_in_flight)
+        not_written += summary['failed'] + summary['unwritten']
+        print(f"Wrote {summary['written']} items to {table_name} "
+              f"({summary['retries']} retries, {summary['failed'] + summary['unwritten']} not written)")
+    print(f"Writes took {time.monotonic() - write_started:.1f}s")
+
+    if not args.synthetic:
+        # Readers caching the averages pick up the recomputed values
+        dynamodb = boto3.resource('dynamodb', region_name=args.region, endpoint_url=args.endpoint_url)
+        bump_averages_version(dynamodb.Table(METADATA_TABLE))
+    if not_written:
+        sys.exit(f"{not_written} items not written, run again to retry from the checkpoints in {args.checkpoint_dir}")
+    shutil.rmtree(args.checkpoint_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--segments', type=int, default=16, help='TotalSegments of every table scan')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Scanning processes')
+    parser.add_argument('--max-rcu', type=float, default=1000.0,
+                        help='Read capacity units per second across all workers, 0 for no limit')
+    parser.add_argument('--max-in-flight', type=int, default=8, help='Concurrent batch writes')
+    parser.add_argument('--checkpoint-dir', default='recompute-checkpoint')
+    parser.add_argument('--checkpoint-pages', type=int, default=20, help='Pages between segment checkpoints')
+    parser.add_argument('--reset', action='store_true', help='Discard the checkpoints of a previous run')
+    parser.add_argument('--attempts', action='store_true', default=AGGREGATION_MODE == 'attempts',
+                        help='Also publish attempt-level percentiles (AGGREGATION_MODE=attempts)')
+    parser.add_argument('--source', choices=LATENCY_SOURCES, default=LATENCY_SOURCE,
+                        help='Latency values to aggregate (LATENCY_SOURCE)')
+    parser.add_argument('--averages-table', default=os.environ.get('LATENCIES_TABLE', AVERAGES_TABLE))
+    parser.add_argument('--dry-run', action='store_true', help='Scan and recompute without writing')
+    parser.add_argument('--region', default='us-east-2')
+    parser.add_argument('--endpoint-url', default=None, help='e.g. http://localhost:8000 for DynamoDB Local')
+    parser.add_argument('--synthetic', action='store_true', help='Use the in-process stand-in')
+    parser.add_argument('--regions', type=int, default=20, help='Synthetic source regions')
+    parser.add_argument('--days', type=int, default=35, help='Synthetic days of history')
+    main(parser.parse_args())
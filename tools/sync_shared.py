@@ -0,0 +1,56 @@
+"""
+Copy shared/ into the chalicelib/ of every Chalice app that uses it.
+
+Chalice packages chalicelib/ without following symlinks, so each app gets a
+real copy of shared/ as chalicelib/shared before it is deployed or run
+locally. The copies are build output (see .gitignore): edit shared/ and sync
+again.
+
+Usage:
+    python tools/sync_shared.py                    # every app
+    python tools/sync_shared.py ping_from_region   # one app
+"""
+
+import argparse
+import os
+import shutil
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SHARED = os.path.join(ROOT, 'shared')
+
+APPS = [
+    'cloudping-api',
+    'ping_from_region',
+    'scheduled_functions',
+    'ping-function-deployer',
+    'ping-function-deployer-eusc',
+    'store-region-status-eusc',
+]
+
+
+def sync(apps=APPS):
+    """
+    Replace chalicelib/shared of each app with a fresh copy of shared/.
+
+    Args:
+        apps (list): App directories, relative to the repository root
+    """
+    for app_dir in apps:
+        target = os.path.join(ROOT, app_dir, 'chalicelib', 'shared')
+        if os.path.islink(target):
+            os.unlink(target)
+        elif os.path.isdir(target):
+            shutil.rmtree(target)
+        shutil.copytree(SHARED, target, ignore=shutil.ignore_patterns('__pycache__', '*.pyc'))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('apps', nargs='*', help=f"Apps to sync (default: {', '.join(APPS)})")
+    args = parser.parse_args()
+    unknown = [app_dir for app_dir in args.apps if app_dir not in APPS]
+    if unknown:
+        parser.error(f"unknown apps: {', '.join(unknown)}")
+    apps = args.apps or APPS
+    sync(apps)
+    print(f"Synced shared/ into {', '.join(apps)}")